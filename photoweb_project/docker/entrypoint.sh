@@ -12,6 +12,10 @@ echo "PostgreSQL is ready!"
 
 echo "Running database migrations..."
 python manage.py migrate --noinput
+python manage.py createcachetable
+
+echo "Converting legacy JSON files to JSON Lines segments..."
+python manage.py convert_json_store
 
 echo "Collecting static files..."
 python manage.py collectstatic --noinput
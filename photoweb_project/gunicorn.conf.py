@@ -0,0 +1,57 @@
+"""
+Настройки gunicorn: gunicorn -c gunicorn.conf.py (docker-compose, dockerfile).
+Каждая задаётся переменной окружения GUNICORN_*; незаданные подбираются по числу CPU
+(photoweb_project/tuning.py). Рекомендации по измеренной нагрузке: python manage.py perf_profile
+"""
+import os
+import sys
+
+# gunicorn загружает этот файл до приложения и не обязательно из каталога проекта
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from photoweb_project.tuning import recommend  # noqa: E402
+
+
+def _env(name, default, cast=str):
+    value = os.environ.get(name, '')
+    return cast(value) if value != '' else default
+
+
+def _flag(value):
+    return value.lower() in ('1', 'true', 'yes')
+
+
+wsgi_app = _env('GUNICORN_APP', 'photoweb_project.wsgi:application')
+_worker_class = _env('GUNICORN_WORKER_CLASS', None)
+_asgi = 'asgi' in wsgi_app or 'uvicorn' in (_worker_class or '')
+_tuned = recommend(wait_fraction=_env('GUNICORN_WAIT_FRACTION', None, float), asgi=_asgi)
+
+bind = _env('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = _worker_class or _tuned['worker_class']
+workers = _env('GUNICORN_WORKERS', _tuned['workers'], int)
+# явно выбранный sync/uvicorn — без потоков (при threads > 1 gunicorn сам заменил бы sync на gthread)
+threads = _env('GUNICORN_THREADS', _tuned['threads'] if worker_class == _tuned['worker_class'] else 1, int)
+preload_app = _env('GUNICORN_PRELOAD', _tuned['preload_app'], _flag)
+timeout = _env('GUNICORN_TIMEOUT', _tuned['timeout'], int)
+graceful_timeout = _env('GUNICORN_GRACEFUL_TIMEOUT', _tuned['graceful_timeout'], int)
+keepalive = _env('GUNICORN_KEEPALIVE', _tuned['keepalive'], int)
+max_requests = _env('GUNICORN_MAX_REQUESTS', _tuned['max_requests'], int)
+max_requests_jitter = _env('GUNICORN_MAX_REQUESTS_JITTER', _tuned['max_requests_jitter'], int)
+# heartbeat воркеров в памяти, а не на диске контейнера (запись на overlayfs может подвесить воркер)
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+loglevel = _env('GUNICORN_LOG_LEVEL', 'info')
+accesslog = _env('GUNICORN_ACCESS_LOG', None)
+
+# Постоянные соединения с БД зависят от типа воркера (settings.py читает DB_CONN_MAX_AGE при загрузке
+# приложения — в мастере при preload или в каждом воркере; переменные окружения они наследуют)
+os.environ.setdefault('DB_CONN_MAX_AGE', str(0 if 'uvicorn' in worker_class else _tuned['conn_max_age']))
+os.environ.setdefault('DB_CONN_HEALTH_CHECKS', '1' if _tuned['conn_health_checks'] else '0')
+
+
+def post_fork(server, worker):
+    # при preload приложение загружено в мастере: соединение, открытое там, не должно достаться
+    # нескольким воркерам сразу
+    if preload_app:
+        from django.db import connections
+        connections.close_all()
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PhotometadataConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'photometadata'
+
+    def ready(self):
+        from . import signals  # noqa: F401 — регистрирует обработчики сигналов
+        from . import metrics  # noqa: F401 — учёт SQL-запросов в метриках (connection_created)
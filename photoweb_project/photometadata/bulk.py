@@ -0,0 +1,265 @@
+import csv
+import io
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .changes import log_changes
+from .facets import FACET_SOURCE_FIELDS, record_bulk_changes, record_bulk_created
+from .fingerprint import content_hash, existing_hashes
+from .ingest import JsonArrayReader, iter_validated
+from .models import ChangeLog, PhotoMetadata
+from .record_cache import forget_records
+from .search_cache import invalidate_search
+from .signals import bulk_operation
+from .snapshot import mark_changed
+from .tags import normalized_tags_enabled, sync_photo_tags
+from .validation import validate_json_data
+
+# Сколько записей вставляется одной транзакцией
+IMPORT_BATCH_SIZE = 5000
+# Сколько раз повторить пачку, если параллельная загрузка успела вставить те же записи
+IMPORT_RETRIES = 3
+
+# Сколько записей изменяется или удаляется одним запросом
+EDIT_CHUNK_SIZE = 1000
+# Максимум записей в одной массовой операции (ajax/bulk/...)
+MAX_BULK_RECORDS = 10000
+
+# Колонки, которые заполняются при импорте (порядок — для COPY)
+IMPORT_FIELDS = [
+    'title', 'photographer', 'date_taken', 'url', 'description', 'location',
+    'tags', 'width', 'height', 'camera', 'license',
+]
+# Текстовые колонки импорта: пустое поле CSV для COPY — NULL, а эти колонки NOT NULL
+IMPORT_TEXT_FIELDS = [f for f in IMPORT_FIELDS if f not in ('date_taken', 'width', 'height')] + ['content_hash']
+
+
+# --------------------
+# Массовый импорт в БД
+# --------------------
+def copy_supported():
+    """COPY FROM STDIN доступен только на PostgreSQL через psycopg2."""
+    return connection.vendor == 'postgresql' and connection.Database.__name__ == 'psycopg2'
+
+
+def _resolve_ids(objs):
+    """
+    bulk_create без RETURNING (SQLite < 3.35) не заполняет pk: id находятся по уникальному отпечатку
+    (по EDIT_CHUNK_SIZE за запрос — предел числа параметров SQLite) и присваиваются объектам.
+    """
+    missing = [obj for obj in objs if obj.pk is None]
+    for start in range(0, len(missing), EDIT_CHUNK_SIZE):
+        chunk = {obj.content_hash: obj for obj in missing[start:start + EDIT_CHUNK_SIZE]}
+        for pk, record_hash in PhotoMetadata.objects.filter(content_hash__in=list(chunk)).values_list(
+                'id', 'content_hash'):
+            chunk[record_hash].pk = pk
+
+
+def _insert_orm(records, hashes):
+    """Отсев дублей одним IN-запросом и bulk_create. Возвращает число вставленных."""
+    found = existing_hashes(PhotoMetadata.objects.all(), hashes)
+    objs = [
+        PhotoMetadata(content_hash=h, **{f: r[f] for f in IMPORT_FIELDS})
+        for r, h in zip(records, hashes) if h not in found
+    ]
+    PhotoMetadata.objects.bulk_create(objs, batch_size=1000)
+    _resolve_ids(objs)
+    # bulk_create не шлёт post_save — связи тегов и счётчики фасетов обновляем сами
+    if normalized_tags_enabled():
+        sync_photo_tags(objs)
+    record_bulk_created(objs)
+    ids = [obj.pk for obj in objs]
+    log_changes(ids, ChangeLog.OP_UPSERT)
+    transaction.on_commit(lambda: mark_changed(ids))
+    return len(objs)
+
+
+def _insert_copy(records, hashes):
+    """
+    COPY во временную таблицу и перенос новых строк одним INSERT ... SELECT.
+    Дубли отсекаются в БД уникальным индексом content_hash (ON CONFLICT DO NOTHING — и те,
+    что параллельная загрузка вставила после начала этой). Возвращает число вставленных.
+    """
+    table = connection.ops.quote_name(PhotoMetadata._meta.db_table)
+    columns = IMPORT_FIELDS + ['created_at', 'content_hash']
+    cols = ', '.join(connection.ops.quote_name(c) for c in columns)
+    text_cols = ', '.join(connection.ops.quote_name(c) for c in IMPORT_TEXT_FIELDS)
+
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    now = timezone.now().isoformat()
+    for record, record_hash in zip(records, hashes):
+        writer.writerow([record[f] for f in IMPORT_FIELDS] + [now, record_hash])
+    buf.seek(0)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TEMP TABLE photometadata_import ON COMMIT DROP AS "
+            f"SELECT {cols} FROM {table} WITH NO DATA"
+        )
+        # временная таблица создана без NOT NULL: пустые строки (tags: "") иначе дошли бы до INSERT как NULL
+        cursor.cursor.copy_expert(
+            f"COPY photometadata_import ({cols}) FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL ({text_cols}))", buf)
+        cursor.execute(
+            f"INSERT INTO {table} ({cols}) "
+            f"SELECT {cols} FROM photometadata_import s "
+            f"ON CONFLICT DO NOTHING "
+            f"RETURNING id, {', '.join(FACET_SOURCE_FIELDS)}"
+        )
+        names = ['id'] + FACET_SOURCE_FIELDS
+        inserted = [dict(zip(names, row)) for row in cursor.fetchall()]
+    if normalized_tags_enabled():
+        sync_photo_tags(inserted)
+    record_bulk_created(inserted)
+    log_changes([row['id'] for row in inserted], ChangeLog.OP_UPSERT)
+    transaction.on_commit(lambda: mark_changed([row['id'] for row in inserted]))
+    return len(inserted)
+
+
+def import_batch(batch, report, start=1, use_copy=False):
+    """
+    Валидирует пачку, отсекает дубли (внутри пачки и в БД) и вставляет её одной транзакцией.
+    Результат добавляется в report.batches.
+    """
+    valid, errors = validate_json_data(batch, start=start)
+    return _import_validated(batch, valid, errors, report, use_copy)
+
+
+def _import_validated(batch, valid, errors, report, use_copy=False):
+    report.add_errors(errors)
+
+    unique = {}
+    for record in valid:
+        unique.setdefault(content_hash(record), record)
+    hashes = list(unique)
+    records = list(unique.values())
+
+    for attempt in range(IMPORT_RETRIES):
+        try:
+            with transaction.atomic():
+                inserted = _insert_copy(records, hashes) if use_copy and records else _insert_orm(records, hashes)
+            break
+        except IntegrityError:
+            # bulk_create: между проверкой и вставкой те же записи вставила другая загрузка —
+            # пачка откатилась; при повторе они найдутся проверкой как дубли
+            if attempt == IMPORT_RETRIES - 1:
+                raise
+    if inserted:
+        transaction.on_commit(invalidate_search)
+
+    report.add_batch(
+        total=len(batch),
+        inserted=inserted,
+        duplicates=len(valid) - inserted,
+        invalid=len(batch) - len(valid),
+    )
+    return inserted
+
+
+def import_json_stream(fileobj, report, batch_size=IMPORT_BATCH_SIZE, method='auto', progress=None,
+                       executor=None):
+    """
+    Потоково импортирует JSON-массив из fileobj в БД пачками по batch_size.
+    method: 'orm' — bulk_create, 'copy' — COPY FROM STDIN (PostgreSQL), 'auto' — COPY, если доступен.
+    executor — пул процессов для проверки записей (см. ingest.iter_validated); вставка идёт в этом процессе.
+    Некорректные записи пропускаются и учитываются в отчёте. json.JSONDecodeError пробрасывается.
+    ValueError — если запрошен COPY, а БД его не поддерживает.
+    """
+    if method == 'copy' and not copy_supported():
+        raise ValueError("COPY доступен только для PostgreSQL (psycopg2).")
+    use_copy = method in ('copy', 'auto') and copy_supported()
+    reader = JsonArrayReader(fileobj)
+    for batch, valid, errors in iter_validated(reader, batch_size, report.total + 1, executor):
+        _import_validated(batch, valid, errors, report, use_copy)
+        report.bytes_read = reader.bytes_read
+        if progress:
+            progress(report)
+    return report
+
+
+# --------------------
+# Массовое изменение и удаление
+# --------------------
+def _chunks(items, size=EDIT_CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def bulk_update_records(ids, changes):
+    """
+    Присваивает полям changes (уже проверенные значения) записей ids одной транзакцией:
+    queryset.update() пачками по EDIT_CHUNK_SIZE. Запись, которая после изменения совпала бы
+    с другой (по content_hash), не меняется. Возвращает {id: 'updated' | 'duplicate' | 'not_found'}.
+    """
+    ids = list(dict.fromkeys(ids))
+    results = {}
+    with transaction.atomic():
+        rows = {}
+        for chunk in _chunks(ids):
+            query = PhotoMetadata.objects.select_for_update().filter(pk__in=chunk)
+            rows.update((row['id'], row) for row in query.values('id', 'content_hash', *IMPORT_FIELDS))
+        old_hashes = {pk: row.pop('content_hash') for pk, row in rows.items()}
+        new_rows = {pk: {**row, **changes} for pk, row in rows.items()}
+        new_hashes = {pk: content_hash(row) for pk, row in new_rows.items()}
+
+        # отпечатки, занятые записями вне операции, — одним IN-запросом на пачку
+        taken = set()
+        for chunk in _chunks(set(new_hashes.values())):
+            query = PhotoMetadata.objects.filter(content_hash__in=chunk).values_list('content_hash', 'id')
+            taken.update(record_hash for record_hash, pk in query if pk not in rows)
+        # старые отпечатки записей операции тоже заняты: запись-дубль свой сохранит, а уникальный индекс
+        # проверяется построчно — даже обмен отпечатками между изменяемыми записями упал бы на IntegrityError
+        taken.update(record_hash for record_hash in old_hashes.values() if record_hash)
+
+        updated = []
+        for pk in ids:
+            if pk not in rows:
+                results[pk] = 'not_found'
+            elif new_hashes[pk] != old_hashes[pk] and new_hashes[pk] in taken:
+                results[pk] = 'duplicate'
+            else:
+                taken.add(new_hashes[pk])
+                updated.append(pk)
+                results[pk] = 'updated'
+
+        for chunk in _chunks(updated):
+            # версия растёт, чтобы открытый у кого-то редактор получил 409 (см. PhotoMetadata.save_versioned)
+            PhotoMetadata.objects.filter(pk__in=chunk).update(**changes, version=F('version') + 1)
+            PhotoMetadata.objects.bulk_update(
+                [PhotoMetadata(pk=pk, content_hash=new_hashes[pk]) for pk in chunk], ['content_hash'])
+        # update() не шлёт сигналов — теги, фасеты и кеш записей обновляем сами
+        if normalized_tags_enabled() and 'tags' in changes:
+            sync_photo_tags([new_rows[pk] for pk in updated])
+        record_bulk_changes([rows[pk] for pk in updated], [new_rows[pk] for pk in updated])
+        log_changes(updated, ChangeLog.OP_UPSERT)
+        transaction.on_commit(lambda: forget_records(updated))
+        transaction.on_commit(invalidate_search)
+        transaction.on_commit(lambda: mark_changed(updated))
+    return results
+
+
+def bulk_delete_records(ids):
+    """
+    Удаляет записи ids одной транзакцией (queryset.delete() пачками по EDIT_CHUNK_SIZE).
+    Возвращает {id: 'deleted' | 'not_found'}.
+    """
+    ids = list(dict.fromkeys(ids))
+    deleted = []
+    old_rows = []
+    with transaction.atomic(), bulk_operation():
+        for chunk in _chunks(ids):
+            rows = list(PhotoMetadata.objects.filter(pk__in=chunk).values('id', *FACET_SOURCE_FIELDS))
+            found = [row['id'] for row in rows]
+            PhotoMetadata.objects.filter(pk__in=found).delete()
+            deleted.extend(found)
+            old_rows.extend(rows)
+        record_bulk_changes(old_records=old_rows)
+        log_changes(deleted, ChangeLog.OP_DELETE)
+        transaction.on_commit(lambda: forget_records(deleted))
+        transaction.on_commit(invalidate_search)
+        transaction.on_commit(lambda: mark_changed(deleted))
+    deleted = set(deleted)
+    return {pk: 'deleted' if pk in deleted else 'not_found' for pk in ids}
@@ -0,0 +1,241 @@
+import json
+import mmap
+import os
+import re
+import threading
+from array import array
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import count_json_io
+
+# Записей на странице просмотра файла
+FILE_PAGE_SIZE = 100
+# Файлы от этого размера читаются через mmap, меньшие — целиком (байт)
+MMAP_MIN_BYTES = 1024 * 1024
+# Сколько индексов смещений держать в памяти процесса
+INDEX_CACHE_SIZE = 32
+# Время жизни счётчиков записей в общем кеше (сек); ключ включает mtime и размер файла
+CATALOGUE_CACHE_TTL = 24 * 3600
+
+# Структурные символы JSON для сканера массива
+_STRUCT_RE = re.compile(rb'[\[\]{}"\\]')
+
+
+# --------------------
+# Индекс смещений записей в файле
+# --------------------
+class FileIndex:
+    """
+    Смещения записей файла: starts[i]:ends[i] — байты i-й записи.
+    Действителен, пока у файла те же inode, mtime и размер (сегменты JSON Lines
+    только дописываются, поэтому при росте файла индекс досчитывается с конца).
+    """
+
+    def __init__(self, path, stat):
+        self.path = path
+        self.inode = stat.st_ino
+        self.mtime_ns = stat.st_mtime_ns
+        self.size = 0
+        self.starts = array('Q')
+        self.ends = array('Q')
+
+    @property
+    def count(self):
+        return len(self.starts)
+
+    def fresh(self, stat):
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size) == (self.inode, self.mtime_ns, self.size)
+
+
+def _open_view(fh, size):
+    """Байты файла: mmap для больших файлов, иначе содержимое целиком."""
+    if size >= MMAP_MIN_BYTES:
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    fh.seek(0)
+    return fh.read(size)
+
+
+def _index_lines(index, fh, size):
+    """JSON Lines: запись — полная непустая строка; оборванный хвост не индексируется."""
+    view = _open_view(fh, size)
+    try:
+        pos = index.size
+        while pos < size:
+            newline = view.find(b'\n', pos)
+            if newline == -1:
+                break
+            if view[pos:newline].strip():
+                index.starts.append(pos)
+                index.ends.append(newline)
+            pos = newline + 1
+        index.size = pos
+    finally:
+        if isinstance(view, mmap.mmap):
+            view.close()
+
+
+def _index_array(index, fh, size):
+    """
+    JSON-массив: границы объектов верхнего уровня находятся по структурным символам
+    (скобки и кавычки) без разбора содержимого. Одиночный объект — одна запись.
+    """
+    view = _open_view(fh, size)
+    try:
+        depth = 0
+        in_string = False
+        skip_to = -1
+        start = None
+        record_depth = 1
+        for match in _STRUCT_RE.finditer(view):
+            pos = match.start()
+            if pos < skip_to:
+                continue
+            ch = match.group()
+            if in_string:
+                if ch == b'\\':
+                    skip_to = pos + 2   # экранированный символ
+                elif ch == b'"':
+                    in_string = False
+                continue
+            if ch == b'"':
+                in_string = True
+            elif ch in b'[{':
+                if depth == 0 and ch == b'{':
+                    record_depth = 0
+                if depth == record_depth:
+                    start = pos
+                depth += 1
+            elif ch in b']}':
+                depth -= 1
+                if depth == record_depth and start is not None:
+                    index.starts.append(start)
+                    index.ends.append(pos + 1)
+                    start = None
+        index.size = size
+    finally:
+        if isinstance(view, mmap.mmap):
+            view.close()
+
+
+def _is_lines(path):
+    return path.endswith('.jsonl')
+
+
+def _build_index(path, fh, stat, previous=None):
+    # сегмент JSON Lines дописан — досчитываем только новые строки
+    grown = (
+        previous is not None and _is_lines(path) and previous.inode == stat.st_ino
+        and previous.size <= stat.st_size
+    )
+    index = FileIndex(path, stat)
+    if grown:
+        # опубликованный индекс не меняется: его читают без блокировок, поэтому досчитываем копию
+        index.size = previous.size
+        index.starts = array('Q', previous.starts)
+        index.ends = array('Q', previous.ends)
+    count_json_io('read', stat.st_size - index.size)
+    if _is_lines(path):
+        _index_lines(index, fh, stat.st_size)
+    else:
+        _index_array(index, fh, stat.st_size)
+    return index
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+# Блокировки построения по пути: файл индексирует один поток, остальные ждут и берут его результат
+_build_locks = {}
+
+
+def _cached_index(path, stat):
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is not None and index.fresh(stat):
+            _indexes.move_to_end(path)
+        return index
+
+
+def _index_of(path, fh):
+    """Индекс открытого файла fh (stat берётся у дескриптора — файл могли подменить по пути)."""
+    stat = os.fstat(fh.fileno())
+    index = _cached_index(path, stat)
+    if index is not None and index.fresh(stat):
+        return index
+    with _indexes_lock:
+        build_lock = _build_locks.setdefault(path, threading.Lock())
+    with build_lock:
+        # пока ждали, индекс мог построить другой поток
+        index = _cached_index(path, stat)
+        if index is not None and index.fresh(stat):
+            return index
+        index = _build_index(path, fh, stat, index)
+        with _indexes_lock:
+            _indexes[path] = index
+            _indexes.move_to_end(path)
+            while len(_indexes) > INDEX_CACHE_SIZE:
+                evicted, _ = _indexes.popitem(last=False)
+                _build_locks.pop(evicted, None)
+    _cache().set(_count_key(path, stat), index.count, CATALOGUE_CACHE_TTL)
+    return index
+
+
+def file_index(path):
+    """Индекс файла из памяти процесса; перестраивается (или досчитывается), если файл изменился."""
+    with open(path, 'rb') as fh:
+        return _index_of(path, fh)
+
+
+# --------------------
+# Каталог файлов хранилища
+# --------------------
+def _cache():
+    return caches[getattr(settings, 'PHOTO_RECORD_CACHE', 'default')]
+
+
+def _count_key(path, stat):
+    return f'photometadata:catalogue:{path}:{stat.st_mtime_ns}:{stat.st_size}'
+
+
+def file_catalogue(store):
+    """
+    Файлы хранилища с размером, временем изменения и числом записей.
+    Число записей берётся из общего кеша по (путь, mtime, размер); файл читается только при промахе.
+    """
+    entries = []
+    for name in store.list_files():
+        path = os.path.join(store.root, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        count = _cache().get(_count_key(path, stat))
+        if count is None:
+            count = file_index(path).count
+        entries.append({'name': name, 'size': stat.st_size, 'mtime': stat.st_mtime, 'count': count})
+    return entries
+
+
+def read_page(store, name, page=1, page_size=FILE_PAGE_SIZE):
+    """
+    Записи страницы page (с 1) файла name без разбора остального файла.
+    Возвращает (записи, всего записей). FileNotFoundError — если файла нет.
+    """
+    path = store.path(name)
+    records = []
+    with open(path, 'rb') as fh:
+        index = _index_of(path, fh)
+        first = (page - 1) * page_size
+        last = min(first + page_size, index.count)
+        if first < last:
+            view = _open_view(fh, index.size)
+            try:
+                for i in range(first, last):
+                    records.append(json.loads(view[index.starts[i]:index.ends[i]]))
+                count_json_io('read', index.ends[last - 1] - index.starts[first])
+            finally:
+                if isinstance(view, mmap.mmap):
+                    view.close()
+    return records, index.count
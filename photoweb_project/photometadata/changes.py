@@ -0,0 +1,159 @@
+import base64
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Max, Min
+from django.utils import timezone
+
+from .models import ChangeLog, PhotoMetadata
+from .serializers import LIST_FIELDS
+
+# Размер пачки изменений по умолчанию и максимальный (для ?limit=)
+CHANGES_PAGE_SIZE = 500
+MAX_CHANGES_PAGE_SIZE = 5000
+# Ключ advisory-блокировки PostgreSQL, под которой присваиваются номера seq
+SEQUENCE_LOCK_KEY = 0x70686f746f  # 'photo'
+
+
+def _retention():
+    return timedelta(days=getattr(settings, 'PHOTO_CHANGES_RETENTION_DAYS', 30))
+
+
+class CursorExpired(Exception):
+    """Курсор старше срока хранения удалений: часть tombstone уже стёрта, нужна полная синхронизация."""
+
+
+# --------------------
+# Курсор: номер последней полученной записи журнала и момент, по который потребитель синхронизирован
+# --------------------
+def encode_cursor(seq, as_of):
+    raw = f"{seq}|{as_of.isoformat()}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Разбирает курсор; ValueError — если он повреждён (в том числе момент без часового пояса)."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        seq, as_of = raw.split('|')
+        seq, as_of = int(seq), datetime.fromisoformat(as_of)
+    except Exception as e:
+        raise ValueError(f"Некорректный курсор: {token}") from e
+    # encode_cursor пишет aware-время; наивное не сравнить с ним — такой курсор подделан
+    if as_of.utcoffset() is None:
+        raise ValueError(f"Некорректный курсор: {token}")
+    return seq, as_of
+
+
+# --------------------
+# Запись журнала и порядок коммитов
+# --------------------
+def log_changes(ids, op):
+    """
+    Добавляет в журнал по записи op на каждый id (в текущей транзакции — вместе с самим изменением).
+    Номер seq записи получают после коммита (assign_sequence).
+    """
+    ChangeLog.objects.bulk_create([ChangeLog(photo_id=pk, op=op) for pk in ids], batch_size=1000)
+    if ids:
+        transaction.on_commit(assign_sequence)
+
+
+def assign_sequence():
+    """
+    Нумерует закоммиченные записи журнала без seq — по одной транзакции за раз, поэтому номера
+    растут в порядке коммитов: запись долгой транзакции с маленьким id получит номер больше всех
+    уже выданных и не будет пропущена потребителем. Возвращает число пронумерованных записей.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [SEQUENCE_LOCK_KEY])
+        # на SQLite транзакция (BEGIN IMMEDIATE) и так сериализована с другими записями
+        pending = ChangeLog.objects.filter(seq__isnull=True).aggregate(first=Min('id'), last=Max('id'))
+        if pending['first'] is None:
+            return 0
+        top = ChangeLog.objects.aggregate(top=Max('seq'))['top'] or 0
+        # seq = id + сдвиг: порядок внутри пачки — по id, все номера больше уже выданных;
+        # записи с меньшим id, закоммиченные после чтения границ, пронумерует следующий вызов
+        offset = max(0, top + 1 - pending['first'])
+        return ChangeLog.objects.filter(
+            seq__isnull=True, id__gte=pending['first'], id__lte=pending['last'],
+        ).update(seq=F('id') + offset)
+
+
+class ChangesPage:
+    """Пачка изменений: changes, курсор следующего запроса и есть ли ещё изменения."""
+
+    def __init__(self, changes, next_cursor, has_more):
+        self.changes = changes
+        self.next_cursor = next_cursor
+        self.has_more = has_more
+
+
+def read_changes(cursor=None, limit=CHANGES_PAGE_SIZE):
+    """
+    Изменения после cursor (без него — с начала журнала) в порядке коммитов (seq), не больше limit записей журнала.
+    Из нескольких изменений одного фото в пачке остаётся последнее: upsert с текущей записью (LIST_FIELDS)
+    или delete. Стоимость зависит от числа изменений, а не от размера таблицы.
+    ValueError — повреждённый курсор или limit; CursorExpired — курсор старше срока хранения удалений.
+    """
+    limit = max(1, min(int(limit), MAX_CHANGES_PAGE_SIZE))
+    now = timezone.now()
+    seq = 0
+    if cursor:
+        seq, as_of = decode_cursor(cursor)
+        if as_of < now - _retention():
+            raise CursorExpired(cursor)
+
+    # номера, не присвоенные после коммита (процесс завершился до on_commit), присваиваются здесь
+    if ChangeLog.objects.filter(seq__isnull=True).exists():
+        assign_sequence()
+    entries = list(
+        ChangeLog.objects.filter(seq__gt=seq).order_by('seq')
+        .values('seq', 'photo_id', 'op', 'created_at')[:limit + 1]
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    latest = {}
+    for entry in entries:
+        latest[entry['photo_id']] = entry
+    upserts = [pk for pk, entry in latest.items() if entry['op'] == ChangeLog.OP_UPSERT]
+    records = {row['id']: row for row in PhotoMetadata.objects.filter(id__in=upserts).values(*LIST_FIELDS)}
+
+    changes = []
+    for entry in sorted(latest.values(), key=lambda e: e['seq']):
+        pk = entry['photo_id']
+        if entry['op'] == ChangeLog.OP_DELETE:
+            changes.append({'seq': entry['seq'], 'op': ChangeLog.OP_DELETE, 'id': pk})
+        elif pk in records:
+            changes.append({'seq': entry['seq'], 'op': ChangeLog.OP_UPSERT, 'id': pk, 'record': records[pk]})
+        # upsert без записи: фото уже удалили, его tombstone придёт дальше по журналу
+
+    if entries:
+        seq = entries[-1]['seq']
+    # дочитал до конца — синхронизирован по now; иначе — по моменту последнего полученного изменения
+    as_of = entries[-1]['created_at'] if has_more else now
+    return ChangesPage(changes, encode_cursor(seq, as_of), has_more)
+
+
+def compact_changes(retention=None):
+    """
+    Сжатие журнала: удаляет записи, перекрытые более новыми по тому же фото (потребитель всё равно
+    получит последнее состояние), и tombstone старше срока хранения. Последний upsert каждого
+    живого фото остаётся — синхронизация с начала журнала по-прежнему получает всю таблицу.
+    Возвращает (перекрытых, устаревших удалений).
+    """
+    retention = _retention() if retention is None else retention
+    # записи без seq (ещё не пронумерованы) не трогаем: порядок относительно них неизвестен
+    numbered = ChangeLog.objects.filter(seq__isnull=False)
+    latest = numbered.values('photo_id').annotate(last=Max('seq')).values('last')
+    superseded = numbered.exclude(seq__in=latest).delete()[0]
+    # запись с наибольшим seq остаётся всегда: assign_sequence продолжает нумерацию от неё,
+    # и номер не может достаться повторно записи, которую потребитель с этим курсором пропустит
+    top = numbered.aggregate(top=Max('seq'))['top']
+    expired = numbered.filter(
+        op=ChangeLog.OP_DELETE, created_at__lt=timezone.now() - retention
+    ).exclude(seq=top).delete()[0]
+    return superseded, expired
@@ -0,0 +1,152 @@
+import csv
+import io
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .serializers import LIST_FIELDS
+
+# Сколько строк забирается из серверного курсора за раз
+EXPORT_CHUNK_SIZE = 2000
+# Размер текстового куска, отдаваемого клиенту (символов); первый кусок уходит сразу
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+# Формат → (Content-Type, расширение файла); ndjson — синоним jsonl
+EXPORT_FORMATS = {
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'ndjson': ('application/x-ndjson', 'jsonl'),
+    'csv': ('text/csv', 'csv'),
+    'json': ('application/json', 'json'),
+}
+
+
+# --------------------
+# Построчная сериализация
+# --------------------
+def _dumps(row):
+    return json.dumps(row, ensure_ascii=False, cls=DjangoJSONEncoder)
+
+
+class _JsonLines:
+    head = tail = ''
+
+    def row(self, row, n):
+        return _dumps(row) + '\n'
+
+
+class _JsonArray:
+    head = '['
+    tail = '\n]\n'
+
+    def row(self, row, n):
+        return (',\n' if n else '\n') + _dumps(row)
+
+
+class _Csv:
+    def __init__(self):
+        self._buf = io.StringIO()
+        self._writer = csv.writer(self._buf)
+        self.head = self._line(LIST_FIELDS)
+        self.tail = ''
+
+    def _line(self, values):
+        self._writer.writerow(values)
+        line = self._buf.getvalue()
+        self._buf.seek(0)
+        self._buf.truncate()
+        return line
+
+    def row(self, row, n):
+        return self._line([
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in (row[f] for f in LIST_FIELDS)
+        ])
+
+
+_WRITERS = {'jsonl': _JsonLines, 'ndjson': _JsonLines, 'csv': _Csv, 'json': _JsonArray}
+
+
+class _Encoder:
+    """
+    Склеивает мелкие строки в куски ~EXPORT_BUFFER_SIZE символов (первый кусок отдаётся сразу)
+    и при compress сжимает их в gzip «на лету», сбрасывая каждый кусок клиенту.
+    """
+
+    def __init__(self, compress):
+        self._parts = []
+        self._length = 0
+        self._first = True
+        self._gzip = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+
+    def _encode(self, text):
+        data = text.encode('utf-8')
+        if self._gzip is not None:
+            data = self._gzip.compress(data) + self._gzip.flush(zlib.Z_SYNC_FLUSH)
+        return data
+
+    def add(self, piece):
+        """Добавляет строку; возвращает байты для отправки или b''."""
+        if not piece:
+            return b''
+        self._parts.append(piece)
+        self._length += len(piece)
+        if not (self._first or self._length >= EXPORT_BUFFER_SIZE):
+            return b''
+        text = ''.join(self._parts)
+        self._parts, self._length, self._first = [], 0, False
+        return self._encode(text)
+
+    def finish(self):
+        data = self._encode(''.join(self._parts)) if self._parts else b''
+        if self._gzip is not None:
+            data += self._gzip.flush()
+        return data
+
+
+def _rows(queryset):
+    # порядок по первичному ключу — стабилен и идёт по индексу; iterator() на PostgreSQL
+    # читает через серверный курсор, поэтому в памяти не больше chunk_size строк
+    return queryset.order_by('id').values(*LIST_FIELDS)
+
+
+# --------------------
+# Экспорт
+# --------------------
+def iter_export(queryset, fmt='jsonl', compress=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Генератор байтов выгрузки queryset в формате fmt (см. EXPORT_FORMATS), при compress — gzip.
+    Память не растёт с размером таблицы: строки читаются кусками по chunk_size.
+    """
+    writer, encoder = _WRITERS[fmt](), _Encoder(compress)
+    head = encoder.add(writer.head)
+    if head:
+        yield head
+    for n, row in enumerate(_rows(queryset).iterator(chunk_size=chunk_size)):
+        data = encoder.add(writer.row(row, n))
+        if data:
+            yield data
+    yield encoder.add(writer.tail) + encoder.finish()
+
+
+async def aiter_export(queryset, fmt='jsonl', compress=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    То же, что iter_export, для ASGI: синхронный итератор ASGI-обработчик Django
+    дочитал бы в память целиком, асинхронный отдаётся клиенту по мере чтения.
+    """
+    writer, encoder = _WRITERS[fmt](), _Encoder(compress)
+    head = encoder.add(writer.head)
+    if head:
+        yield head
+    n = 0
+    async for row in _rows(queryset).aiterator(chunk_size=chunk_size):
+        data = encoder.add(writer.row(row, n))
+        n += 1
+        if data:
+            yield data
+    yield encoder.add(writer.tail) + encoder.finish()
+
+
+def export_filename(fmt, compress=False):
+    name = f'photos.{EXPORT_FORMATS[fmt][1]}'
+    return name + '.gz' if compress else name
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import time
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models.functions import ExtractYear
+
+from .models import FacetCount, PhotoMetadata, PhotoTag
+from .search import filter_queryset
+from .tags import normalized_tags_enabled, parse_tags
+
+FACETS = ['photographer', 'camera', 'license', 'year', 'tag']
+# Поля записи, из которых считаются фасеты
+FACET_SOURCE_FIELDS = ['photographer', 'camera', 'license', 'date_taken', 'tags']
+# Сколько значений каждого фасета возвращать
+FACET_LIMIT = 20
+MAX_FACET_LIMIT = 200
+# Время жизни кеша фасетов (сек); сбрасывается сигналами раньше
+FACET_CACHE_TTL = 300
+FACET_CACHE_VERSION_KEY = 'photometadata:facets:version'
+TOTAL = '_total'
+# Строк счётчиков в одном INSERT ... ON CONFLICT (3 параметра на строку — в пределах лимита SQLite)
+UPSERT_BATCH_SIZE = 300
+
+
+# --------------------
+# Значения фасетов одной записи
+# --------------------
+def facet_values(record):
+    """Пары (фасет, значение) записи (dict или экземпляр модели), включая общий счётчик."""
+    get = record.get if isinstance(record, dict) else lambda f: getattr(record, f)
+    pairs = [(TOTAL, '')]
+    for field in ('photographer', 'camera', 'license'):
+        pairs.append((field, str(get(field))))
+    pairs.append(('year', str(get('date_taken'))[:4]))
+    pairs.extend(('tag', name) for name in parse_tags(get('tags')))
+    return pairs
+
+
+# --------------------
+# Счётчики по всей таблице (FacetCount)
+# --------------------
+def apply_deltas(deltas):
+    """
+    Прибавляет deltas {(фасет, значение): изменение} к FacetCount одним INSERT ... ON CONFLICT DO UPDATE
+    на UPSERT_BATCH_SIZE значений (PostgreSQL и SQLite >= 3.24): пачка импорта — несколько запросов, а не
+    по запросу на каждого фотографа и тег. Строки идут в порядке ключа — параллельные пачки не взаимоблокируются.
+    """
+    rows = sorted((facet, value, delta) for (facet, value), delta in deltas.items() if delta)
+    if not rows:
+        return
+    table = connection.ops.quote_name(FacetCount._meta.db_table)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            cursor.execute(
+                f"INSERT INTO {table} (facet, value, count) VALUES {', '.join(['(%s, %s, %s)'] * len(batch))} "
+                f"ON CONFLICT (facet, value) DO UPDATE SET count = {table}.count + EXCLUDED.count",
+                [param for row in batch for param in row],
+            )
+
+
+def record_changes(old=None, new=None):
+    """
+    Учитывает замену записи old на new (любая из них может быть None). Кеш фасетов сбрасывается после коммита:
+    иначе параллельный запрос успеет закешировать ещё не закоммиченные (или откаченные) счётчики.
+    """
+    deltas = Counter()
+    if old is not None:
+        deltas.subtract(facet_values(old))
+    if new is not None:
+        deltas.update(facet_values(new))
+    apply_deltas(deltas)
+    transaction.on_commit(invalidate_facets)
+
+
+def record_bulk_created(records):
+    """Учитывает пачку новых записей (массовый импорт не шлёт post_save)."""
+    deltas = Counter()
+    for record in records:
+        deltas.update(facet_values(record))
+    apply_deltas(deltas)
+    transaction.on_commit(invalidate_facets)
+
+
+def record_bulk_changes(old_records=(), new_records=()):
+    """Учитывает массовое изменение или удаление: старые версии вычитаются, новые прибавляются."""
+    deltas = Counter()
+    for record in old_records:
+        deltas.subtract(facet_values(record))
+    for record in new_records:
+        deltas.update(facet_values(record))
+    apply_deltas(deltas)
+    transaction.on_commit(invalidate_facets)
+
+
+def rebuild_facet_counts():
+    """Полный пересчёт FacetCount группирующими запросами (после ручных правок БД)."""
+    rows = []
+    qs = PhotoMetadata.objects.order_by()
+    rows.append(FacetCount(facet=TOTAL, value='', count=qs.count()))
+    for field in ('photographer', 'camera', 'license'):
+        for item in qs.values(field).annotate(n=models.Count('id')):
+            rows.append(FacetCount(facet=field, value=item[field], count=item['n']))
+    for item in qs.annotate(year=ExtractYear('date_taken')).values('year').annotate(n=models.Count('id')):
+        rows.append(FacetCount(facet='year', value=str(item['year']), count=item['n']))
+    for name, n in _tag_counts(qs).items():
+        rows.append(FacetCount(facet='tag', value=name, count=n))
+    with transaction.atomic():
+        FacetCount.objects.all().delete()
+        FacetCount.objects.bulk_create(rows, batch_size=1000)
+        transaction.on_commit(invalidate_facets)
+
+
+# --------------------
+# Подсчёт фасетов для выборки
+# --------------------
+def _tag_counts(queryset, limit=None):
+    """Счётчики тегов выборки: по PhotoTag при нормализованных тегах, иначе по CSV-полю."""
+    if normalized_tags_enabled():
+        rows = (
+            PhotoTag.objects.filter(photo__in=queryset.values('id'))
+            .values('tag__name').annotate(n=models.Count('photo_id')).order_by('-n', 'tag__name')
+        )
+        if limit:
+            rows = rows[:limit]
+        return {r['tag__name']: r['n'] for r in rows}
+    counts = Counter()
+    for csv in queryset.values_list('tags', flat=True).iterator(chunk_size=2000):
+        counts.update(parse_tags(csv))
+    ranked = sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))
+    return dict(ranked[:limit] if limit else ranked)
+
+
+def compute_facets(queryset, limit=FACET_LIMIT):
+    """Фасеты произвольной выборки: по одному группирующему запросу на фасет."""
+    qs = queryset.order_by()
+    facets = {}
+    for field in ('photographer', 'camera', 'license'):
+        rows = qs.values(field).annotate(n=models.Count('id')).order_by('-n', field)[:limit]
+        facets[field] = [{'value': r[field], 'count': r['n']} for r in rows]
+    rows = (
+        qs.annotate(year=ExtractYear('date_taken')).values('year')
+        .annotate(n=models.Count('id')).order_by('-n', 'year')[:limit]
+    )
+    facets['year'] = [{'value': str(r['year']), 'count': r['n']} for r in rows]
+    facets['tag'] = [{'value': k, 'count': v} for k, v in _tag_counts(qs, limit).items()]
+    return {'total': qs.count(), 'facets': facets}
+
+
+def stored_facets(limit=FACET_LIMIT):
+    """Фасеты всей таблицы из поддерживаемых счётчиков (без обращения к PhotoMetadata)."""
+    facets = {}
+    for facet in FACETS:
+        rows = FacetCount.objects.filter(facet=facet, count__gt=0).order_by('-count', 'value')[:limit]
+        facets[facet] = [{'value': r.value, 'count': r.count} for r in rows]
+    total = FacetCount.objects.filter(facet=TOTAL).values_list('count', flat=True).first() or 0
+    return {'total': total, 'facets': facets}
+
+
+# --------------------
+# Кеш
+# --------------------
+def _cache_version():
+    # начальная версия — текущее время: после вытеснения ключа старые записи не всплывут
+    return cache.get_or_set(FACET_CACHE_VERSION_KEY, time.time_ns(), None)
+
+
+def invalidate_facets():
+    """Сбрасывает кеш фасетов сразу; при изменении данных — через transaction.on_commit(invalidate_facets)."""
+    try:
+        cache.incr(FACET_CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(FACET_CACHE_VERSION_KEY, time.time_ns(), None)
+
+
+def get_facets(params, limit=FACET_LIMIT):
+    """
+    Фасеты для фильтра params (q / tags / mode, см. search.filter_queryset).
+    Без фильтра — из FacetCount, иначе группирующими запросами. Результат кешируется.
+    """
+    key_params = {k: (params.get(k) or '').strip() for k in ('q', 'tags', 'mode')}
+    digest = hashlib.sha256(json.dumps([key_params, limit], sort_keys=True).encode()).hexdigest()
+    key = f'photometadata:facets:{_cache_version()}:{digest}'
+    data = cache.get(key)
+    if data is None:
+        if key_params['q'] or key_params['tags']:
+            data = compute_facets(filter_queryset(params), limit)
+        else:
+            data = stored_facets(limit)
+        cache.set(key, data, FACET_CACHE_TTL)
+    return data
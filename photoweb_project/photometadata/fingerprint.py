@@ -0,0 +1,64 @@
+import hashlib
+import json
+
+# Поля, по которым определяется дубликат (порядок важен для стабильности хеша)
+FINGERPRINT_FIELDS = [
+    'title', 'photographer', 'date_taken', 'description', 'location',
+    'camera', 'license', 'width', 'height', 'url', 'tags',
+]
+
+# Поля, которые сравниваются без учёта регистра и пробелов по краям
+_TEXT_FIELDS = {
+    'title', 'photographer', 'description', 'location',
+    'camera', 'license', 'url', 'tags',
+}
+
+# Размер пачки для запросов вида content_hash IN (...)
+HASH_LOOKUP_CHUNK = 1000
+
+
+def normalize_record(record):
+    """
+    Приводит запись (dict или экземпляр модели) к унифицированному виду:
+    строки -> strip().lower(), дата и размеры -> str.
+    Правила совпадают с исходной проверкой is_duplicate.
+    """
+    is_model = not isinstance(record, dict)
+    norm = {}
+    for field in FINGERPRINT_FIELDS:
+        if is_model:
+            value = getattr(record, field, None)
+            if field in _TEXT_FIELDS:
+                value = value or ''
+        else:
+            value = record.get(field, '' if field in _TEXT_FIELDS else None)
+        if field in _TEXT_FIELDS:
+            norm[field] = str(value).strip().lower()
+        else:
+            norm[field] = str(value)
+    return norm
+
+
+def content_hash(record):
+    """
+    Стабильный отпечаток содержимого записи (sha256, hex).
+    Две записи с одинаковым хешем считаются дубликатами.
+    """
+    norm = normalize_record(record)
+    payload = json.dumps([norm[f] for f in FINGERPRINT_FIELDS], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def existing_hashes(queryset, hashes, chunk_size=HASH_LOOKUP_CHUNK):
+    """
+    Возвращает множество хешей из hashes, которые уже есть в queryset.
+    Один запрос IN на каждую пачку из chunk_size хешей.
+    """
+    hashes = list(dict.fromkeys(hashes))
+    found = set()
+    for start in range(0, len(hashes), chunk_size):
+        chunk = hashes[start:start + chunk_size]
+        found.update(
+            queryset.filter(content_hash__in=chunk).values_list('content_hash', flat=True)
+        )
+    return found
@@ -1,6 +1,10 @@
 from django import forms
+from .images import read_image_info
 from .models import PhotoMetadata
 
+# Поля, которые можно не заполнять, если приложен файл изображения (берутся из него)
+IMAGE_FIELDS = ['date_taken', 'url', 'width', 'height', 'camera', 'photographer']
+
 class PhotoMetaForm(forms.Form):
     """
     Форма для ввода метаданных о фото.
@@ -21,6 +25,33 @@ class PhotoMetaForm(forms.Form):
     height = forms.IntegerField(required=True, min_value=0)
     camera = forms.CharField(max_length=200, required=True)
     license = forms.CharField(max_length=200, required=True)
+    image = forms.ImageField(
+        required=False, label="Файл изображения",
+        help_text="Размеры, камера, дата и автор берутся из EXIF, если поля не заполнены",
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in IMAGE_FIELDS:
+            self.fields[name].required = False
+
+    def clean(self):
+        """Пустые поля IMAGE_FIELDS заполняются из изображения; url — после сохранения файла (во view)."""
+        data = super().clean()
+        image = data.get('image')
+        if image:
+            try:
+                info = read_image_info(image)
+            except ValueError as e:
+                self.add_error('image', str(e))
+                return data
+            for name, value in info.items():
+                if data.get(name) in (None, ''):
+                    data[name] = self.fields[name].clean(value)
+        for name in IMAGE_FIELDS:
+            if data.get(name) in (None, '') and not (name == 'url' and image) and name not in self.errors:
+                self.add_error(name, self.fields[name].error_messages['required'])
+        return data
 
 class UploadFileForm(forms.Form):
     """
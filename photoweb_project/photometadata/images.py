@@ -0,0 +1,280 @@
+import hashlib
+import itertools
+import math
+import os
+import re
+import tempfile
+import time
+from datetime import date
+
+from django.conf import settings
+from django.utils import timezone
+from PIL import Image, ImageOps
+from PIL.ExifTags import Base, IFD
+
+# Оригиналы изображений: media/images/<sha[:2]>/<sha> (адресация по содержимому)
+IMAGES_DIR = os.path.join(settings.MEDIA_ROOT, 'images')
+# Кеш миниатюр: media/thumbs/<sha[:2]>/<sha>-<size>.webp
+THUMBS_DIR = os.path.join(settings.MEDIA_ROOT, 'thumbs')
+# Допустимые размеры миниатюр (сторона квадрата, в который вписывается изображение)
+THUMB_SIZES = tuple(getattr(settings, 'PHOTO_THUMB_SIZES', (120, 320)))
+# Предел объёма кеша миниатюр (байт); лишнее удаляется начиная с давно не запрошенных
+THUMB_CACHE_MAX_BYTES = getattr(settings, 'PHOTO_THUMB_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+# Предел размера одного оригинала (байт)
+IMAGE_MAX_BYTES = getattr(settings, 'PHOTO_IMAGE_MAX_BYTES', 50 * 1024 * 1024)
+# Очистка кеша запускается после каждой PRUNE_EVERY созданной миниатюры
+PRUNE_EVERY = 200
+# mtime миниатюры обновляется при обращении не чаще раза в TOUCH_INTERVAL (сек) — для LRU
+TOUCH_INTERVAL = 3600
+THUMB_QUALITY = 80
+# Расширения файлов, которые ingest_images берёт из каталогов
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.tif', '.tiff', '.gif', '.bmp'}
+
+# Поля PhotoMetadata, которые заполняет assign_image (перцептивные хеши — 64 бита, 16 hex-символов)
+HASH_FIELDS = ['image_sha256', 'ahash', 'dhash', 'phash', 'hashed_at']
+
+_SHA = re.compile(r'^[0-9a-f]{64}$')
+_COPY_CHUNK = 64 * 1024
+_generated = itertools.count(1)
+
+
+def is_image_hash(value):
+    return bool(_SHA.match(value or ''))
+
+
+def image_path(sha):
+    return os.path.join(IMAGES_DIR, sha[:2], sha)
+
+
+def thumb_path(sha, size):
+    return os.path.join(THUMBS_DIR, sha[:2], f'{sha}-{size}.webp')
+
+
+# --------------------
+# Метаданные без декодирования пикселей
+# --------------------
+def _exif_text(value):
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'ignore')
+    return str(value).strip('\x00 ').strip() if value is not None else ''
+
+
+def _exif_date(value):
+    """'YYYY:MM:DD HH:MM:SS' -> 'YYYY-MM-DD'; '' — если дата некорректна."""
+    text = _exif_text(value)[:10].replace(':', '-')
+    try:
+        return date.fromisoformat(text).isoformat()
+    except ValueError:
+        return ''
+
+
+def read_image_info(source):
+    """
+    Размеры и EXIF изображения (путь или файловый объект). Pillow читает только заголовок
+    и блок EXIF — пиксели не декодируются, поэтому стоимость не зависит от разрешения.
+    Возвращает dict полей записи: width, height и, если есть в EXIF, camera, date_taken, photographer.
+    Ширина и высота — с учётом EXIF Orientation (как изображение показывается).
+    ValueError — если это не изображение.
+    """
+    position = source.tell() if hasattr(source, 'tell') else None
+    try:
+        with Image.open(source) as im:
+            width, height = im.size
+            exif = im.getexif()
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Файл не является изображением: {e}")
+    finally:
+        if position is not None:
+            source.seek(position)
+
+    # Orientation 5–8: изображение повёрнуто на 90°
+    if exif.get(Base.Orientation) in (5, 6, 7, 8):
+        width, height = height, width
+    info = {'width': width, 'height': height}
+
+    make = _exif_text(exif.get(Base.Make))
+    model = _exif_text(exif.get(Base.Model))
+    camera = model if make and model.lower().startswith(make.lower()) else f'{make} {model}'.strip()
+    if camera:
+        info['camera'] = camera
+    taken = _exif_date(exif.get_ifd(IFD.Exif).get(Base.DateTimeOriginal)) or _exif_date(exif.get(Base.DateTime))
+    if taken:
+        info['date_taken'] = taken
+    artist = _exif_text(exif.get(Base.Artist))
+    if artist:
+        info['photographer'] = artist
+    return info
+
+
+# --------------------
+# Хранилище оригиналов
+# --------------------
+def store_image(fileobj, max_bytes=IMAGE_MAX_BYTES):
+    """
+    Сохраняет изображение из файлового объекта (или загруженного файла) в IMAGES_DIR под sha256 содержимого.
+    Файл копируется кусками; одинаковые изображения хранятся один раз. Возвращает sha.
+    ValueError — если файл больше max_bytes или не является изображением.
+    """
+    os.makedirs(IMAGES_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    chunks = fileobj.chunks() if hasattr(fileobj, 'chunks') else iter(lambda: fileobj.read(_COPY_CHUNK), b'')
+    fd, tmp = tempfile.mkstemp(dir=IMAGES_DIR, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f"Изображение больше {max_bytes} байт.")
+                digest.update(chunk)
+                out.write(chunk)
+        read_image_info(tmp)
+        sha = digest.hexdigest()
+        os.makedirs(os.path.dirname(image_path(sha)), exist_ok=True)
+        os.replace(tmp, image_path(sha))
+        return sha
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def image_mimetype(sha):
+    with Image.open(image_path(sha)) as im:
+        return im.get_format_mimetype() or 'application/octet-stream'
+
+
+# --------------------
+# Перцептивные хеши (похожие изображения — близкие хеши по расстоянию Хэмминга)
+# --------------------
+# Косинусы для DCT-II 32 точек: нужны только 8 младших частот
+_DCT = [[math.cos(math.pi * u * (2 * x + 1) / 64) for x in range(32)] for u in range(8)]
+
+
+def _bits(flags):
+    value = 0
+    for flag in flags:
+        value = (value << 1) | bool(flag)
+    return f'{value:016x}'
+
+
+def _median(values):
+    ordered = sorted(values)
+    mid = len(ordered) // 2
+    return (ordered[mid - 1] + ordered[mid]) / 2 if len(ordered) % 2 == 0 else ordered[mid]
+
+
+def _ahash(gray):
+    pixels = gray.resize((8, 8), Image.Resampling.LANCZOS).tobytes()
+    mean = sum(pixels) / 64
+    return _bits(p > mean for p in pixels)
+
+
+def _dhash(gray):
+    pixels = gray.resize((9, 8), Image.Resampling.LANCZOS).tobytes()
+    return _bits(pixels[row * 9 + col + 1] > pixels[row * 9 + col] for row in range(8) for col in range(8))
+
+
+def _phash(gray):
+    pixels = gray.resize((32, 32), Image.Resampling.LANCZOS).tobytes()
+    rows = [pixels[y * 32:(y + 1) * 32] for y in range(32)]
+    # двумерное DCT раздельно: по строкам, затем по столбцам — только блок 8×8 низких частот
+    row_freq = [[sum(c * p for c, p in zip(cos_u, row)) for cos_u in _DCT] for row in rows]
+    low = [
+        sum(cos_v[y] * row_freq[y][u] for y in range(32))
+        for cos_v in _DCT for u in range(8)
+    ]
+    median = _median(low)
+    return _bits(c > median for c in low)
+
+
+def image_hashes(sha):
+    """aHash, dHash и pHash изображения (hex, 64 бита) — с учётом EXIF Orientation."""
+    with Image.open(image_path(sha)) as im:
+        im.draft('L', (64, 64))
+        gray = ImageOps.exif_transpose(im).convert('L')
+        return {'ahash': _ahash(gray), 'dhash': _dhash(gray), 'phash': _phash(gray)}
+
+
+def assign_image(obj, sha):
+    """Привязывает сохранённое изображение к записи PhotoMetadata и заполняет хеши (HASH_FIELDS); без save()."""
+    obj.image_sha256 = sha
+    for name, value in image_hashes(sha).items():
+        setattr(obj, name, value)
+    obj.hashed_at = timezone.now()
+    return obj
+
+
+# --------------------
+# Миниатюры (WebP, LRU-кеш на диске)
+# --------------------
+def _render_thumbnail(sha, size, path):
+    with Image.open(image_path(sha)) as im:
+        # JPEG: декодирование сразу в уменьшенном масштабе (1/2–1/8), не в полном разрешении
+        im.draft('RGB', (size, size))
+        im = ImageOps.exif_transpose(im)
+        im.thumbnail((size, size))
+        if im.mode not in ('RGB', 'RGBA'):
+            im = im.convert('RGBA' if 'A' in im.getbands() or 'transparency' in im.info else 'RGB')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.thumb-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                im.save(out, 'WEBP', quality=THUMB_QUALITY, method=4)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+def get_thumbnail(sha, size):
+    """
+    Путь к миниатюре sha размера size; при промахе создаётся (запись атомарна — через временный файл).
+    FileNotFoundError — если оригинала нет. Время обращения хранится в mtime (для очистки по LRU).
+    """
+    path = thumb_path(sha, size)
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        _render_thumbnail(sha, size, path)
+        if next(_generated) % PRUNE_EVERY == 0:
+            prune_thumbnails()
+        return path
+    now = time.time()
+    if now - mtime > TOUCH_INTERVAL:
+        os.utime(path, (now, now))
+    return path
+
+
+def prune_thumbnails(max_bytes=THUMB_CACHE_MAX_BYTES):
+    """
+    Удаляет давно не запрошенные миниатюры, пока объём кеша больше max_bytes
+    (с запасом 10%, чтобы не чистить после каждой новой). Возвращает (удалено файлов, освобождено байт).
+    """
+    entries = []
+    total = 0
+    if not os.path.isdir(THUMBS_DIR):
+        return 0, 0
+    for bucket in os.scandir(THUMBS_DIR):
+        if not bucket.is_dir():
+            continue
+        for entry in os.scandir(bucket.path):
+            if entry.is_file() and entry.name.endswith('.webp'):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+    if total <= max_bytes:
+        return 0, 0
+
+    target = max_bytes * 0.9
+    removed = freed = 0
+    for _, size, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        freed += size
+        removed += 1
+    return removed, freed
@@ -0,0 +1,363 @@
+import codecs
+import collections
+import json
+import os
+import re
+import tempfile
+import textwrap
+
+from .fingerprint import content_hash
+from .validation import validate_json_data
+
+# Размер читаемого куска файла (байт)
+CHUNK_SIZE = 64 * 1024
+# Самая длинная запись (символов): дальше — синтаксическая ошибка, а не дочитывание всего файла в память
+MAX_RECORD_CHARS = 1024 * 1024
+# Сколько записей валидируется и проверяется на дубли за один раз
+BATCH_SIZE = 1000
+# Сколько сообщений об ошибках сохраняется в отчёте
+MAX_ERRORS = 20
+
+_WS = re.compile(r'[ \t\n\r]*')
+
+
+# --------------------
+# Потоковое чтение JSON-массива
+# --------------------
+class JsonArrayReader:
+    """
+    Инкрементально разбирает JSON-массив верхнего уровня из файла,
+    отдавая записи по одной. В памяти держится только текущий кусок файла.
+    Одиночный объект верхнего уровня считается массивом из одной записи.
+    bytes_read — сколько байт файла уже прочитано (для индикации прогресса).
+    """
+
+    def __init__(self, fileobj, chunk_size=CHUNK_SIZE, max_record=MAX_RECORD_CHARS):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.max_record = max_record
+        self.bytes_read = 0
+        self._json = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder('utf-8-sig')()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, need=0):
+        """
+        Дочитывает кусок (или несколько — пока не наберётся need символов); False — если файл закончился.
+        Куски собираются в список и склеиваются с остатком буфера один раз.
+        """
+        if self._eof:
+            return False
+        parts = [self._buf[self._pos:]]
+        got = 0
+        while True:
+            chunk = self.fileobj.read(self.chunk_size)
+            if isinstance(chunk, bytes):
+                self.bytes_read += len(chunk)
+                text = self._text.decode(chunk, final=not chunk)
+            else:
+                self.bytes_read += len(chunk.encode('utf-8'))
+                text = chunk
+            parts.append(text)
+            got += len(text)
+            if not chunk:
+                self._eof = True
+                break
+            if got >= need:
+                break
+        self._buf = ''.join(parts)
+        self._pos = 0
+        return got > 0 or not self._eof
+
+    def _peek(self):
+        """Пропускает пробелы и возвращает следующий символ ('' — конец файла)."""
+        while True:
+            self._pos = _WS.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def _error(self, msg):
+        return json.JSONDecodeError(msg, self._buf, self._pos)
+
+    def _decode_value(self):
+        if self._peek() == '':
+            raise self._error('Expecting value')
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                # запись могла оборваться на границе куска — дочитываем и пробуем снова;
+                # дочитанное каждый раз удваивает хвост буфера, так что разбор повторяется O(log n) раз
+                pending = len(self._buf) - self._pos
+                if pending > self.max_record:
+                    raise self._error(f'Запись длиннее {self.max_record} символов')
+                if not self._fill(need=pending):
+                    raise
+                continue
+            if end == len(self._buf) and self._fill():
+                # значение упёрлось в конец буфера (например, число) — перечитаем с продолжением
+                continue
+            self._pos = end
+            return value
+
+    def _expect_end(self):
+        if self._peek() != '':
+            raise self._error('Extra data')
+
+    def __iter__(self):
+        if self._peek() != '[':
+            yield self._decode_value()
+            self._expect_end()
+            return
+        self._pos += 1
+        if self._peek() == ']':
+            self._pos += 1
+            self._expect_end()
+            return
+        while True:
+            yield self._decode_value()
+            ch = self._peek()
+            if ch == ',':
+                self._pos += 1
+            elif ch == ']':
+                self._pos += 1
+                break
+            else:
+                raise self._error("Expecting ',' delimiter")
+        self._expect_end()
+
+
+# --------------------
+# Отчёт о загрузке
+# --------------------
+class IngestReport:
+    """Счётчики загрузки и ограниченный список ошибок (не больше max_errors сообщений)."""
+
+    def __init__(self, max_errors=MAX_ERRORS):
+        self.max_errors = max_errors
+        self.total = 0
+        self.valid = 0
+        self.invalid = 0
+        self.duplicates = 0
+        self.added = 0
+        self.bytes_read = 0
+        self.errors = []
+        self.errors_dropped = 0
+        self.batches = []
+
+    def add_errors(self, errors):
+        room = self.max_errors - len(self.errors)
+        self.errors.extend(errors[:max(room, 0)])
+        self.errors_dropped += max(len(errors) - max(room, 0), 0)
+
+    def add_batch(self, total, inserted, duplicates, invalid):
+        """Учитывает результат одной пачки импорта (см. bulk.import_batch)."""
+        self.batches.append({
+            'batch': len(self.batches) + 1,
+            'total': total,
+            'inserted': inserted,
+            'duplicates': duplicates,
+            'invalid': invalid,
+        })
+        self.total += total
+        self.valid += total - invalid
+        self.invalid += invalid
+        self.duplicates += duplicates
+        self.added += inserted
+
+    def error_summary(self):
+        """Список сообщений для вывода пользователю (с хвостом «и ещё N»)."""
+        summary = list(self.errors)
+        if self.errors_dropped:
+            summary.append(f"…и ещё {self.errors_dropped} ошибок.")
+        return summary
+
+
+def _iter_batches(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_validated(records, batch_size=BATCH_SIZE, start=1, executor=None, depth=None):
+    """
+    Отдаёт (пачка, валидные записи, ошибки) по batch_size записей в исходном порядке.
+    С executor (например, ProcessPoolExecutor из run_workers) validate_json_data выполняется
+    в других процессах, пока читаются следующие пачки; в работе одновременно не больше depth пачек.
+    """
+    if executor is None:
+        for batch in _iter_batches(records, batch_size):
+            yield (batch, *validate_json_data(batch, start=start))
+            start += len(batch)
+        return
+    depth = depth or getattr(executor, '_max_workers', 1) * 2
+    pending = collections.deque()
+    for batch in _iter_batches(records, batch_size):
+        pending.append((batch, executor.submit(validate_json_data, batch, start)))
+        start += len(batch)
+        if len(pending) >= depth:
+            batch, future = pending.popleft()
+            yield (batch, *future.result())
+    while pending:
+        batch, future = pending.popleft()
+        yield (batch, *future.result())
+
+
+def iter_unique_batches(fileobj, seen_hashes, report, batch_size=BATCH_SIZE, progress=None, executor=None):
+    """
+    Читает записи из fileobj потоково и отдаёт пачки валидных записей без дублей.
+    seen_hashes — множество отпечатков уже сохранённых записей; пополняется по ходу.
+    progress(report) вызывается после обработки каждой пачки; executor — см. iter_validated.
+    """
+    reader = JsonArrayReader(fileobj)
+
+    def process(batch, valid, errors):
+        report.total += len(batch)
+        report.valid += len(valid)
+        report.invalid += len(batch) - len(valid)
+        report.add_errors(errors)
+        unique = []
+        for record in valid:
+            record_hash = content_hash(record)
+            if record_hash in seen_hashes:
+                report.duplicates += 1
+                continue
+            seen_hashes.add(record_hash)
+            unique.append(record)
+        report.bytes_read = reader.bytes_read
+        if progress:
+            progress(report)
+        return unique
+
+    for batch, valid, errors in iter_validated(reader, batch_size, executor=executor):
+        yield process(batch, valid, errors)
+
+
+# --------------------
+# Дозапись в JSON-файл (массив с indent=4)
+# --------------------
+def scan_json_file(json_path):
+    """
+    Потоково читает существующий JSON-файл и возвращает (множество отпечатков, число записей).
+    Повреждённый файл считается пустым — как и раньше при json.JSONDecodeError.
+    """
+    hashes = set()
+    count = 0
+    try:
+        with open(json_path, 'rb') as fh:
+            for record in JsonArrayReader(fh):
+                hashes.add(content_hash(record))
+                count += 1
+    except json.JSONDecodeError:
+        return set(), 0
+    return hashes, count
+
+
+def _dump_record(record):
+    return textwrap.indent(json.dumps(record, ensure_ascii=False, indent=4), ' ' * 4)
+
+
+def _array_body_end(json_path):
+    """
+    Позиция закрывающей ']' массива в файле (без хвостовых пробелов) или None,
+    если файл не заканчивается массивом.
+    """
+    with open(json_path, 'rb') as fh:
+        fh.seek(0, os.SEEK_END)
+        size = fh.tell()
+        fh.seek(max(size - 4096, 0))
+        tail = fh.read()
+    stripped = tail.rstrip()
+    if not stripped.endswith(b']'):
+        return None
+    # откатываемся через пробелы перед ']', чтобы запятая встала сразу после последней записи
+    body = stripped[:-1].rstrip()
+    return size - len(tail) + len(body)
+
+
+def _copy(src, out, limit=None):
+    remaining = limit
+    while remaining is None or remaining > 0:
+        chunk = src.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        out.write(chunk)
+        if remaining is not None:
+            remaining -= len(chunk)
+
+
+def _merge_into(json_path, staging_path, existing_count, added):
+    """
+    Собирает json_path = существующие записи + записи из staging_path
+    во временном файле и атомарно подменяет им исходный.
+    """
+    body_end = _array_body_end(json_path) if existing_count else None
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(json_path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            if body_end is not None:
+                # обычный случай: копируем байты массива до закрывающей скобки
+                with open(json_path, 'rb') as src:
+                    _copy(src, out, body_end)
+            elif existing_count:
+                # одиночный объект верхнего уровня — переписываем его элементом массива
+                out.write(b'[\n')
+                with open(json_path, 'rb') as src:
+                    for n, record in enumerate(JsonArrayReader(src)):
+                        if n:
+                            out.write(b',\n')
+                        out.write(_dump_record(record).encode('utf-8'))
+            else:
+                out.write(b'[\n')
+            if existing_count and added:
+                out.write(b',\n')
+            with open(staging_path, 'rb') as src:
+                _copy(src, out)
+            out.write(b'\n]')
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, json_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def ingest_json_upload(fileobj, json_path, report, batch_size=BATCH_SIZE, progress=None, executor=None):
+    """
+    Потоково добавляет записи из fileobj в JSON-файл json_path.
+    Новые записи сначала пишутся во временный файл; если в загрузке есть ошибки
+    валидации, целевой файл не меняется (как и при полной загрузке).
+    Иначе итоговый файл собирается копированием байтов и атомарно подменяется.
+    Возвращает True, если файл был изменён. json.JSONDecodeError пробрасывается.
+    """
+    exists = os.path.exists(json_path)
+    seen, existing_count = scan_json_file(json_path) if exists else (set(), 0)
+    folder = os.path.dirname(json_path)
+
+    staging = tempfile.NamedTemporaryFile(
+        'w', encoding='utf-8', dir=folder, suffix='.part', delete=False)
+    try:
+        with staging:
+            for batch in iter_unique_batches(fileobj, seen, report, batch_size, progress, executor):
+                for record in batch:
+                    if report.added:
+                        staging.write(',\n')
+                    staging.write(_dump_record(record))
+                    report.added += 1
+
+        if report.invalid or (exists and not report.added):
+            return False
+
+        _merge_into(json_path, staging.name, existing_count if exists else 0, report.added)
+        return True
+    finally:
+        os.unlink(staging.name)
@@ -0,0 +1,174 @@
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+from .bulk import import_json_stream
+from .ingest import IngestReport
+from .models import Job
+from .storage import get_file_store
+
+logger = logging.getLogger(__name__)
+
+# Папка для загруженных файлов, ожидающих обработки (media/jobs)
+JOBS_DIR = os.path.join(settings.MEDIA_ROOT, 'jobs')
+# Как часто сохранять прогресс задачи (сек)
+PROGRESS_INTERVAL = 0.5
+# Задача «выполняется», но без отметки прогресса дольше этого срока — воркер упал (сек)
+STALE_AFTER = getattr(settings, 'PHOTO_JOB_STALE_SECONDS', 600)
+# Сколько раз задача может перезапускаться после падения воркера
+MAX_ATTEMPTS = 3
+
+
+def background_uploads_enabled():
+    return getattr(settings, 'PHOTO_BACKGROUND_UPLOADS', True)
+
+
+# --------------------
+# Постановка в очередь
+# --------------------
+def enqueue_upload(kind, upload):
+    """Сохраняет загруженный файл в JOBS_DIR и создаёт задачу; обработка — в run_workers."""
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    path = os.path.join(JOBS_DIR, f"{uuid.uuid4().hex}.json")
+    with open(path, 'wb') as out:
+        for chunk in upload.chunks():
+            out.write(chunk)
+    return Job.objects.create(
+        kind=kind,
+        source_path=path,
+        source_name=(upload.name or '')[:255],
+        bytes_total=os.path.getsize(path),
+    )
+
+
+# --------------------
+# Выбор задачи воркером
+# --------------------
+def requeue_stale():
+    """Возвращает в очередь задачи упавших воркеров (или завершает их ошибкой после MAX_ATTEMPTS)."""
+    deadline = timezone.now() - timedelta(seconds=STALE_AFTER)
+    stale = Job.objects.filter(status=Job.STATUS_RUNNING, heartbeat_at__lt=deadline)
+    stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=Job.STATUS_FAILED, finished_at=timezone.now(), message="Воркер не завершил задачу.")
+    stale.update(status=Job.STATUS_QUEUED, worker='')
+
+
+def claim_next(worker):
+    """
+    Забирает самую старую задачу из очереди. Захват — условный UPDATE ... WHERE status='queued':
+    из нескольких воркеров задачу получит ровно один (работает и на SQLite, и на PostgreSQL).
+    """
+    requeue_stale()
+    queued = Job.objects.filter(status=Job.STATUS_QUEUED).order_by('id').values_list('id', flat=True)
+    for pk in queued[:10]:
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=pk, status=Job.STATUS_QUEUED).update(
+            status=Job.STATUS_RUNNING, worker=worker, started_at=now, heartbeat_at=now,
+            attempts=models.F('attempts') + 1,
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+# --------------------
+# Выполнение
+# --------------------
+def _save_progress(job, report, **fields):
+    """Сохраняет прогресс, пока задача за этим воркером. Возвращает число обновлённых строк (0 или 1)."""
+    return Job.objects.filter(pk=job.pk, worker=job.worker, status=Job.STATUS_RUNNING).update(
+        total=report.total,
+        valid=report.valid,
+        invalid=report.invalid,
+        duplicates=report.duplicates,
+        added=report.added,
+        bytes_read=report.bytes_read,
+        errors=report.error_summary(),
+        heartbeat_at=timezone.now(),
+        **fields,
+    )
+
+
+def run_job(job, executor=None):
+    """
+    Выполняет задачу: импорт в БД (bulk.import_json_stream) или загрузку в файловое хранилище.
+    Прогресс сохраняется не чаще раза в PROGRESS_INTERVAL. executor — пул процессов для проверки записей.
+    """
+    report = IngestReport()
+    last_saved = 0.0
+
+    def progress(report):
+        nonlocal last_saved
+        now = time.monotonic()
+        if now - last_saved >= PROGRESS_INTERVAL:
+            last_saved = now
+            _save_progress(job, report)
+
+    status, result = Job.STATUS_DONE, {}
+    try:
+        with open(job.source_path, 'rb') as fh:
+            if job.kind == Job.KIND_IMPORT_DB:
+                import_json_stream(fh, report, progress=progress, executor=executor)
+                result = {'batches': len(report.batches)}
+                message = (
+                    f"Импортировано в БД: {report.added}, дубликатов: {report.duplicates}, "
+                    f"с ошибками: {report.invalid} (пачек: {len(report.batches)})"
+                )
+            else:
+                filename, created = get_file_store().ingest(fh, report, progress=progress, executor=executor)
+                result = {'filename': filename, 'created': created}
+                if report.invalid:
+                    status = Job.STATUS_FAILED
+                    message = f"Файл не загружен: {report.invalid} из {report.total} записей с ошибками."
+                elif not report.added:
+                    message = "Новых записей нет — все записи уже есть в хранилище."
+                elif created:
+                    message = f"Создан новый файл {filename}"
+                else:
+                    message = f"Добавлено {report.added} новых записей в {filename}"
+    except json.JSONDecodeError:
+        status, message = Job.STATUS_FAILED, "Ошибка: некорректный JSON-файл."
+    except Exception as e:
+        logger.exception("Job %s failed", job.pk)
+        status, message = Job.STATUS_FAILED, f"Ошибка обработки: {e}"
+
+    # задачу могли вернуть в очередь (requeue_stale) и отдать другому воркеру — его статус и файл не трогаем
+    if _save_progress(job, report, status=status, result=result, message=message, finished_at=timezone.now()):
+        if os.path.exists(job.source_path):
+            os.remove(job.source_path)
+    job.refresh_from_db()
+    return job
+
+
+def job_status(job):
+    """Состояние задачи для ajax/jobs/<id>/."""
+    percent = 100 if job.status == Job.STATUS_DONE else (
+        min(99, round(job.bytes_read * 100 / job.bytes_total)) if job.bytes_total else 0
+    )
+    return {
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'source_name': job.source_name,
+        'percent': percent,
+        'bytes_read': job.bytes_read,
+        'bytes_total': job.bytes_total,
+        'total': job.total,
+        'valid': job.valid,
+        'invalid': job.invalid,
+        'duplicates': job.duplicates,
+        'added': job.added,
+        'errors': job.errors,
+        'result': job.result,
+        'message': job.message,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    }
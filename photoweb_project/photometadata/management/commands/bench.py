@@ -0,0 +1,343 @@
+import contextlib
+import gc
+import io
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.client import encode_multipart
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from photometadata import metrics
+from photometadata.bulk import IMPORT_BATCH_SIZE, IMPORT_FIELDS, copy_supported, import_batch
+from photometadata.catalogue import FILE_PAGE_SIZE
+from photometadata.ingest import IngestReport
+from photometadata.models import PhotoMetadata
+from photometadata.pagination import keyset_page
+from photometadata.storage import get_file_store, use_file_store
+from photometadata.synthetic import generate_photos, write_json_array
+from photometadata.views import is_duplicate
+
+# SQLite-база бенчмарка — файл, а не :memory: (как у настоящего сервера)
+BENCH_SQLITE_NAME = os.path.join(tempfile.gettempdir(), 'photometadata-bench.sqlite3')
+DEFAULT_UPLOAD_SIZES = [100, 1000, 10000]
+# частый тег, город, фамилия, редкий тег и запрос без совпадений (см. synthetic.py)
+SEARCH_TERMS = ['sea', 'Moscow', 'Fedorov', 'volcano', 'zzzz']
+# страница «глубоко» в списке — сколько раз перейти по курсору next
+DEEP_PAGE = 50
+BOUNDARY = 'PhotometadataBenchBoundary'
+# зерна синтетических данных: БД, файловое хранилище, образцы для is_duplicate; загрузки — дальше
+SEED_DB, SEED_STORE, SEED_SAMPLE, SEED_UPLOADS = 0, 1, 2, 100
+
+
+class Case:
+    """Один замер: run(i) вызывается warmup + repeat раз; ops — операций за вызов (время считается на операцию)."""
+
+    def __init__(self, name, run, repeat, ops=1, expect=(200,)):
+        self.name = name
+        self.group = name.split('[')[0]
+        self.run = run
+        self.repeat = repeat
+        self.ops = ops
+        self.expect = expect
+
+
+class Command(BaseCommand):
+    help = (
+        "Набор бенчмарков: загрузка JSON разного размера (в БД и в файл), is_duplicate, db_search_ajax, "
+        "db_list_view, db_view_ajax и просмотр JSON-файла. Работает в отдельной тестовой БД текущего "
+        "DATABASES (SQLite или PostgreSQL) и временном каталоге хранилища; результат — JSON для сравнения "
+        "между коммитами (--output, --compare)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help="Записей в БД перед замерами")
+        parser.add_argument('--file-rows', type=int, default=5000, help="Записей в файловом хранилище")
+        parser.add_argument('--upload-sizes', type=int, nargs='*', default=DEFAULT_UPLOAD_SIZES,
+                            help="Размеры загружаемых файлов (записей)")
+        parser.add_argument('--repeat', type=int, default=30, help="Повторов на замер")
+        parser.add_argument('--upload-repeat', type=int, default=5, help="Повторов на замер загрузки")
+        parser.add_argument('--warmup', type=int, default=2, help="Прогревочных вызовов (не входят в замер)")
+        parser.add_argument('--only', action='append', default=[],
+                            help="Только замеры, имя которых начинается с этой строки (можно несколько)")
+        parser.add_argument('--keepdb', action='store_true',
+                            help="Не удалять тестовую БД: следующий запуск не будет заполнять её заново")
+        parser.add_argument('--label', default='', help="Метка результата (например, имя ветки)")
+        parser.add_argument('--output', help="Сохранить результат в JSON-файл")
+        parser.add_argument('--compare', help="JSON прошлого запуска: показать изменение медиан")
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help="Относительное замедление медианы, считающееся регрессией")
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help="Завершиться с ошибкой, если есть регрессии (для CI)")
+        parser.add_argument('--json', action='store_true', help="Вывести результат в JSON")
+
+    def handle(self, *args, **options):
+        self.options = options
+        options['warmup'] = max(options['warmup'], 1)
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as fh:
+                baseline = json.load(fh)
+
+        with self._environment():
+            self._log(f"Заполнение: {options['rows']} записей в БД, {options['file_rows']} в хранилище…")
+            self._seed()
+            self.rows = PhotoMetadata.objects.count()
+            results = []
+            for case in self._cases():
+                if options['only'] and not any(case.name.startswith(p) for p in options['only']):
+                    continue
+                results.append(self._measure(case))
+                self._log(self._format(results[-1]))
+            meta = self._meta()
+
+        report = {'meta': meta, 'results': results}
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as out:
+                json.dump(report, out, ensure_ascii=False, indent=2)
+            self._log(f"Результат сохранён в {options['output']}")
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+        if baseline is not None:
+            regressions = self._compare(baseline, report)
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"Регрессии: {', '.join(regressions)}")
+
+    def _log(self, text):
+        # при --json в stdout только результат
+        (self.stderr if self.options['json'] else self.stdout).write(text)
+
+    # ---- окружение: отдельная БД, хранилище и кеш ----
+    @contextlib.contextmanager
+    def _environment(self):
+        settings_dict = connection.settings_dict
+        old_name = settings_dict['NAME']
+        test = settings_dict.setdefault('TEST', {})
+        if not test.get('NAME'):
+            test['NAME'] = BENCH_SQLITE_NAME if connection.vendor == 'sqlite' else f"{old_name}_bench"
+        keepdb = self.options['keepdb']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=keepdb)
+        root = tempfile.mkdtemp(prefix='photometadata-bench-')
+        # локальный кеш: записи тестовой БД не должны попасть в общий кеш (file/db) настоящего сайта;
+        # без фоновой очереди загрузка измеряется целиком, метрики бенчмарка не смешиваются с /metrics;
+        # DEBUG выключен, как на сервере (иначе каждый SQL-запрос ещё и записывается в connection.queries)
+        overrides = override_settings(
+            DEBUG=False,
+            ALLOWED_HOSTS=['testserver'],
+            CACHES={alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                            'LOCATION': f'photometadata-bench-{alias}'} for alias in settings.CACHES},
+            PHOTO_BACKGROUND_UPLOADS=False,
+            PHOTO_METRICS=False,
+        )
+        try:
+            with overrides, use_file_store(type(get_file_store())(root)) as store:
+                self.store = store
+                yield
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+
+    def _seed(self):
+        # повторное заполнение тем же зерном (--keepdb) только дописывает недостающее: остальное — дубли
+        if PhotoMetadata.objects.count() < self.options['rows']:
+            records = generate_photos(self.options['rows'], SEED_DB)
+            report, start = IngestReport(), 1
+            while batch := list(itertools.islice(records, IMPORT_BATCH_SIZE)):
+                import_batch(batch, report, start, copy_supported())
+                start += len(batch)
+        if self.options['file_rows']:
+            self.store.ingest(io.BytesIO(_json_bytes(self.options['file_rows'], SEED_STORE)), IngestReport())
+
+    # ---- замеры ----
+    def _cases(self):
+        o = self.options
+        client = Client()
+        cases = []
+
+        # is_duplicate: половина образцов есть в БД, половина — нет
+        existing = list(PhotoMetadata.objects.values(*IMPORT_FIELDS)[:50])
+        sample = existing + list(generate_photos(100 - len(existing), SEED_SAMPLE))
+        hashes = set(PhotoMetadata.objects.values_list('content_hash', flat=True))
+        loaded = list(PhotoMetadata.objects.values(*IMPORT_FIELDS)[:1000])
+
+        def duplicates(existing_data, records):
+            return lambda i: [is_duplicate(existing_data, r) for r in records]
+
+        cases += [
+            Case('is_duplicate[queryset]', duplicates(PhotoMetadata.objects.all(), sample), o['repeat'],
+                 ops=len(sample), expect=None),
+            Case('is_duplicate[set]', duplicates(hashes, sample), o['repeat'], ops=len(sample), expect=None),
+            Case(f'is_duplicate[list={len(loaded)}]', duplicates(loaded, sample[45:55]), o['repeat'],
+                 ops=10, expect=None),
+        ]
+
+        def get(name, params=None, args=()):
+            url = reverse(f'photometadata:{name}', args=args)
+            return lambda i: client.get(url, params)
+
+        def post(name, body, content_type):
+            url = reverse(f'photometadata:{name}')
+            return lambda i: client.generic('POST', url, body[i] if isinstance(body, list) else body,
+                                            content_type=content_type)
+
+        for term in SEARCH_TERMS:
+            cases.append(Case(f'db_search_ajax[q={term}]', post(
+                'db_search_ajax', json.dumps({'q': term}), 'application/json'), o['repeat']))
+
+        deep = self._deep_cursor()
+        cases.append(Case('db_list_view[first]', get('db_list'), o['repeat']))
+        if deep:
+            cases.append(Case(f'db_list_view[page={DEEP_PAGE}]', get('db_list', {'cursor': deep}), o['repeat']))
+        for limit in (20, 100):
+            cases.append(Case(f'db_view_ajax[limit={limit}]', get('db_view_ajax', {'limit': limit}), o['repeat']))
+        if deep:
+            cases.append(Case(f'db_view_ajax[page={DEEP_PAGE}]', get('db_view_ajax', {'cursor': deep}), o['repeat']))
+
+        files = self.store.list_files()
+        if files:
+            last = max((o['file_rows'] + FILE_PAGE_SIZE - 1) // FILE_PAGE_SIZE, 1)
+            for page in dict.fromkeys([1, last]):
+                cases.append(Case(f'view_source_file[page={page}]', get(
+                    'view_source_file', {'page': page}, ['file', files[0]]), o['repeat']))
+            cases.append(Case('json_list', get('json_list'), o['repeat']))
+
+        # загрузки — последними: они пополняют БД и хранилище
+        seeds = itertools.count(SEED_UPLOADS)
+        for size in o['upload_sizes']:
+            for target in ('db', 'file'):
+                # тела запросов собираются заранее: каждый вызов загружает новые записи
+                bodies = [
+                    self._upload_body(target, size, next(seeds)) for _ in range(o['warmup'] + o['upload_repeat'])
+                ]
+                cases.append(Case(f'upload_{target}[{size}]', post(
+                    'index', bodies, f'multipart/form-data; boundary={BOUNDARY}'), o['upload_repeat'], expect=(302,)))
+        return cases
+
+    def _deep_cursor(self):
+        cursor = None
+        for _ in range(DEEP_PAGE - 1):
+            cursor = keyset_page(PhotoMetadata.objects.all(), cursor).next_cursor
+            if cursor is None:
+                return None
+        return cursor
+
+    @staticmethod
+    def _upload_body(target, size, seed):
+        upload = SimpleUploadedFile(f'bench-{seed}.json', _json_bytes(size, seed), 'application/json')
+        return encode_multipart(BOUNDARY, {'upload_file': target, 'file': upload})
+
+    def _measure(self, case):
+        # первый прогревочный вызов — под счётчиками запроса из metrics.py (SQL, байты JSON-хранилища)
+        stats = metrics.RequestStats()
+        token = metrics.activate(stats)
+        try:
+            self._call(case, 0)
+        finally:
+            metrics.deactivate(token)
+        for i in range(1, self.options['warmup']):
+            self._call(case, i)
+        timings = []
+        gc.collect()
+        for i in range(self.options['warmup'], self.options['warmup'] + case.repeat):
+            started = time.perf_counter()
+            self._call(case, i)
+            timings.append((time.perf_counter() - started) / case.ops)
+        timings.sort()
+        median = statistics.median(timings)
+        return {
+            'case': case.name,
+            'group': case.group,
+            'iterations': case.repeat,
+            'ops': case.ops,
+            'median_ms': round(median * 1000, 4),
+            'p95_ms': round(timings[min(int(len(timings) * 0.95), len(timings) - 1)] * 1000, 4),
+            'min_ms': round(timings[0] * 1000, 4),
+            'mean_ms': round(statistics.fmean(timings) * 1000, 4),
+            'ops_per_sec': round(1 / median, 1) if median else None,
+            'queries': round(stats.queries / case.ops, 2),
+            'json_bytes': round((stats.json_read + stats.json_write) / case.ops),
+        }
+
+    @staticmethod
+    def _call(case, i):
+        response = case.run(i)
+        if case.expect and response.status_code not in case.expect:
+            raise CommandError(f"{case.name}: ответ {response.status_code}, ожидался {case.expect}")
+
+    def _meta(self):
+        return {
+            'label': self.options['label'],
+            'commit': _git('rev-parse', '--short', 'HEAD'),
+            'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'database_version': '.'.join(map(str, connection.get_database_version())),
+            'file_store': type(self.store).__name__,
+            'rows': self.rows,
+            'file_rows': self.options['file_rows'],
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+        }
+
+    # ---- вывод и сравнение ----
+    @staticmethod
+    def _format(r):
+        return (
+            f"{r['case']:<32} медиана {r['median_ms']:>10.3f} мс  p95 {r['p95_ms']:>10.3f} мс  "
+            f"{r['ops_per_sec'] or 0:>10.1f} оп/с  SQL {r['queries']:g}"
+        )
+
+    def _compare(self, baseline, report):
+        """Печатает изменение медиан относительно baseline; возвращает имена замеров с регрессией."""
+        before = {r['case']: r for r in baseline.get('results', [])}
+        threshold = self.options['threshold']
+        regressions = []
+        meta = baseline.get('meta', {})
+        self._log(f"Сравнение с {meta.get('label') or meta.get('commit') or self.options['compare']} "
+                  f"({meta.get('database', '?')}, {meta.get('timestamp', '?')}):")
+        for r in report['results']:
+            old = before.get(r['case'])
+            if old is None or not old['median_ms']:
+                self._log(f"  {r['case']:<32} нет в базовом замере")
+                continue
+            ratio = r['median_ms'] / old['median_ms']
+            line = f"  {r['case']:<32} {old['median_ms']:>10.3f} → {r['median_ms']:>10.3f} мс  ×{ratio:.2f}"
+            if ratio > 1 + threshold:
+                regressions.append(r['case'])
+                self._log(self.style.ERROR(line + "  регрессия"))
+            elif ratio < 1 - threshold:
+                self._log(self.style.SUCCESS(line + "  быстрее"))
+            else:
+                self._log(line)
+        return regressions
+
+
+def _json_bytes(count, seed):
+    out = io.StringIO()
+    write_json_array(generate_photos(count, seed), out)
+    return out.getvalue().encode('utf-8')
+
+
+def _git(*args):
+    try:
+        return subprocess.run(
+            ['git', *args], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=10, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
@@ -0,0 +1,137 @@
+import gc
+import json
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from photometadata.validation import validate_columns, validate_parallel, validate_records
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def _legacy_validate(data_list, start=1):
+    """Прежний validate_json_data (ошибки записи ищутся по всему списку errors) — точка отсчёта."""
+    required_fields = [
+        "title", "photographer", "date_taken", "description", "location",
+        "tags", "width", "height", "camera", "license", "url"
+    ]
+    valid_data = []
+    errors = []
+
+    for i, record in enumerate(data_list, start=start):
+        if not isinstance(record, dict):
+            errors.append(f"Запись {i}: ожидается JSON-объект.")
+            continue
+
+        # Проверка наличия полей
+        missing = [f for f in required_fields if f not in record]
+        if missing:
+            errors.append(f"Запись {i}: отсутствуют поля {', '.join(missing)}.")
+            continue
+
+        # Проверка строковых полей
+        for field in ["title", "photographer", "description", "location", "camera", "license", "url"]:
+            if not isinstance(record.get(field), str) or not record.get(field).strip():
+                errors.append(f"Запись {i}: поле '{field}' пустое или не является строкой.")
+
+        # Теги: допускаем пустую строку, но тип должен быть string
+        if not isinstance(record.get("tags"), str):
+            errors.append(f"Запись {i}: поле 'tags' должно быть строкой (CSV).")
+
+        # Размеры: положительные целые
+        try:
+            w = int(record.get("width"))
+            h = int(record.get("height"))
+            if w <= 0 or h <= 0:
+                errors.append(f"Запись {i}: width и height должны быть > 0.")
+        except Exception:
+            errors.append(f"Запись {i}: некорректные значения width/height.")
+
+        # Дата: ISO YYYY-MM-DD
+        try:
+            date.fromisoformat(str(record.get("date_taken")))
+        except Exception:
+            errors.append(f"Запись {i}: поле 'date_taken' должно быть в формате YYYY-MM-DD.")
+
+        # Если для данной записи нет ошибок — добавляем в valid_data
+        if not any(err for err in errors if f"Запись {i}:" in err):
+            # Приводим width/height к int и date к строке ISO (на всякий случай)
+            record['width'] = int(record['width'])
+            record['height'] = int(record['height'])
+            record['date_taken'] = str(record['date_taken'])
+            valid_data.append(record)
+
+    return valid_data, errors
+
+
+def make_records(n, invalid_ratio, seed=0):
+    """n синтетических записей; доля invalid_ratio с одной случайной ошибкой."""
+    rng = random.Random(seed)
+    broken = [
+        ('title', ''), ('url', None), ('width', 0), ('height', 'x'),
+        ('date_taken', '2021-13-40'), ('tags', 5),
+    ]
+    records = []
+    for i in range(n):
+        record = {
+            "title": f"Photo {i}", "photographer": "Ann", "date_taken": f"20{i % 24:02d}-0{1 + i % 9}-1{i % 10}",
+            "url": f"https://example.com/{i}.jpg", "description": "Sea", "location": "Riga",
+            "tags": "sea,sky", "width": 1 + i % 4000, "height": 1 + i % 3000, "camera": "X100", "license": "CC0",
+        }
+        if rng.random() < invalid_ratio:
+            field, value = rng.choice(broken)
+            record[field] = value
+        records.append(record)
+    return records
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк валидации записей: прежний алгоритм, построчный, по столбцам и в пуле процессов."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Размеры выборок")
+        parser.add_argument('--invalid', type=float, default=0.05, help="Доля записей с ошибками")
+        parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                            help="Процессов для режима parallel")
+        parser.add_argument('--legacy-max', type=int, default=100_000,
+                            help="Прежний алгоритм квадратичен — запускать только до этого размера")
+        parser.add_argument('--json', action='store_true', help="Вывести результат в JSON")
+
+    def handle(self, *args, **options):
+        modes = {
+            'legacy': _legacy_validate,
+            'rows': validate_records,
+            'columns': validate_columns,
+        }
+        results = []
+        with ProcessPoolExecutor(options['processes'], mp_context=multiprocessing.get_context('spawn')) as pool:
+            # прогрев: запуск дочерних процессов не входит в замер
+            list(pool.map(time.sleep, [0.2] * options['processes']))
+            modes['parallel'] = lambda data: validate_parallel(data, pool)
+            for size in options['sizes']:
+                for mode, validate in modes.items():
+                    if mode == 'legacy' and size > options['legacy_max']:
+                        continue
+                    data = make_records(size, options['invalid'])
+                    gc.collect()
+                    started = time.perf_counter()
+                    valid, errors = validate(data)
+                    elapsed = time.perf_counter() - started
+                    results.append({
+                        'size': size, 'mode': mode, 'seconds': round(elapsed, 4),
+                        'records_per_sec': round(size / elapsed) if elapsed else None,
+                        'valid': len(valid), 'errors': len(errors),
+                    })
+                    del data, valid, errors
+                    if not options['json']:
+                        r = results[-1]
+                        self.stdout.write(
+                            f"{size:>9} {mode:<9} {r['seconds']:>9.3f} с  {r['records_per_sec']:>10} записей/с  "
+                            f"(валидных {r['valid']}, ошибок {r['errors']})"
+                        )
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from photometadata.snapshot import current_manifest
+
+
+class Command(BaseCommand):
+    help = (
+        "Собирает снимок таблицы для ajax/snapshot/ (media/snapshot): пересобирает изменённые куски "
+        "или, с --full, весь снимок. Запросы полный снимок не собирают: пока его нет, ajax/snapshot/ отвечает 503 "
+        "(в простое его собирает и run_workers)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Пересобрать все куски")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        manifest = current_manifest(full=options['full'])
+        size = sum(chunk['bytes'] for chunk in manifest['chunks'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Снимок {manifest['version']}: записей {manifest['rows']}, кусков {len(manifest['chunks'])}, "
+            f"{size / 1024:.0f} КиБ — {time.monotonic() - started:.1f} с"
+        ))
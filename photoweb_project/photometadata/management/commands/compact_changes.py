@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from photometadata.changes import compact_changes
+
+
+class Command(BaseCommand):
+    help = (
+        "Сжимает журнал изменений (ajax/changes/): удаляет записи, перекрытые более новыми по тому же фото, "
+        "и удаления старше срока хранения. run_workers делает это сам раз в --compact-every секунд."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=float,
+                            help="Сколько дней хранить удаления (по умолчанию settings.PHOTO_CHANGES_RETENTION_DAYS)")
+
+    def handle(self, *args, **options):
+        retention = None
+        if options['retention_days'] is not None:
+            if options['retention_days'] < 0:
+                raise CommandError("--retention-days не может быть отрицательным.")
+            retention = timedelta(days=options['retention_days'])
+        superseded, expired = compact_changes(retention)
+        self.stdout.write(self.style.SUCCESS(
+            f"Удалено перекрытых записей: {superseded}, устаревших удалений: {expired}"
+        ))
@@ -0,0 +1,40 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from photometadata.storage import JSON_DIR, JsonlSegmentStore, get_file_store
+
+
+class Command(BaseCommand):
+    help = "Переносит записи из *.json файлов media/json в сегменты JSON Lines (однократно, без дублей)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true',
+                            help="Удалить исходные .json после переноса (по умолчанию переименовываются в .json.bak)")
+        parser.add_argument('--compact', action='store_true',
+                            help="После переноса склеить закрытые сегменты")
+
+    def handle(self, *args, **options):
+        store = get_file_store()
+        if not isinstance(store, JsonlSegmentStore):
+            raise CommandError("PHOTO_FILE_STORE не является JsonlSegmentStore — переносить некуда.")
+
+        sources = sorted(f for f in os.listdir(JSON_DIR) if f.lower().endswith('.json'))
+        if not sources:
+            self.stdout.write("Нет .json файлов для переноса.")
+        for name in sources:
+            path = os.path.join(JSON_DIR, name)
+            try:
+                added = store.import_json_file(path)
+            except ValueError as e:
+                self.stderr.write(f"{name}: не удалось прочитать ({e}), файл пропущен.")
+                continue
+            if options['delete']:
+                os.unlink(path)
+            else:
+                os.replace(path, path + '.bak')
+            self.stdout.write(self.style.SUCCESS(f"{name}: перенесено {added} записей."))
+
+        if options['compact']:
+            merged = store.compact()
+            self.stdout.write(f"Склеено сегментов: {merged}")
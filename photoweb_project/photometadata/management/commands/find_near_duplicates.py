@@ -0,0 +1,66 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from photometadata.images import HASH_FIELDS, assign_image
+from photometadata.models import PhotoMetadata
+from photometadata.near_duplicates import (
+    DEFAULT_DISTANCE, HASH_KINDS, MAX_DISTANCE, find_clusters, get_index, serialize_clusters,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Ищет почти одинаковые фото по перцептивному хешу (мультииндекс по расстоянию Хэмминга) "
+        "и выводит кластеры. --rehash — посчитать хеши для записей с изображением, где их ещё нет."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hash', choices=HASH_KINDS, default='phash', help="Какой хеш сравнивать")
+        parser.add_argument('--distance', type=int, default=DEFAULT_DISTANCE,
+                            help=f"Порог расстояния Хэмминга (0–{MAX_DISTANCE})")
+        parser.add_argument('--rehash', action='store_true',
+                            help="Посчитать хеши для записей с image_sha256 без хешей")
+        parser.add_argument('--limit', type=int, default=None, help="Вывести не больше N кластеров")
+        parser.add_argument('--json', action='store_true', help="Вывести кластеры в JSON")
+
+    def handle(self, *args, **options):
+        if options['rehash']:
+            self.rehash()
+
+        started = time.monotonic()
+        index = get_index(options['hash'])
+        index.refresh()
+        built = time.monotonic() - started
+        clusters = find_clusters(options['hash'], min(options['distance'], MAX_DISTANCE))
+        elapsed = time.monotonic() - started
+        if options['limit']:
+            clusters = clusters[:options['limit']]
+        data = serialize_clusters(clusters, options['hash'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(data, ensure_ascii=False, indent=2, default=str))
+            return
+        for n, cluster in enumerate(data, start=1):
+            self.stdout.write(f"Кластер {n} ({cluster['size']} фото):")
+            for r in cluster['records']:
+                self.stdout.write(f"  #{r['id']} [{r['distance']}] {r['title']} — {r['photographer']}, {r['url']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Хешей в индексе: {len(index.hashes)}, кластеров: {len(data)} "
+            f"(индекс {built:.2f} с, поиск {elapsed - built:.2f} с)"
+        ))
+
+    def rehash(self):
+        done = failed = 0
+        queryset = PhotoMetadata.objects.exclude(image_sha256='').filter(phash='').order_by('id')
+        for obj in queryset.iterator(chunk_size=200):
+            try:
+                assign_image(obj, obj.image_sha256)
+            except OSError as e:
+                failed += 1
+                self.stderr.write(f"#{obj.pk}: {e}")
+                continue
+            obj.save(update_fields=HASH_FIELDS)
+            done += 1
+        self.stdout.write(f"Хеши посчитаны для {done} записей, ошибок: {failed}")
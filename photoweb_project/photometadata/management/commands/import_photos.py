@@ -0,0 +1,64 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from photometadata.bulk import IMPORT_BATCH_SIZE, import_json_stream
+from photometadata.ingest import IngestReport
+
+
+class Command(BaseCommand):
+    help = "Массовый импорт JSON-файлов с метаданными в БД (bulk_create или COPY на PostgreSQL)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help="JSON-файлы (массив записей); '-' — stdin")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+                            help="Записей в одной транзакции")
+        parser.add_argument('--method', choices=['auto', 'orm', 'copy'], default='auto',
+                            help="auto — COPY на PostgreSQL, иначе bulk_create")
+        parser.add_argument('--json', action='store_true', help="Вывести отчёт в JSON")
+
+    def handle(self, *args, **options):
+        report = IngestReport()
+        started = time.monotonic()
+
+        def progress(report):
+            if options['json']:
+                return
+            b = report.batches[-1]
+            self.stdout.write(
+                f"Пачка {b['batch']}: всего {b['total']}, добавлено {b['inserted']}, "
+                f"дублей {b['duplicates']}, с ошибками {b['invalid']}"
+            )
+
+        for path in options['paths']:
+            try:
+                if path == '-':
+                    import_json_stream(sys.stdin.buffer, report, options['batch_size'], options['method'], progress)
+                else:
+                    with open(path, 'rb') as fh:
+                        import_json_stream(fh, report, options['batch_size'], options['method'], progress)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"{path}: {e}")
+
+        elapsed = time.monotonic() - started
+        rate = report.total / elapsed * 60 if elapsed else 0
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'total': report.total,
+                'inserted': report.added,
+                'duplicates': report.duplicates,
+                'invalid': report.invalid,
+                'seconds': round(elapsed, 3),
+                'rows_per_minute': round(rate),
+                'batches': report.batches,
+                'errors': report.error_summary(),
+            }, ensure_ascii=False, indent=2))
+            return
+        for err in report.error_summary():
+            self.stderr.write(err)
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: всего {report.total}, добавлено {report.added}, дублей {report.duplicates}, "
+            f"с ошибками {report.invalid} — {elapsed:.1f} с ({rate:.0f} записей/мин)"
+        ))
@@ -0,0 +1,157 @@
+import os
+import urllib.request
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+
+from photometadata.images import (
+    HASH_FIELDS, IMAGE_EXTENSIONS, IMAGE_MAX_BYTES, THUMB_SIZES, assign_image, get_thumbnail, image_path,
+    prune_thumbnails, read_image_info, store_image,
+)
+from photometadata.models import PhotoMetadata
+from photometadata.near_duplicates import similar_to
+
+UNKNOWN = "Неизвестно"
+
+
+def iter_image_files(paths):
+    """Файлы изображений из списка путей; каталоги обходятся рекурсивно (по расширению)."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                        yield os.path.join(root, name)
+        elif os.path.isfile(path):
+            yield path
+        else:
+            raise CommandError(f"{path}: файл не найден")
+
+
+class Command(BaseCommand):
+    help = (
+        "Импорт изображений: файл сохраняется в media/images, размеры, камера, дата и автор читаются "
+        "из заголовка/EXIF (без декодирования пикселей), миниатюры WebP создаются заранее. "
+        "--fetch — скачать оригиналы по url для уже существующих записей."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help="Файлы или каталоги с изображениями")
+        parser.add_argument('--base-url', default='http://localhost:8000',
+                            help="Адрес сайта для поля url (ссылка на сохранённый оригинал)")
+        parser.add_argument('--photographer', default=UNKNOWN, help="Если в EXIF нет Artist")
+        parser.add_argument('--camera', default=UNKNOWN, help="Если в EXIF нет Make/Model")
+        parser.add_argument('--location', default=UNKNOWN)
+        parser.add_argument('--license', default=UNKNOWN)
+        parser.add_argument('--tags', default='')
+        parser.add_argument('--description', default='', help="По умолчанию — имя файла")
+        parser.add_argument('--fetch', action='store_true',
+                            help="Скачать изображения по url для записей без локального файла")
+        parser.add_argument('--limit', type=int, default=None, help="Не больше N записей для --fetch")
+        parser.add_argument('--timeout', type=float, default=10.0, help="Тайм-аут скачивания (сек)")
+        parser.add_argument('--no-thumbs', action='store_true', help="Не создавать миниатюры заранее")
+        parser.add_argument('--prune', action='store_true',
+                            help="Очистить кеш миниатюр до settings.PHOTO_THUMB_CACHE_MAX_BYTES")
+
+    def handle(self, *args, **options):
+        if not (options['paths'] or options['fetch'] or options['prune']):
+            raise CommandError("Укажите файлы/каталоги, --fetch или --prune.")
+        self.options = options
+
+        created = skipped = 0
+        for path in iter_image_files(options['paths']):
+            try:
+                obj, is_new = self.ingest_file(path)
+            except (OSError, ValueError) as e:
+                self.stderr.write(f"{path}: {e}")
+                continue
+            if is_new:
+                created += 1
+                self.stdout.write(f"{path}: запись #{obj.pk} ({obj.width}×{obj.height}, {obj.camera})")
+                similar = similar_to(obj.phash, exclude=obj.pk)
+                if similar:
+                    self.stdout.write(self.style.WARNING(
+                        "  похожие фото: " + ", ".join(f"#{r['id']} (расстояние {r['distance']})" for r in similar)
+                    ))
+            else:
+                skipped += 1
+                self.stdout.write(f"{path}: дубликат — уже есть запись #{obj.pk}")
+        if options['paths']:
+            self.stdout.write(self.style.SUCCESS(f"Добавлено записей: {created}, уже были: {skipped}"))
+
+        if options['fetch']:
+            self.fetch_missing()
+        if options['prune']:
+            removed, freed = prune_thumbnails()
+            self.stdout.write(self.style.SUCCESS(f"Кеш миниатюр: удалено {removed} файлов ({freed} байт)"))
+
+    def warm_thumbnails(self, sha):
+        if not self.options['no_thumbs']:
+            for size in THUMB_SIZES:
+                get_thumbnail(sha, size)
+
+    def ingest_file(self, path):
+        """Запись PhotoMetadata для файла изображения; (запись, создана ли)."""
+        options = self.options
+        with open(path, 'rb') as fh:
+            sha = store_image(fh)
+        existing = PhotoMetadata.objects.filter(image_sha256=sha).first()
+        if existing is not None:
+            self.warm_thumbnails(sha)
+            return existing, False
+
+        info = read_image_info(image_path(sha))
+        title = os.path.splitext(os.path.basename(path))[0]
+        obj = PhotoMetadata(
+            title=title[:200],
+            photographer=info.get('photographer', options['photographer'])[:200],
+            date_taken=info.get('date_taken') or date.fromtimestamp(os.path.getmtime(path)).isoformat(),
+            url=options['base_url'].rstrip('/') + reverse('photometadata:photo_image', args=[sha]),
+            description=options['description'] or title,
+            location=options['location'],
+            tags=options['tags'],
+            width=info['width'],
+            height=info['height'],
+            camera=info.get('camera', options['camera'])[:200],
+            license=options['license'],
+        )
+        assign_image(obj, sha)
+        # через save(): теги, фасеты и кеш записей обновляют сигналы
+        try:
+            with transaction.atomic():
+                obj.save()
+        except IntegrityError:
+            # запись с теми же полями уже есть (уникальный content_hash) — например, её сохранил
+            # параллельный импорт или у прежней записи с этим изображением сбросили image_sha256
+            existing = PhotoMetadata.objects.filter(content_hash=obj.content_hash).first()
+            if existing is None:
+                raise
+            return existing, False
+        self.warm_thumbnails(sha)
+        return obj, True
+
+    def fetch_missing(self):
+        """Скачивает оригиналы по url (один раз) — после этого список показывает миниатюры, а не оригиналы."""
+        options = self.options
+        queryset = PhotoMetadata.objects.filter(image_sha256='').order_by('id')
+        if options['limit']:
+            queryset = queryset[:options['limit']]
+        fetched = failed = 0
+        for obj in queryset.iterator(chunk_size=200):
+            if not obj.url.startswith(('http://', 'https://')):
+                continue
+            try:
+                with urllib.request.urlopen(obj.url, timeout=options['timeout']) as response:
+                    sha = store_image(response, IMAGE_MAX_BYTES)
+            except (OSError, ValueError) as e:
+                failed += 1
+                self.stderr.write(f"#{obj.pk} {obj.url}: {e}")
+                continue
+            assign_image(obj, sha)
+            obj.save(update_fields=HASH_FIELDS)
+            self.warm_thumbnails(sha)
+            fetched += 1
+        self.stdout.write(self.style.SUCCESS(f"Скачано изображений: {fetched}, ошибок: {failed}"))
@@ -0,0 +1,183 @@
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from photometadata.models import PhotoMetadata
+
+# Серверы для режима --compare: синхронный WSGI без настроек (прежний docker-compose), WSGI с gunicorn.conf.py
+# (потоки gthread, preload, постоянные соединения с БД) и ASGI на uvicorn; число воркеров у всех одно (--workers)
+SERVERS = {
+    'wsgi-sync': ['photoweb_project.wsgi:application'],
+    'wsgi-tuned': ['photoweb_project.wsgi:application', '-c', 'gunicorn.conf.py'],
+    'asgi-uvicorn': ['photoweb_project.asgi:application', '-k', 'uvicorn.workers.UvicornWorker'],
+}
+DEFAULT_PATHS = ['/ajax/view/?limit=20', '/ajax/get/{id}/']
+SLOW_PATH = '/export/?format=csv'
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест AJAX API: N параллельных клиентов, пропускная способность и задержки. "
+        "С --compare сам запускает синхронный (WSGI), настроенный (gunicorn.conf.py) и ASGI-сервер "
+        "и сравнивает их."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Адрес уже запущенного сервера")
+        parser.add_argument('--path', action='append', dest='paths',
+                            help="GET-путь (можно несколько; {id} — случайный id из БД)")
+        parser.add_argument('--concurrency', type=int, default=32, help="Параллельных клиентов")
+        parser.add_argument('--requests', type=int, default=2000, help="Всего запросов")
+        parser.add_argument('--slow', type=int, default=0,
+                            help=f"Сколько медленных запросов ({SLOW_PATH}) держать открытыми во время теста")
+        parser.add_argument('--compare', action='store_true',
+                            help="Запустить и сравнить wsgi-sync, wsgi-tuned и asgi-uvicorn")
+        parser.add_argument('--workers', type=int, default=3, help="Воркеров gunicorn в режиме --compare")
+        parser.add_argument('--port', type=int, default=8101, help="Первый порт для серверов --compare")
+        parser.add_argument('--json', action='store_true', help="Вывести результат в JSON")
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or DEFAULT_PATHS
+        ids = list(PhotoMetadata.objects.values_list('id', flat=True)[:10000])
+        if any('{id}' in p for p in paths) and not ids:
+            raise CommandError("В БД нет записей для путей с {id} (см. import_photos).")
+
+        results = {}
+        if options['compare']:
+            for offset, (name, app) in enumerate(SERVERS.items()):
+                port = options['port'] + offset
+                with self._server(app, port, options['workers']):
+                    results[name] = self._run(f'http://127.0.0.1:{port}', paths, ids, options)
+        else:
+            results[options['url']] = self._run(options['url'], paths, ids, options)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, r in results.items():
+            self.stdout.write(
+                f"{name}: {r['requests']} запросов, ошибок {r['errors']}, {r['rps']:.0f} запр/с, "
+                f"p50 {r['p50_ms']:.1f} мс, p95 {r['p95_ms']:.1f} мс, p99 {r['p99_ms']:.1f} мс"
+            )
+
+    # ---- серверы для --compare ----
+    def _server(self, app, port, workers):
+        command = [sys.executable, '-m', 'gunicorn', *app, '--workers', str(workers),
+                   '--bind', f'127.0.0.1:{port}', '--log-level', 'warning']
+        return _ServerProcess(command, port, cwd=settings.BASE_DIR)
+
+    # ---- нагрузка ----
+    def _run(self, base_url, paths, ids, options):
+        parts = urlsplit(base_url)
+        stop = threading.Event()
+        slow_threads = [
+            threading.Thread(target=_slow_client, args=(parts, stop), daemon=True)
+            for _ in range(options['slow'])
+        ]
+        for t in slow_threads:
+            t.start()
+        if slow_threads:
+            time.sleep(0.5)   # медленные запросы должны успеть занять воркеры
+
+        local = threading.local()
+        latencies = []
+        errors = 0
+        lock = threading.Lock()
+
+        def one(_):
+            nonlocal errors
+            path = random.choice(paths).replace('{id}', str(random.choice(ids)) if ids else '')
+            started = time.perf_counter()
+            try:
+                if not hasattr(local, 'conn'):
+                    local.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+                local.conn.request('GET', path)
+                response = local.conn.getresponse()
+                response.read()
+                ok = response.status < 500
+            except (OSError, http.client.HTTPException):
+                local.__dict__.pop('conn', None)
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                errors += not ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            list(pool.map(one, range(options['requests'])))
+        total = time.perf_counter() - started
+        stop.set()
+
+        ms = [x * 1000 for x in latencies]
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'seconds': round(total, 3),
+            'rps': len(latencies) / total if total else 0,
+            'p50_ms': _percentile(ms, 50),
+            'p95_ms': _percentile(ms, 95),
+            'p99_ms': _percentile(ms, 99),
+        }
+
+
+def _slow_client(parts, stop):
+    """Держит открытым медленный запрос (потоковый экспорт), читая ответ понемногу."""
+    while not stop.is_set():
+        try:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+            conn.request('GET', SLOW_PATH)
+            response = conn.getresponse()
+            while not stop.is_set() and response.read(4096):
+                time.sleep(0.05)
+            conn.close()
+        except (OSError, http.client.HTTPException):
+            time.sleep(0.1)
+
+
+class _ServerProcess:
+    """gunicorn в дочернем процессе: ждёт открытия порта, при выходе останавливается."""
+
+    def __init__(self, command, port, cwd):
+        self.command = command
+        self.port = port
+        self.cwd = cwd
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.command, cwd=self.cwd, env=os.environ.copy())
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError(f"Сервер не запустился: {' '.join(self.command)}")
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=0.5).close()
+                return self
+            except OSError:
+                time.sleep(0.2)
+        self.process.kill()
+        raise CommandError(f"Сервер не открыл порт {self.port} за 30 с")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
@@ -0,0 +1,140 @@
+import json
+import os
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+
+from photometadata import metrics
+from photometadata.management.commands.loadtest import DEFAULT_PATHS
+from photometadata.models import PhotoMetadata
+from photoweb_project.tuning import cpu_count, recommend
+
+# Представление со средним временем ответа дольше этого (сек) — потоковый ответ или медленный клиент:
+# всё его время поток ждёт, а не считает
+SLOW_SECONDS = 1.0
+# Переменные окружения gunicorn.conf.py / settings.py для рекомендованных настроек
+ENV_NAMES = {
+    'worker_class': 'GUNICORN_WORKER_CLASS',
+    'workers': 'GUNICORN_WORKERS',
+    'threads': 'GUNICORN_THREADS',
+    'preload_app': 'GUNICORN_PRELOAD',
+    'timeout': 'GUNICORN_TIMEOUT',
+    'graceful_timeout': 'GUNICORN_GRACEFUL_TIMEOUT',
+    'keepalive': 'GUNICORN_KEEPALIVE',
+    'max_requests': 'GUNICORN_MAX_REQUESTS',
+    'max_requests_jitter': 'GUNICORN_MAX_REQUESTS_JITTER',
+    'conn_max_age': 'DB_CONN_MAX_AGE',
+    'conn_health_checks': 'DB_CONN_HEALTH_CHECKS',
+}
+
+
+def wait_fraction(views):
+    """Доля времени запросов без процессора: SQL, а у медленных представлений — всё время ответа."""
+    total = sum(view['seconds'] for view in views.values())
+    if not total:
+        return None
+    waiting = 0.0
+    for view in views.values():
+        slow = view['requests'] and view['seconds'] / view['requests'] >= SLOW_SECONDS
+        waiting += view['seconds'] if slow else min(view['db_seconds'], view['seconds'])
+    return waiting / total
+
+
+class Command(BaseCommand):
+    help = (
+        "Подбирает настройки gunicorn (воркеры, потоки gthread, класс воркера, preload, постоянные "
+        "соединения с БД) по числу CPU и измеренной смеси запросов: метрикам работающего сервера "
+        "(/metrics) или выборке запросов, выполненной здесь же (--sample). Выводит переменные для .env."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sample', type=int, default=0,
+                            help="Выполнить столько запросов в процессе команды и мерить по ним, "
+                                 "а не по метрикам сервера (без метрик — 200)")
+        parser.add_argument('--path', action='append', dest='paths',
+                            help="GET-путь для --sample (можно несколько; {id} — случайный id из БД)")
+        parser.add_argument('--cpus', type=int, help="Число CPU целевой машины (по умолчанию — этой)")
+        parser.add_argument('--asgi', action='store_true',
+                            help="Для ASGI (uvicorn-воркеры); по умолчанию — по GUNICORN_APP")
+        parser.add_argument('--json', action='store_true', help="Вывести результат в JSON")
+
+    def handle(self, *args, **options):
+        if options['cpus'] is not None and options['cpus'] < 1:
+            raise CommandError("--cpus должно быть больше 0.")
+        source = 'metrics'
+        views = metrics.view_totals(metrics.collect()) if not options['sample'] else {}
+        if not views:
+            source = 'sample'
+            views = self._sample(options['sample'] or 200, options['paths'] or DEFAULT_PATHS)
+
+        cpus = options['cpus'] or cpu_count()
+        asgi = options['asgi'] or 'asgi' in os.environ.get('GUNICORN_APP', '')
+        wait = wait_fraction(views)
+        tuned = recommend(cpus, wait, asgi=asgi)
+        connections = tuned['workers'] * tuned['threads'] if tuned['conn_max_age'] else None
+        result = {
+            'cpus': cpus,
+            'source': source,
+            'requests': sum(view['requests'] for view in views.values()),
+            'wait_fraction': wait,
+            'views': views,
+            'settings': tuned,
+            'env': {ENV_NAMES[key]: _env_value(value) for key, value in tuned.items()},
+            'db_connections': connections,
+            'db_max_connections': _max_connections(),
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(result, indent=2))
+            return
+        origin = 'метрики сервера' if source == 'metrics' else 'выборка'
+        self.stdout.write(f"CPU: {cpus}; запросов: {result['requests']} ({origin})")
+        for name, view in sorted(views.items(), key=lambda item: -item[1]['seconds']):
+            mean = view['seconds'] / view['requests'] * 1000 if view['requests'] else 0
+            db = view['db_seconds'] / view['seconds'] * 100 if view['seconds'] else 0
+            self.stdout.write(f"  {name}: {view['requests']} запросов, в среднем {mean:.1f} мс, SQL {db:.0f}%")
+        if wait is None:
+            self.stdout.write("Доля ожидания не измерена — взята по умолчанию")
+        else:
+            self.stdout.write(f"Доля ожидания (SQL, медленные ответы): {wait * 100:.0f}%")
+        self.stdout.write("Рекомендуемые настройки (.env):")
+        for name, value in result['env'].items():
+            self.stdout.write(f"{name}={value}")
+        if connections:
+            self.stdout.write(f"Постоянных соединений с БД: до {connections} (воркеры × потоки)")
+            if result['db_max_connections'] and connections >= result['db_max_connections']:
+                self.stdout.write(self.style.WARNING(
+                    f"max_connections сервера БД ({result['db_max_connections']}) не больше числа соединений: "
+                    f"уменьшите GUNICORN_WORKERS/GUNICORN_THREADS или поставьте пул (pgbouncer)"
+                ))
+
+    def _sample(self, count, paths):
+        ids = list(PhotoMetadata.objects.values_list('id', flat=True)[:10000])
+        if any('{id}' in p for p in paths) and not ids:
+            raise CommandError("В БД нет записей для путей с {id} (см. import_photos).")
+        metrics.registry.detach()
+        client = Client()
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for _ in range(count):
+                path = random.choice(paths).replace('{id}', str(random.choice(ids)) if ids else '')
+                response = client.get(path)
+                if getattr(response, 'streaming', False):
+                    b''.join(response.streaming_content)
+        return metrics.view_totals(metrics.collect_local())
+
+
+def _env_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return str(value)
+
+
+def _max_connections():
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SHOW max_connections')
+        return int(cursor.fetchone()[0])
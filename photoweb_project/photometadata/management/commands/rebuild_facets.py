@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from photometadata.facets import rebuild_facet_counts
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает таблицу счётчиков фасетов (FacetCount) по всей БД."
+
+    def handle(self, *args, **options):
+        rebuild_facet_counts()
+        self.stdout.write(self.style.SUCCESS("Счётчики фасетов пересчитаны."))
@@ -0,0 +1,70 @@
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from photometadata.changes import compact_changes
+from photometadata.jobs import claim_next, run_job
+from photometadata.snapshot import current_manifest, full_build_pending
+
+
+class Command(BaseCommand):
+    help = (
+        "Воркер фоновых задач загрузки (очередь в БД, см. photometadata/jobs.py). "
+        "Записи проверяются в пуле процессов; можно запускать несколько воркеров одновременно."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help="Процессов для проверки записей (1 — без пула)")
+        parser.add_argument('--poll', type=float, default=1.0, help="Пауза при пустой очереди (сек)")
+        parser.add_argument('--once', action='store_true', help="Выполнить задачи из очереди и выйти")
+        parser.add_argument('--compact-every', type=float, default=3600,
+                            help="Как часто сжимать журнал изменений в простое (сек; 0 — не сжимать)")
+
+    def handle(self, *args, **options):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        stopping = False
+
+        def stop(signum, frame):
+            nonlocal stopping
+            stopping = True
+            self.stdout.write("Остановка после текущей задачи…")
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        executor = None
+        if options['processes'] > 1:
+            # spawn: дочерние процессы не наследуют соединения с БД родителя
+            executor = ProcessPoolExecutor(options['processes'], mp_context=multiprocessing.get_context('spawn'))
+        self.stdout.write(f"Воркер {worker} запущен (процессов проверки: {options['processes']})")
+        compacted_at = time.monotonic()
+        try:
+            while not stopping:
+                close_old_connections()
+                job = claim_next(worker)
+                if job is None:
+                    if options['once']:
+                        break
+                    if full_build_pending():
+                        # полная сборка снимка не делается в запросе (ajax/snapshot/ отвечает 503)
+                        manifest = current_manifest()
+                        self.stdout.write(f"Снимок {manifest['version']} собран: записей {manifest['rows']}")
+                    if options['compact_every'] and time.monotonic() - compacted_at >= options['compact_every']:
+                        compacted_at = time.monotonic()
+                        superseded, expired = compact_changes()
+                        self.stdout.write(f"Журнал изменений сжат: перекрытых {superseded}, удалений {expired}")
+                    time.sleep(options['poll'])
+                    continue
+                self.stdout.write(f"Задача #{job.pk} ({job.kind}, {job.source_name})…")
+                job = run_job(job, executor)
+                self.stdout.write(f"Задача #{job.pk}: {job.status} — {job.message}")
+        finally:
+            if executor is not None:
+                executor.shutdown()
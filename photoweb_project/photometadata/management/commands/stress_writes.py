@@ -0,0 +1,286 @@
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from photometadata.bulk import IMPORT_FIELDS, import_batch
+from photometadata.ingest import IngestReport
+from photometadata.models import PhotoMetadata
+from photometadata.synthetic import generate_photos
+
+# SQLite-база теста — файл: её открывают все процессы
+STRESS_SQLITE_NAME = os.path.join(tempfile.gettempdir(), 'photometadata-stress.sqlite3')
+STORES = ['photometadata.storage.JsonArrayStore', 'photometadata.storage.JsonlSegmentStore']
+# записей в одной дозаписи в хранилище
+APPEND_BATCH = 5
+# зерна: записи БД, «общее» содержимое для гонки дублей, дозаписи процессов — дальше
+SEED_DB, SEED_DUPLICATE, SEED_APPEND = 0, 1, 100
+BARRIER_TIMEOUT = 120
+
+
+def _overrides():
+    # без кеша записей: db_get_ajax каждого процесса читает из БД свежую версию
+    return override_settings(
+        DEBUG=False,
+        ALLOWED_HOSTS=['testserver'],
+        CACHES={alias: {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'} for alias in settings.CACHES},
+        PHOTO_BACKGROUND_UPLOADS=False,
+        PHOTO_METRICS=False,
+    )
+
+
+# --------------------
+# Задачи дочерних процессов (spawn: модуль импортируется после django.setup из initializer)
+# --------------------
+_worker_ready = False
+
+
+def _prepare_worker(db_name):
+    """Один раз на процесс: та же тестовая БД и те же настройки, что у родителя."""
+    global _worker_ready
+    if not _worker_ready:
+        settings.DATABASES['default']['NAME'] = db_name
+        connection.settings_dict['NAME'] = db_name
+        _overrides().enable()
+        _worker_ready = True
+
+
+def _edit_worker(barrier, db_name, ids, edits, seed):
+    """Редактор: читает запись (db_get_ajax) и сохраняет правку с её версией (db_update_ajax)."""
+    _prepare_worker(db_name)
+    client = Client()
+    rng = random.Random(seed)
+    statuses, saved = Counter(), Counter()
+    barrier.wait(BARRIER_TIMEOUT)
+    started = time.time()
+    for i in range(edits):
+        pk = rng.choice(ids)
+        item = client.get(reverse('photometadata:db_get_ajax', args=[pk])).json()
+        body = {field: item[field] for field in IMPORT_FIELDS}
+        body['description'] = f"stress edit {seed}-{i}"
+        body['version'] = item['version']
+        response = client.post(reverse('photometadata:db_update_ajax', args=[pk]), json.dumps(body),
+                               content_type='application/json')
+        statuses[response.status_code] += 1
+        if response.status_code == 200:
+            saved[pk] += 1
+    return {'statuses': statuses, 'saved': saved, 'started': started, 'finished': time.time()}
+
+
+def _duplicate_worker(barrier, db_name, pk, record):
+    """Одновременно с другими приводит свою запись pk к одному и тому же содержимому record."""
+    _prepare_worker(db_name)
+    client = Client()
+    item = client.get(reverse('photometadata:db_get_ajax', args=[pk])).json()
+    body = dict(record, version=item['version'])
+    barrier.wait(BARRIER_TIMEOUT)
+    response = client.post(reverse('photometadata:db_update_ajax', args=[pk]), json.dumps(body),
+                           content_type='application/json')
+    return response.status_code
+
+
+def _append_worker(barrier, store_path, root, count, seed):
+    """Дописывает count новых записей в хранилище по APPEND_BATCH."""
+    store = import_string(store_path)(root)
+    records = list(generate_photos(count, seed))
+    added = 0
+    barrier.wait(BARRIER_TIMEOUT)
+    started = time.time()
+    for i in range(0, count, APPEND_BATCH):
+        added += store.append(records[i:i + APPEND_BATCH])[1]
+    return {'added': added, 'started': started, 'finished': time.time()}
+
+
+class Command(BaseCommand):
+    help = (
+        "Стресс-тест одновременных изменений из нескольких процессов: правки одних и тех же записей "
+        "(нет потерянных обновлений), гонка к одинаковому содержимому (нет дублей) и дозапись "
+        "в файловые хранилища (файлы целы, записи не теряются). Работает на отдельной тестовой БД."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4, help="Параллельных процессов-писателей")
+        parser.add_argument('--rows', type=int, default=5,
+                            help="Сколько записей правят одновременно (меньше — больше конфликтов)")
+        parser.add_argument('--edits', type=int, default=50, help="Правок на процесс")
+        parser.add_argument('--rounds', type=int, default=10, help="Раундов гонки к одинаковому содержимому")
+        parser.add_argument('--appends', type=int, default=100, help="Записей в хранилище на процесс")
+        parser.add_argument('--json', action='store_true', help="Вывести результат в JSON")
+
+    def handle(self, *args, **options):
+        if options['processes'] < 2:
+            raise CommandError("--processes: нужно хотя бы два процесса.")
+        self.options = options
+        context = multiprocessing.get_context('spawn')
+        failures = []
+        with self._environment() as db_name, context.Manager() as manager:
+            self.manager = manager
+            with ProcessPoolExecutor(options['processes'], mp_context=context, initializer=django.setup) as pool:
+                self.pool = pool
+                report = {
+                    'edits': self._edits(db_name, failures),
+                    'duplicates': self._duplicates(db_name, failures),
+                    'stores': self._stores(failures),
+                }
+        report['failures'] = failures
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+        else:
+            for name, runs in report['edits'].items():
+                self.stdout.write(
+                    f"правки, {name}: {runs['ops_per_sec']:.0f} запросов/с, сохранено {runs['saved']}, "
+                    f"конфликтов (409) {runs['conflicts']}"
+                )
+            dup = report['duplicates']
+            self.stdout.write(f"гонка дублей: раундов {dup['rounds']}, принято {dup['accepted']}, "
+                              f"отклонено (409) {dup['rejected']}")
+            for name, runs in report['stores'].items():
+                self.stdout.write(f"{name}: {runs['records_per_sec']:.0f} записей/с, "
+                                  f"записей в файлах {runs['records']} из {runs['expected']}")
+            for failure in failures:
+                self.stderr.write(self.style.ERROR(failure))
+        if failures:
+            raise CommandError(f"Нарушений: {len(failures)}")
+        if not options['json']:
+            self.stdout.write(self.style.SUCCESS("Потерянных обновлений, дублей и повреждённых файлов нет."))
+
+    def _log(self, text):
+        # при --json в stdout только результат
+        (self.stderr if self.options['json'] else self.stdout).write(text)
+
+    @contextlib.contextmanager
+    def _environment(self):
+        settings_dict = connection.settings_dict
+        old_name = settings_dict['NAME']
+        test = settings_dict.setdefault('TEST', {})
+        if not test.get('NAME'):
+            test['NAME'] = STRESS_SQLITE_NAME if connection.vendor == 'sqlite' else f"{old_name}_stress"
+        db_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with _overrides():
+                # дочерние процессы открывают свои соединения
+                connection.close()
+                yield db_name
+        finally:
+            connection.close()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _run(self, fn, args_list):
+        # все задачи стартуют одновременно: ждут друг друга на общем барьере
+        barrier = self.manager.Barrier(len(args_list))
+        futures = [self.pool.submit(fn, barrier, *args) for args in args_list]
+        return [future.result() for future in futures]
+
+    # ---- правки одних и тех же записей ----
+    def _edits(self, db_name, failures):
+        o = self.options
+        PhotoMetadata.objects.all().delete()
+        import_batch(list(generate_photos(o['rows'], SEED_DB)), IngestReport(), 1, False)
+        ids = list(PhotoMetadata.objects.values_list('id', flat=True))
+        versions = dict(PhotoMetadata.objects.values_list('id', 'version'))
+        results = {}
+        for writers in (1, o['processes']):
+            self._log(f"Правки: {writers} процесс(ов) × {o['edits']}…")
+            runs = self._run(_edit_worker, [
+                (db_name, ids, o['edits'], writers * 1000 + n) for n in range(writers)
+            ])
+            statuses, saved = Counter(), Counter()
+            for run in runs:
+                statuses.update(run['statuses'])
+                saved.update(run['saved'])
+            # каждое принятое сохранение увеличивает версию ровно на 1: иначе чьё-то обновление потеряно
+            for pk, version in PhotoMetadata.objects.values_list('id', 'version'):
+                if version != versions[pk] + saved[pk]:
+                    failures.append(f"правки: запись {pk} — версия {version}, ожидалась {versions[pk] + saved[pk]}")
+                versions[pk] = version
+            unexpected = {code: n for code, n in statuses.items() if code not in (200, 409)}
+            if unexpected:
+                failures.append(f"правки: неожиданные ответы {unexpected}")
+            seconds = max(r['finished'] for r in runs) - min(r['started'] for r in runs)
+            results[f'{writers}_writers'] = {
+                'requests': sum(statuses.values()),
+                'saved': statuses[200],
+                'conflicts': statuses[409],
+                'seconds': round(seconds, 3),
+                'ops_per_sec': round(sum(statuses.values()) / seconds, 1) if seconds else 0,
+            }
+        return results
+
+    # ---- гонка к одинаковому содержимому ----
+    def _duplicates(self, db_name, failures):
+        o = self.options
+        PhotoMetadata.objects.all().delete()
+        import_batch(list(generate_photos(o['processes'], SEED_DB)), IngestReport(), 1, False)
+        ids = list(PhotoMetadata.objects.values_list('id', flat=True))
+        targets = generate_photos(o['rounds'], SEED_DUPLICATE)
+        self._log(f"Гонка дублей: {o['processes']} процесс(ов) × {o['rounds']} раундов…")
+        accepted = rejected = 0
+        for round_no, target in enumerate(targets, 1):
+            codes = Counter(self._run(_duplicate_worker, [(db_name, pk, target) for pk in ids]))
+            if codes[200] > 1:
+                failures.append(f"дубли: раунд {round_no} — одинаковое содержимое сохранили {codes[200]} раз(а)")
+            unexpected = {code: n for code, n in codes.items() if code not in (200, 409)}
+            if unexpected:
+                failures.append(f"дубли: раунд {round_no} — неожиданные ответы {unexpected}")
+            accepted += codes[200]
+            rejected += codes[409]
+        repeated = (
+            PhotoMetadata.objects.exclude(content_hash='').values('content_hash')
+            .annotate(n=Count('id')).filter(n__gt=1).count()
+        )
+        if repeated:
+            failures.append(f"дубли: в БД {repeated} повторяющихся отпечатков content_hash")
+        return {'rounds': o['rounds'], 'accepted': accepted, 'rejected': rejected}
+
+    # ---- дозапись в файловые хранилища ----
+    def _stores(self, failures):
+        o = self.options
+        results = {}
+        for store_path in STORES:
+            name = store_path.rsplit('.', 1)[1]
+            for writers in (1, o['processes']):
+                self._log(f"{name}: {writers} процесс(ов) × {o['appends']} записей…")
+                root = tempfile.mkdtemp(prefix='photometadata-stress-')
+                try:
+                    runs = self._run(_append_worker, [
+                        (store_path, root, o['appends'], SEED_APPEND + n) for n in range(writers)
+                    ])
+                    expected = writers * o['appends']
+                    store = import_string(store_path)(root)
+                    # iter_records разбирает каждый файл целиком: испорченный JSON — исключение
+                    try:
+                        records = sum(1 for f in store.list_files() for _ in store.iter_records(f))
+                    except ValueError as e:
+                        failures.append(f"{name}: файл повреждён — {e}")
+                        records = 0
+                    added = sum(r['added'] for r in runs)
+                    if records != expected or added != expected:
+                        failures.append(f"{name}, {writers} процесс(ов): в файлах {records} записей, "
+                                        f"добавлено {added}, ожидалось {expected}")
+                finally:
+                    shutil.rmtree(root, ignore_errors=True)
+                seconds = max(r['finished'] for r in runs) - min(r['started'] for r in runs)
+                results[f'{name}[{writers}_writers]'] = {
+                    'expected': expected,
+                    'records': records,
+                    'seconds': round(seconds, 3),
+                    'records_per_sec': round(expected / seconds, 1) if seconds else 0,
+                }
+        return results
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from photometadata.models import PhotoMetadata
+from photometadata.tags import sync_photo_tags
+
+
+class Command(BaseCommand):
+    help = "Пересобирает таблицы Tag/PhotoTag из CSV-поля tags (после включения PHOTO_NORMALIZED_TAGS)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch = []
+        done = 0
+        for row in PhotoMetadata.objects.values('id', 'tags').order_by('id').iterator(chunk_size=options['batch_size']):
+            batch.append(row)
+            if len(batch) >= options['batch_size']:
+                sync_photo_tags(batch)
+                done += len(batch)
+                batch = []
+        if batch:
+            sync_photo_tags(batch)
+            done += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"Теги пересобраны для {done} записей."))
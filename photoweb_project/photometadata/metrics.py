@@ -0,0 +1,373 @@
+import contextlib
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+try:
+    import fcntl
+except ImportError:  # Windows: межпроцессной блокировки нет — файлы завершившихся процессов вливаются без неё
+    fcntl = None
+
+# Границы корзин гистограмм
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+# Как часто процесс сбрасывает свои метрики в METRICS_DIR (сек); /metrics сбрасывает свои сразу
+FLUSH_INTERVAL = 2.0
+# Общий каталог процессов одного хоста/контейнера: worker-<pid>.json на каждый процесс
+METRICS_DIR = getattr(settings, 'PHOTO_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'photometadata-metrics'))
+# Сюда вливаются счётчики завершившихся процессов, чтобы суммы не убывали
+RETIRED_FILE = 'retired.json'
+
+# (тип, описание) экспортируемых метрик
+METRICS = {
+    'photometadata_http_request_duration_seconds': ('histogram', 'Время обработки запроса по представлению'),
+    'photometadata_http_request_db_queries': ('histogram', 'Число SQL-запросов на HTTP-запрос'),
+    'photometadata_http_request_db_seconds_total': ('counter', 'Суммарное время SQL-запросов'),
+    'photometadata_http_response_bytes_total': ('counter', 'Байт в телах ответов'),
+    'photometadata_json_io_bytes_total': ('counter', 'Байт, прочитанных/записанных в JSON-файлы хранилища'),
+    'photometadata_search_cache_total': ('counter', 'Поиски по исходу: из кеша, сужением префикса, из БД, '
+                                                    'ожиданием такого же запроса'),
+    'photometadata_metrics_processes': ('gauge', 'Процессов, чьи метрики вошли в сумму'),
+}
+
+
+# --------------------
+# Счётчики текущего запроса
+# --------------------
+class RequestStats:
+    __slots__ = ('queries', 'db_seconds', 'json_read', 'json_write', 'response_bytes', 'search_cache')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.json_read = 0
+        self.json_write = 0
+        self.response_bytes = 0
+        self.search_cache = None
+
+
+# contextvar, а не thread-local: asgiref копирует контекст в поток sync_to_async,
+# поэтому запросы асинхронных представлений к БД тоже попадают в статистику запроса
+_current = contextvars.ContextVar('photometadata_request_stats', default=None)
+
+
+def current_stats():
+    return _current.get()
+
+
+def activate(stats):
+    return _current.set(stats)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def count_json_io(direction, nbytes):
+    """Учитывает чтение ('read') или запись ('write') nbytes байт JSON-хранилища в текущем запросе."""
+    stats = _current.get()
+    if stats is not None and nbytes:
+        if direction == 'read':
+            stats.json_read += nbytes
+        else:
+            stats.json_write += nbytes
+
+
+def count_search_cache(result):
+    """Исход поиска текущего запроса: 'hit', 'refined', 'miss' или 'coalesced' (см. search_cache.py)."""
+    stats = _current.get()
+    if stats is not None:
+        stats.search_cache = result
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def install_db_wrapper(sender, connection, **kwargs):
+    # то же, что connection.execute_wrapper(), но на всё время жизни соединения
+    # (в каждом потоке своё соединение; сигнал приходит при каждом подключении)
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+# --------------------
+# Реестр метрик процесса
+# --------------------
+class Registry:
+    """
+    Счётчики и гистограммы одного процесса. Ключ — (имя, кортеж пар меток).
+    Гистограмма хранится как [число в каждой корзине..., в +Inf, сумма, количество].
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.counters = {}
+        self.histograms = {}
+        self.buckets = {}
+        self.flushed_at = 0.0
+        self.dirty = False
+        self.flusher = None
+        self.detached = False
+
+    def _check_fork(self):
+        # после fork (gunicorn --preload) дочерний процесс не должен повторять счётчики родителя
+        if self.pid != os.getpid():
+            self._reset()
+
+    def _changed(self):
+        self.dirty = True
+        if self.flusher is None:
+            # досбрасывает последние данные процесса, который перестал получать запросы
+            self.flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+            self.flusher.start()
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self.pid == pid:
+            time.sleep(FLUSH_INTERVAL)
+            if self.dirty:
+                self.flush(force=True)
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self._check_fork()
+            self._changed()
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        with self._lock:
+            self._check_fork()
+            self._changed()
+            key = (name, labels)
+            data = self.histograms.get(key)
+            if data is None:
+                data = self.histograms[key] = [0] * (len(buckets) + 3)
+                self.buckets[name] = buckets
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    data[i] += 1
+                    break
+            else:
+                data[len(buckets)] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def detach(self):
+        """Не сбрасывать метрики процесса в METRICS_DIR: замеры команды не смешиваются с метриками сервера."""
+        with self._lock:
+            self._check_fork()
+            self.detached = True
+
+    def snapshot(self):
+        with self._lock:
+            self._check_fork()
+            self.dirty = False
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [
+                    [name, list(labels), list(self.buckets[name]), list(data)]
+                    for (name, labels), data in self.histograms.items()
+                ],
+            }
+
+    def flush(self, force=False):
+        """
+        Сбрасывает снимок в METRICS_DIR/worker-<pid>.json (атомарно); без force — не чаще FLUSH_INTERVAL
+        (остальное досбросит фоновый поток).
+        """
+        if self.detached:
+            return
+        now = time.monotonic()
+        if not force and now - self.flushed_at < FLUSH_INTERVAL:
+            return
+        self.flushed_at = now
+        _write_json(os.path.join(METRICS_DIR, f'worker-{os.getpid()}.json'), self.snapshot())
+
+
+registry = Registry()
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'w') as out:
+        json.dump(data, out)
+    os.replace(tmp, path)
+
+
+def observe_request(view, method, status, seconds, stats):
+    labels = (('view', view),)
+    registry.observe('photometadata_http_request_duration_seconds',
+                     labels + (('method', method), ('status', str(status))), seconds, LATENCY_BUCKETS)
+    registry.observe('photometadata_http_request_db_queries', labels, stats.queries, QUERY_BUCKETS)
+    registry.inc('photometadata_http_request_db_seconds_total', labels, stats.db_seconds)
+    registry.inc('photometadata_http_response_bytes_total', labels, stats.response_bytes)
+    if stats.json_read:
+        registry.inc('photometadata_json_io_bytes_total', labels + (('direction', 'read'),), stats.json_read)
+    if stats.json_write:
+        registry.inc('photometadata_json_io_bytes_total', labels + (('direction', 'write'),), stats.json_write)
+    if stats.search_cache:
+        registry.inc('photometadata_search_cache_total', (('result', stats.search_cache),))
+    registry.flush()
+
+
+# --------------------
+# Сбор по всем процессам и формат Prometheus
+# --------------------
+def _merge(total, snapshot):
+    for name, labels, value in snapshot.get('counters', []):
+        key = (name, tuple(tuple(pair) for pair in labels))
+        total['counters'][key] = total['counters'].get(key, 0) + value
+    for name, labels, buckets, data in snapshot.get('histograms', []):
+        key = (name, tuple(tuple(pair) for pair in labels))
+        total['buckets'][name] = buckets
+        current = total['histograms'].get(key)
+        total['histograms'][key] = data if current is None else [a + b for a, b in zip(current, data)]
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _as_snapshot(total):
+    return {
+        'counters': [[name, list(labels), value] for (name, labels), value in total['counters'].items()],
+        'histograms': [
+            [name, list(labels), total['buckets'][name], data] for (name, labels), data in total['histograms'].items()
+        ],
+    }
+
+
+@contextlib.contextmanager
+def _locked():
+    # каталога ещё нет, если процесс ничего не сбрасывал (detach, первый запрос к /metrics)
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(METRICS_DIR, '.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def collect():
+    """
+    Сумма метрик всех процессов из METRICS_DIR. Файлы завершившихся процессов вливаются
+    в RETIRED_FILE (под блокировкой), поэтому счётчики не уменьшаются при перезапуске воркеров.
+    """
+    registry.flush(force=True)
+    empty = lambda: {'counters': {}, 'histograms': {}, 'buckets': {}}  # noqa: E731
+    total = empty()
+    processes = 0
+    with _locked():
+        retired_path = os.path.join(METRICS_DIR, RETIRED_FILE)
+        retired = empty()
+        if os.path.exists(retired_path):
+            with open(retired_path) as fh:
+                _merge(retired, json.load(fh))
+        retired_changed = False
+        for name in os.listdir(METRICS_DIR):
+            if not (name.startswith('worker-') and name.endswith('.json')):
+                continue
+            path = os.path.join(METRICS_DIR, name)
+            try:
+                with open(path) as fh:
+                    snapshot = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            if _alive(int(name[len('worker-'):-len('.json')])):
+                _merge(total, snapshot)
+                processes += 1
+            else:
+                _merge(retired, snapshot)
+                os.remove(path)
+                retired_changed = True
+        if retired_changed:
+            _write_json(retired_path, _as_snapshot(retired))
+    _merge(total, _as_snapshot(retired))
+    total['processes'] = processes
+    return total
+
+
+def collect_local():
+    """Метрики только текущего процесса в формате collect() (manage.py perf_profile --sample)."""
+    total = {'counters': {}, 'histograms': {}, 'buckets': {}}
+    _merge(total, registry.snapshot())
+    total['processes'] = 1
+    return total
+
+
+def view_totals(total):
+    """По представлениям из collect(): {view: {'requests', 'seconds', 'db_seconds'}} — смесь нагрузки."""
+    views = {}
+    for (name, labels), data in total['histograms'].items():
+        if name == 'photometadata_http_request_duration_seconds':
+            view = views.setdefault(dict(labels)['view'], {'requests': 0, 'seconds': 0.0, 'db_seconds': 0.0})
+            view['requests'] += data[-1]
+            view['seconds'] += data[-2]
+    for (name, labels), value in total['counters'].items():
+        if name == 'photometadata_http_request_db_seconds_total' and dict(labels)['view'] in views:
+            views[dict(labels)['view']]['db_seconds'] += value
+    return views
+
+
+def _labels(pairs):
+    def escape(value):
+        return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(total):
+    """Текстовый формат Prometheus (version 0.0.4)."""
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if name == 'photometadata_metrics_processes':
+            lines.append(f"{name} {total['processes']}")
+            continue
+        if kind == 'histogram':
+            buckets = total['buckets'].get(name, ())
+            for labels, data in sorted((k[1], v) for k, v in total['histograms'].items() if k[0] == name):
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ['+Inf'], data[:len(buckets) + 1]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f'{name}_sum{_labels(labels)} {_number(data[-2])}')
+                lines.append(f'{name}_count{_labels(labels)} {data[-1]}')
+        else:
+            for labels, value in sorted((k[1], v) for k, v in total['counters'].items() if k[0] == name):
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,196 @@
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import tempfile
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.decorators import sync_and_async_middleware
+
+from . import metrics
+
+# Заголовок запроса, включающий профилирование (при settings.PHOTO_PROFILE):
+# любое значение — профиль сохраняется в PROFILE_DIR, 'text' — вместо ответа отдаётся сводка pstats
+PROFILE_HEADER = 'X-Profile'
+PROFILE_DIR = getattr(settings, 'PHOTO_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'photometadata-profiles'))
+PROFILE_TOP = 40
+# Сколько последних профилей хранить в PROFILE_DIR (старые удаляются при сохранении нового)
+PROFILE_KEEP = getattr(settings, 'PHOTO_PROFILE_KEEP', 100)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else '<unresolved>'
+
+
+# --------------------
+# Профилирование по заголовку
+# --------------------
+def _start_profile(request):
+    if not getattr(settings, 'PHOTO_PROFILE', False) or PROFILE_HEADER not in request.headers:
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # в потоке уже профилируется другой (асинхронный) запрос — профилировщик в потоке один
+        return None
+    return profiler
+
+
+def _finish_profile(request, response, profiler):
+    """
+    Сохраняет профиль (.prof, открывается snakeviz/pstats) и ставит X-Profile-File.
+    Для асинхронных представлений профиль охватывает поток цикла событий, а не потоки sync_to_async.
+    """
+    profiler.disable()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{_view_name(request).replace(':', '-')}-{uuid.uuid4().hex[:6]}.prof"
+    profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+    _rotate_profiles()
+    if request.headers[PROFILE_HEADER].lower() == 'text':
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(PROFILE_TOP)
+        response = HttpResponse(out.getvalue(), content_type='text/plain; charset=utf-8')
+    response['X-Profile-File'] = name
+    return response
+
+
+def _rotate_profiles():
+    profiles = []
+    for entry in os.scandir(PROFILE_DIR):
+        if entry.name.endswith('.prof'):
+            with contextlib.suppress(FileNotFoundError):
+                profiles.append((entry.stat().st_mtime, entry.path))
+    profiles.sort()
+    for _, path in profiles[:max(len(profiles) - PROFILE_KEEP, 0)]:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+
+# --------------------
+# Учёт ответа
+# --------------------
+def _server_timing(stats, seconds):
+    return (
+        f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries", '
+        f'app;dur={seconds * 1000:.1f}'
+    )
+
+
+def _record(request, response, stats, started):
+    metrics.observe_request(
+        _view_name(request), request.method, response.status_code, time.perf_counter() - started, stats)
+
+
+def _close_and_record(response, done):
+    """response.close() вызывает сервер после отдачи ответа (и через wsgi.file_wrapper) — тогда и учитываем."""
+    close = response.close
+
+    def closing():
+        try:
+            close()
+        finally:
+            done()
+    response.close = closing
+
+
+def _wrap_sync(content, stats, done):
+    # запросы к БД при потоковой отдаче (экспорт) относятся к этому же HTTP-запросу
+    try:
+        while True:
+            token = metrics.activate(stats)
+            try:
+                chunk = next(content)
+            except StopIteration:
+                break
+            finally:
+                metrics.deactivate(token)
+            stats.response_bytes += len(chunk)
+            yield chunk
+    finally:
+        done()
+
+
+async def _wrap_async(content, stats, done):
+    try:
+        while True:
+            token = metrics.activate(stats)
+            try:
+                chunk = await content.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                metrics.deactivate(token)
+            stats.response_bytes += len(chunk)
+            yield chunk
+    finally:
+        done()
+
+
+def _finish(request, response, stats, started, profiler):
+    if profiler is not None:
+        response = _finish_profile(request, response, profiler)
+    if response.streaming:
+        # время и размер потокового ответа известны только после отдачи последнего куска
+        done = lambda: _record(request, response, stats, started)  # noqa: E731
+        if getattr(response, 'file_to_stream', None) is not None:
+            # файл не оборачиваем, иначе сервер не отдаст его через wsgi.file_wrapper/sendfile;
+            # запрос учитывается, когда сервер закрывает ответ
+            stats.response_bytes = int(response.get('Content-Length') or 0)
+            _close_and_record(response, done)
+        elif response.is_async:
+            response.streaming_content = _wrap_async(aiter(response.streaming_content), stats, done)
+        else:
+            response.streaming_content = _wrap_sync(iter(response.streaming_content), stats, done)
+        return response
+    stats.response_bytes = len(response.content)
+    response['Server-Timing'] = _server_timing(stats, time.perf_counter() - started)
+    _record(request, response, stats, started)
+    return response
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """
+    Метрики запросов для /metrics (см. metrics.py): время по представлению, число и время SQL-запросов,
+    размер ответа, байты ввода-вывода JSON-хранилища. Заголовок Server-Timing — те же цифры для браузера.
+    С заголовком X-Profile (и settings.PHOTO_PROFILE) запрос выполняется под cProfile.
+    """
+    if not getattr(settings, 'PHOTO_METRICS', True):
+        return get_response
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            stats, started = metrics.RequestStats(), time.perf_counter()
+            token = metrics.activate(stats)
+            profiler = _start_profile(request)
+            try:
+                response = await get_response(request)
+            except BaseException:
+                if profiler is not None:
+                    profiler.disable()
+                raise
+            finally:
+                metrics.deactivate(token)
+            return _finish(request, response, stats, started, profiler)
+    else:
+        def middleware(request):
+            stats, started = metrics.RequestStats(), time.perf_counter()
+            token = metrics.activate(stats)
+            profiler = _start_profile(request)
+            try:
+                response = get_response(request)
+            except BaseException:
+                if profiler is not None:
+                    profiler.disable()
+                raise
+            finally:
+                metrics.deactivate(token)
+            return _finish(request, response, stats, started, profiler)
+    return middleware
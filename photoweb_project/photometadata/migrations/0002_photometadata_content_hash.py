@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+def backfill_content_hash(apps, schema_editor):
+    from photometadata.fingerprint import content_hash
+
+    PhotoMetadata = apps.get_model('photometadata', 'PhotoMetadata')
+    batch = []
+    for obj in PhotoMetadata.objects.all().iterator(chunk_size=2000):
+        obj.content_hash = content_hash(obj)
+        batch.append(obj)
+        if len(batch) >= 2000:
+            PhotoMetadata.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    if batch:
+        PhotoMetadata.objects.bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photometadata', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photometadata',
+            name='content_hash',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=64),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photometadata', '0002_photometadata_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='photometadata',
+            index=models.Index(fields=['-created_at', '-id'], name='photo_created_id_idx'),
+        ),
+    ]
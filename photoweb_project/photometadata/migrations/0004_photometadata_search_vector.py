@@ -0,0 +1,75 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Веса: A — title, B — photographer/tags, C — description/location/camera/license
+SEARCH_VECTOR_SQL = """
+    setweight(to_tsvector('simple', coalesce(NEW.title, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(NEW.photographer, '') || ' ' || coalesce(NEW.tags, '')), 'B') ||
+    setweight(to_tsvector('simple',
+        coalesce(NEW.description, '') || ' ' || coalesce(NEW.location, '') || ' ' ||
+        coalesce(NEW.camera, '') || ' ' || coalesce(NEW.license, '')), 'C')
+"""
+
+TRIGRAM_FIELDS = ['title', 'photographer', 'description', 'location', 'camera', 'license', 'tags']
+
+FORWARD_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"""
+    CREATE OR REPLACE FUNCTION photometadata_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {SEARCH_VECTOR_SQL};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER photometadata_search_vector_trigger
+    BEFORE INSERT OR UPDATE ON photometadata_photometadata
+    FOR EACH ROW EXECUTE FUNCTION photometadata_search_vector_update()
+    """,
+    # заполняем вектор для существующих строк (триггер пересчитает его при UPDATE)
+    "UPDATE photometadata_photometadata SET search_vector = NULL",
+    "CREATE INDEX photo_search_vector_gin ON photometadata_photometadata USING gin (search_vector)",
+] + [
+    f"CREATE INDEX photo_{field}_trgm ON photometadata_photometadata USING gin ({field} gin_trgm_ops)"
+    for field in TRIGRAM_FIELDS
+]
+
+REVERSE_SQL = [
+    f"DROP INDEX IF EXISTS photo_{field}_trgm" for field in TRIGRAM_FIELDS
+] + [
+    "DROP INDEX IF EXISTS photo_search_vector_gin",
+    "DROP TRIGGER IF EXISTS photometadata_search_vector_trigger ON photometadata_photometadata",
+    "DROP FUNCTION IF EXISTS photometadata_search_vector_update()",
+]
+
+
+def create_search_objects(apps, schema_editor):
+    # триггер, GIN и триграммные индексы есть только в PostgreSQL; на SQLite поле остаётся пустым
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in FORWARD_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_search_objects(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in REVERSE_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photometadata', '0003_photometadata_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photometadata',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_objects, drop_search_objects),
+    ]
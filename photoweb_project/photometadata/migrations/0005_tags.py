@@ -0,0 +1,66 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def split_csv_tags(apps, schema_editor):
+    """Раскладывает существующие CSV-теги по таблицам Tag / PhotoTag."""
+    from photometadata.tags import parse_tags
+
+    PhotoMetadata = apps.get_model('photometadata', 'PhotoMetadata')
+    Tag = apps.get_model('photometadata', 'Tag')
+    PhotoTag = apps.get_model('photometadata', 'PhotoTag')
+
+    rows = PhotoMetadata.objects.values_list('id', 'tags').order_by('id').iterator(chunk_size=2000)
+    tag_ids = {}
+    links = []
+    for photo_id, csv in rows:
+        for name in parse_tags(csv):
+            if name not in tag_ids:
+                tag_ids[name] = Tag.objects.get_or_create(name=name)[0].id
+            links.append(PhotoTag(photo_id=photo_id, tag_id=tag_ids[name]))
+        if len(links) >= 2000:
+            PhotoTag.objects.bulk_create(links, ignore_conflicts=True)
+            links = []
+    if links:
+        PhotoTag.objects.bulk_create(links, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photometadata', '0004_photometadata_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PhotoTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('photo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='photometadata.photometadata')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='photometadata.tag')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='photometadata',
+            name='tag_set',
+            field=models.ManyToManyField(blank=True, related_name='photos', through='photometadata.PhotoTag', to='photometadata.tag'),
+        ),
+        migrations.AddIndex(
+            model_name='phototag',
+            index=models.Index(fields=['tag', 'photo'], name='phototag_tag_photo_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='phototag',
+            constraint=models.UniqueConstraint(fields=('photo', 'tag'), name='photo_tag_unique'),
+        ),
+        migrations.RunPython(split_csv_tags, migrations.RunPython.noop),
+    ]
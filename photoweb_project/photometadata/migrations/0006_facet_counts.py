@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:41
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def fill_facet_counts(apps, schema_editor):
+    from photometadata.facets import FACET_SOURCE_FIELDS, facet_values
+
+    PhotoMetadata = apps.get_model('photometadata', 'PhotoMetadata')
+    FacetCount = apps.get_model('photometadata', 'FacetCount')
+    counts = Counter()
+    for row in PhotoMetadata.objects.values(*FACET_SOURCE_FIELDS).iterator(chunk_size=2000):
+        counts.update(facet_values(row))
+    FacetCount.objects.bulk_create(
+        [FacetCount(facet=facet, value=value, count=n) for (facet, value), n in counts.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photometadata', '0005_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=20)),
+                ('value', models.CharField(max_length=200)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['facet', '-count'], name='facet_count_idx')],
+                'constraints': [models.UniqueConstraint(fields=('facet', 'value'), name='facet_value_unique')],
+            },
+        ),
+        migrations.RunPython(fill_facet_counts, migrations.RunPython.noop),
+    ]
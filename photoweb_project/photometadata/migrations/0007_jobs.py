@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photometadata', '0006_facet_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('import_db', 'Импорт в БД'), ('ingest_file', 'Загрузка в файловое хранилище')], max_length=20)),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='queued', max_length=10)),
+                ('source_path', models.CharField(max_length=500)),
+                ('source_name', models.CharField(blank=True, max_length=255)),
+                ('bytes_total', models.BigIntegerField(default=0)),
+                ('bytes_read', models.BigIntegerField(default=0)),
+                ('total', models.IntegerField(default=0)),
+                ('valid', models.IntegerField(default=0)),
+                ('invalid', models.IntegerField(default=0)),
+                ('duplicates', models.IntegerField(default=0)),
+                ('added', models.IntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('result', models.JSONField(blank=True, default=dict)),
+                ('message', models.TextField(blank=True)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('attempts', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='job_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photometadata', '0007_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photometadata',
+            name='image_sha256',
+            field=models.CharField(blank=True, db_default='', default='', editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photometadata', '0008_photometadata_image_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photometadata',
+            name='ahash',
+            field=models.CharField(blank=True, db_default='', default='', editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='photometadata',
+            name='dhash',
+            field=models.CharField(blank=True, db_default='', default='', editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='photometadata',
+            name='hashed_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='photometadata',
+            name='phash',
+            field=models.CharField(blank=True, db_default='', default='', editable=False, max_length=16),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def release_duplicate_hashes(apps, schema_editor):
+    # Дубли, попавшие в таблицу до уникального индекса (гонка двух загрузок), не удаляются:
+    # у всех, кроме самой ранней записи группы, отпечаток сбрасывается в '' (индекс их не учитывает)
+    PhotoMetadata = apps.get_model('photometadata', 'PhotoMetadata')
+    groups = (
+        PhotoMetadata.objects.exclude(content_hash='').values('content_hash')
+        .annotate(n=Count('id'), keep=Min('id')).filter(n__gt=1)
+    )
+    for group in list(groups):
+        PhotoMetadata.objects.filter(content_hash=group['content_hash']).exclude(pk=group['keep']).update(
+            content_hash='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photometadata', '0009_perceptual_hashes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photometadata',
+            name='version',
+            field=models.PositiveIntegerField(db_default=1, default=1, editable=False),
+        ),
+        migrations.RunPython(release_duplicate_hashes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='photometadata',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(('content_hash', ''), _negated=True),
+                fields=('content_hash',),
+                name='photo_content_hash_unique',
+            ),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:37
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_changelog(apps, schema_editor):
+    # по записи upsert на каждое фото: синхронизация с начала журнала получает всю таблицу
+    PhotoMetadata = apps.get_model('photometadata', 'PhotoMetadata')
+    ChangeLog = apps.get_model('photometadata', 'ChangeLog')
+    batch = []
+    for pk in PhotoMetadata.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=5000):
+        batch.append(ChangeLog(photo_id=pk, op='upsert'))
+        if len(batch) >= 5000:
+            ChangeLog.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        ChangeLog.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photometadata', '0010_version_unique_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('photo_id', models.BigIntegerField()),
+                ('op', models.CharField(choices=[('upsert', 'Создание или изменение'), ('delete', 'Удаление')], max_length=10)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['photo_id', 'id'], name='changelog_photo_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_changelog, migrations.RunPython.noop),
+    ]
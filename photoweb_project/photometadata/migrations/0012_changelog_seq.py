@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+def number_existing(apps, schema_editor):
+    # прежние записи уже закоммичены: seq = id, и курсоры, выданные до миграции, остаются верными
+    ChangeLog = apps.get_model('photometadata', 'ChangeLog')
+    ChangeLog.objects.update(seq=models.F('id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photometadata', '0011_changelog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='changelog',
+            name='seq',
+            field=models.BigIntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.RunPython(number_existing, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='changelog',
+            name='changelog_photo_idx',
+        ),
+        migrations.AddIndex(
+            model_name='changelog',
+            index=models.Index(fields=['photo_id', 'seq'], name='changelog_photo_seq_idx'),
+        ),
+    ]
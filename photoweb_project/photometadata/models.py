@@ -1,4 +1,17 @@
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.utils import timezone
+from .fingerprint import content_hash
+
+
+class Tag(models.Model):
+    """Нормализованный тег (см. tags.normalize_tag): без '#', в нижнем регистре."""
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
 class PhotoMetadata(models.Model):
     title = models.CharField(max_length=200)
     photographer = models.CharField(max_length=200)
@@ -12,11 +25,179 @@ class PhotoMetadata(models.Model):
     camera = models.CharField(max_length=200)
     license = models.CharField(max_length=200)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Отпечаток нормализованного содержимого (см. fingerprint.py) — для поиска дублей одним индексным запросом
+    content_hash = models.CharField(max_length=64, db_index=True, editable=False, default='')
+    # Полнотекстовый вектор (только PostgreSQL): заполняется триггером БД, см. миграцию 0004 и search.py
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Теги из CSV-поля tags в виде связей (заполняются при settings.PHOTO_NORMALIZED_TAGS, см. tags.py)
+    tag_set = models.ManyToManyField(Tag, through='PhotoTag', related_name='photos', blank=True)
+    # sha256 файла изображения в локальном хранилище (см. images.py); '' — изображение только по url.
+    # db_default — чтобы колонку заполнял и COPY-импорт с явным списком колонок (bulk.py)
+    image_sha256 = models.CharField(max_length=64, blank=True, editable=False, default='', db_default='')
+    # Перцептивные хеши изображения (hex, 64 бита) для поиска похожих фото, см. near_duplicates.py.
+    # hashed_at — когда посчитаны: по нему индексы в памяти процессов дочитывают новые хеши
+    ahash = models.CharField(max_length=16, blank=True, editable=False, default='', db_default='')
+    dhash = models.CharField(max_length=16, blank=True, editable=False, default='', db_default='')
+    phash = models.CharField(max_length=16, blank=True, editable=False, default='', db_default='')
+    hashed_at = models.DateTimeField(null=True, blank=True, editable=False, db_index=True)
+    # Номер версии для оптимистичной блокировки: редактирование сохраняется, только если запись
+    # не менялась с момента чтения (см. save_versioned); массовые изменения тоже его увеличивают
+    version = models.PositiveIntegerField(default=1, db_default=1, editable=False)
 
     class Meta:
-        # уникальность можно не ставить на уровне БД, проверяем в коде (даёт гибкость)
         ordering = ['-created_at']
+        indexes = [
+            # keyset-пагинация по (created_at, id), см. pagination.py
+            models.Index(fields=['-created_at', '-id'], name='photo_created_id_idx'),
+        ]
+        constraints = [
+            # дубли отсекаются и в коде, но только индекс исключает гонку двух одновременных записей;
+            # '' — записи, оставшиеся дублями до появления индекса (см. миграцию 0010)
+            models.UniqueConstraint(
+                fields=['content_hash'], condition=~models.Q(content_hash=''), name='photo_content_hash_unique',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.date_taken})"
-# Create your models here.
+
+    def save(self, *args, **kwargs):
+        self.content_hash = content_hash(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'content_hash' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['content_hash']
+        super().save(*args, **kwargs)
+
+    def save_versioned(self, expected_version):
+        """
+        Сохраняет запись, только если её версия в БД всё ещё expected_version (compare-and-swap):
+        условный UPDATE увеличивает версию и блокирует строку до конца транзакции, затем обычный
+        save() пишет поля (сигналы тегов, фасетов и кеша срабатывают как обычно).
+        Возвращает False, если запись изменили или удалили. IntegrityError — новое содержимое дублирует другую запись.
+        """
+        with transaction.atomic():
+            claimed = type(self).objects.filter(pk=self.pk, version=expected_version).update(
+                version=models.F('version') + 1)
+            if not claimed:
+                return False
+            self.version = expected_version + 1
+            self.save()
+        return True
+
+
+class PhotoTag(models.Model):
+    photo = models.ForeignKey(PhotoMetadata, on_delete=models.CASCADE)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['photo', 'tag'], name='photo_tag_unique'),
+        ]
+        indexes = [
+            # выборка «все фото с тегом» идёт от тега
+            models.Index(fields=['tag', 'photo'], name='phototag_tag_photo_idx'),
+        ]
+
+
+class FacetCount(models.Model):
+    """
+    Поддерживаемые инкрементально счётчики фасетов по всей таблице (см. facets.py).
+    facet: photographer | camera | license | year | tag | _total.
+    """
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=200)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['facet', 'value'], name='facet_value_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['facet', '-count'], name='facet_count_idx'),
+        ]
+
+
+class Job(models.Model):
+    """
+    Фоновая задача загрузки JSON (очередь в БД, без внешнего брокера; см. jobs.py).
+    Задачи выполняет manage.py run_workers; прогресс читает ajax/jobs/<id>/.
+    """
+    KIND_IMPORT_DB = 'import_db'
+    KIND_INGEST_FILE = 'ingest_file'
+    KIND_CHOICES = [
+        (KIND_IMPORT_DB, 'Импорт в БД'),
+        (KIND_INGEST_FILE, 'Загрузка в файловое хранилище'),
+    ]
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Готово'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    # загруженный файл, сохранённый до выполнения задачи
+    source_path = models.CharField(max_length=500)
+    source_name = models.CharField(max_length=255, blank=True)
+    bytes_total = models.BigIntegerField(default=0)
+    bytes_read = models.BigIntegerField(default=0)
+    # счётчики IngestReport
+    total = models.IntegerField(default=0)
+    valid = models.IntegerField(default=0)
+    invalid = models.IntegerField(default=0)
+    duplicates = models.IntegerField(default=0)
+    added = models.IntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    result = models.JSONField(default=dict, blank=True)
+    message = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    attempts = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # обновляется при каждом сохранении прогресса; по нему находят задачи «упавших» воркеров
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job #{self.pk} {self.kind} ({self.status})"
+
+
+class ChangeLog(models.Model):
+    """
+    Журнал изменений PhotoMetadata для синхронизации внешних потребителей (ajax/changes/, см. changes.py).
+    Пишется в той же транзакции, что и изменение: сигналами и массовыми операциями bulk.py.
+    seq — порядок коммитов: номер присваивается после коммита (changes.assign_sequence), id для этого
+    не годится — PostgreSQL выдаёт его до коммита. Старые записи удаляет compact_changes.
+    """
+    OP_UPSERT = 'upsert'
+    OP_DELETE = 'delete'
+    OP_CHOICES = [
+        (OP_UPSERT, 'Создание или изменение'),
+        (OP_DELETE, 'Удаление'),
+    ]
+
+    # не ForeignKey: после удаления записи её tombstone остаётся
+    photo_id = models.BigIntegerField()
+    op = models.CharField(max_length=10, choices=OP_CHOICES)
+    created_at = models.DateTimeField(default=timezone.now)
+    # None — транзакция ещё не закоммичена или номер ещё не присвоен; такие записи в выдачу не попадают
+    seq = models.BigIntegerField(null=True, unique=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # последняя запись журнала по каждому фото (сжатие журнала)
+            models.Index(fields=['photo_id', 'seq'], name='changelog_photo_seq_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.op} {self.photo_id}"
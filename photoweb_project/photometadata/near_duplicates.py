@@ -0,0 +1,239 @@
+import functools
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+
+from .models import PhotoMetadata
+
+# Перцептивные хеши записи (см. images.image_hashes); pHash устойчивее остальных к пережатию и ресайзу
+HASH_KINDS = ('phash', 'dhash', 'ahash')
+# Порог расстояния Хэмминга (из 64 бит), до которого фото считаются почти одинаковыми
+DEFAULT_DISTANCE = 8
+MAX_DISTANCE = 20
+# Запас при дочитывании индекса: транзакция с более ранней hashed_at может зафиксироваться позже
+REFRESH_OVERLAP = timedelta(seconds=60)
+# Поля записей в ответах (кластеры и похожие)
+DUPLICATE_FIELDS = ['id', 'title', 'photographer', 'date_taken', 'url', 'width', 'height', 'image_sha256']
+# Устаревших узлов (удалённые записи, прежние хеши) сверх этого числа — мультииндекс перестраивается
+STALE_NODES_SLACK = 1024
+# Версия формата закешированных кластеров
+CLUSTERS_CACHE_VERSION = 1
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+# --------------------
+# Мультииндекс по расстоянию Хэмминга (multi-index hashing)
+# --------------------
+CHUNKS = 4
+CHUNK_BITS = 64 // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+
+@functools.lru_cache(maxsize=None)
+def _chunk_masks(radius):
+    """Все CHUNK_BITS-битные маски с не более чем radius единицами (соседи куска в радиусе radius)."""
+    return tuple(m for m in range(1 << CHUNK_BITS) if m.bit_count() <= radius)
+
+
+class MultiIndex:
+    """
+    64-битный хеш режется на CHUNKS кусков по CHUNK_BITS бит, по каждому куску — своя хеш-таблица.
+    Если расстояние между хешами <= r, то хотя бы в одном куске оно <= r // CHUNKS (принцип Дирихле),
+    поэтому поиск перебирает только соседей кусков запроса в этом малом радиусе и проверяет
+    найденных кандидатов полным расстоянием. Число кандидатов — доли процента таблицы, а не вся таблица
+    (BK-дерево на 64-битных хешах при r ~ 8 обходит почти все узлы). Добавление — O(CHUNKS).
+    """
+
+    def __init__(self):
+        self.tables = [{} for _ in range(CHUNKS)]
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        for i, table in enumerate(self.tables):
+            table.setdefault((value >> (i * CHUNK_BITS)) & CHUNK_MASK, []).append((value, item))
+
+    def search(self, value, radius):
+        """[(расстояние, элемент)] для всех хешей не дальше radius от value."""
+        found = {}
+        masks = _chunk_masks(radius // CHUNKS)
+        for i, table in enumerate(self.tables):
+            key = (value >> (i * CHUNK_BITS)) & CHUNK_MASK
+            for mask in masks:
+                for candidate, item in table.get(key ^ mask, ()):
+                    if item not in found:
+                        d = hamming(value, candidate)
+                        if d <= radius:
+                            found[item] = d
+        return [(d, item) for item, d in found.items()]
+
+
+# --------------------
+# Индекс хешей записей (в памяти процесса, пополняется инкрементально)
+# --------------------
+class HashIndex:
+    """
+    Мультииндекс хешей kind всех записей с изображением. При каждом обращении дочитывает из БД только
+    записи с hashed_at не раньше последней прочитанной (с запасом REFRESH_OVERLAP, индекс по hashed_at) — новые записи других
+    процессов попадают в индекс без перестроения. Если записей с хешем в БД меньше, чем в hashes (удаление
+    или сброс хеша), лишние pk убираются сверкой со списком id. Устаревшие узлы мультииндекса отсеиваются
+    сверкой с hashes; когда их больше STALE_NODES_SLACK, мультииндекс перестраивается из hashes.
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.table = MultiIndex()
+        self.hashes = {}
+        self.seen_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        with self._lock:
+            rows = PhotoMetadata.objects.exclude(**{self.kind: ''}).filter(hashed_at__isnull=False)
+            if self.seen_at is not None:
+                # уже прочитанные строки с тем же хешем пропускаются ниже
+                rows = rows.filter(hashed_at__gte=self.seen_at - REFRESH_OVERLAP)
+            for pk, value, hashed_at in rows.order_by('hashed_at').values_list('id', self.kind, 'hashed_at').iterator():
+                value = int(value, 16)
+                if self.hashes.get(pk) != value:
+                    self.hashes[pk] = value
+                    self.table.add(value, (pk, value))
+                self.seen_at = max(self.seen_at or hashed_at, hashed_at)
+            self._sweep()
+
+    def _sweep(self):
+        hashed = PhotoMetadata.objects.exclude(**{self.kind: ''}).filter(hashed_at__isnull=False)
+        if hashed.count() != len(self.hashes):
+            alive = set(hashed.values_list('id', flat=True))
+            for pk in self.hashes.keys() - alive:
+                del self.hashes[pk]
+        if self.table.size - len(self.hashes) > STALE_NODES_SLACK:
+            self.table = MultiIndex()
+            for pk, value in self.hashes.items():
+                self.table.add(value, (pk, value))
+
+    def _search(self, value, distance):
+        found = {}
+        with self._lock:
+            for d, (pk, node_value) in self.table.search(value, distance):
+                # узел с прежним хешем записи пропускается
+                if self.hashes.get(pk) == node_value:
+                    found[pk] = d
+        return sorted((d, pk) for pk, d in found.items())
+
+    def search(self, value, distance):
+        """[(расстояние, pk)] по возрастанию расстояния; каждый pk — один раз, по текущему хешу."""
+        self.refresh()
+        return self._search(value, distance)
+
+    def items(self):
+        with self._lock:
+            return list(self.hashes.items())
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(kind='phash'):
+    if kind not in HASH_KINDS:
+        raise ValueError(f"Неизвестный хеш: {kind}")
+    with _indexes_lock:
+        if kind not in _indexes:
+            _indexes[kind] = HashIndex(kind)
+        return _indexes[kind]
+
+
+# --------------------
+# Поиск похожих и кластеры
+# --------------------
+def similar_to(value, kind='phash', distance=DEFAULT_DISTANCE, exclude=None):
+    """Записи с хешем kind не дальше distance от value (hex): [dict(DUPLICATE_FIELDS + distance)]."""
+    matches = [(d, pk) for d, pk in get_index(kind).search(int(value, 16), distance) if pk != exclude]
+    rows = PhotoMetadata.objects.in_bulk([pk for _, pk in matches])
+    results = []
+    for d, pk in matches:
+        obj = rows.get(pk)
+        if obj is not None:
+            results.append(dict(_row(obj), distance=d))
+    return results
+
+
+def _clusters_key(kind, distance, min_size):
+    """Ключ кеша кластеров: меняется с любым новым или пересчитанным хешем (hashed_at) и удалением (count)."""
+    state = PhotoMetadata.objects.exclude(**{kind: ''}).filter(hashed_at__isnull=False).aggregate(
+        last=models.Max('hashed_at'), count=models.Count('id'))
+    last = state['last'].isoformat() if state['last'] else ''
+    return f"photometadata:clusters:{kind}:{distance}:{min_size}:{last}:{state['count']}"
+
+
+def find_clusters(kind='phash', distance=DEFAULT_DISTANCE, min_size=2):
+    """
+    Группы почти одинаковых фото: связные компоненты графа «расстояние <= distance» (union-find).
+    Для каждой записи — один запрос к мультииндексу. Возвращает списки pk, крупные группы — первыми.
+    Результат кешируется, пока в БД не появится новый хеш или не пропадёт прежний.
+    """
+    key = _clusters_key(kind, distance, min_size)
+    clusters = cache.get(key, version=CLUSTERS_CACHE_VERSION)
+    if clusters is None:
+        clusters = _compute_clusters(kind, distance, min_size)
+        cache.set(key, clusters, getattr(settings, 'PHOTO_CLUSTERS_CACHE_TTL', 3600), version=CLUSTERS_CACHE_VERSION)
+    return clusters
+
+
+def _compute_clusters(kind, distance, min_size):
+    index = get_index(kind)
+    index.refresh()
+    parent = {}
+
+    def find(pk):
+        root = pk
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while pk != root:
+            parent[pk], pk = root, parent.get(pk, pk)
+        return root
+
+    for pk, value in index.items():
+        for _, other in index._search(value, distance):
+            if other != pk:
+                a, b = find(pk), find(other)
+                if a != b:
+                    parent.setdefault(a, a)
+                    parent.setdefault(b, b)
+                    parent[max(a, b)] = min(a, b)
+
+    groups = {}
+    for pk in parent:
+        groups.setdefault(find(pk), []).append(pk)
+    clusters = [sorted(members) for members in groups.values() if len(members) >= min_size]
+    clusters.sort(key=lambda members: (-len(members), members[0]))
+    return clusters
+
+
+def _row(obj):
+    row = {field: getattr(obj, field) for field in DUPLICATE_FIELDS}
+    row['date_taken'] = obj.date_taken.isoformat() if hasattr(obj.date_taken, 'isoformat') else str(obj.date_taken)
+    return row
+
+
+def serialize_clusters(clusters, kind='phash'):
+    """Кластеры (списки pk) -> [{'size', 'records': [...]}]; у записей — расстояние до первой в группе."""
+    rows = PhotoMetadata.objects.in_bulk([pk for members in clusters for pk in members])
+    result = []
+    for members in clusters:
+        objs = [rows[pk] for pk in members if pk in rows]
+        if len(objs) < 2:
+            continue
+        base = int(getattr(objs[0], kind), 16)
+        result.append({
+            'size': len(objs),
+            'records': [dict(_row(obj), distance=hamming(base, int(getattr(obj, kind), 16))) for obj in objs],
+        })
+    return result
@@ -0,0 +1,97 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+# Размер страницы по умолчанию и максимальный (для ?limit=)
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+# --------------------
+# Курсорная (keyset) пагинация по (created_at, id)
+# --------------------
+def encode_cursor(created_at, pk, direction):
+    """Непрозрачный курсор: base64 от «направление|created_at|id». direction: 'n' — дальше, 'p' — назад."""
+    raw = f"{direction}|{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Разбирает курсор; ValueError — если он повреждён."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        direction, created_at, pk = raw.split('|')
+        if direction not in ('n', 'p'):
+            raise ValueError(direction)
+        return direction, datetime.fromisoformat(created_at), int(pk)
+    except Exception as e:
+        raise ValueError(f"Некорректный курсор: {token}") from e
+
+
+def _key(item):
+    if isinstance(item, dict):
+        return item['created_at'], item['id']
+    return item.created_at, item.pk
+
+
+class KeysetPage:
+    """Страница выборки: items и курсоры соседних страниц (None — если страницы нет)."""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+
+def _page_query(queryset, cursor, page_size):
+    """Запрос страницы (на одну строку больше — чтобы узнать, есть ли продолжение) и направление."""
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    direction = 'n'
+    if cursor:
+        direction, created_at, pk = decode_cursor(cursor)
+        if direction == 'n':
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        else:
+            queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+
+    if direction == 'n':
+        queryset = queryset.order_by('-created_at', '-id')
+    else:
+        queryset = queryset.order_by('created_at', 'id')
+    return queryset[:page_size + 1], direction, page_size
+
+
+def _make_page(rows, cursor, direction, page_size):
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == 'p':
+        rows.reverse()
+
+    if not rows:
+        return KeysetPage([])
+    first, last = _key(rows[0]), _key(rows[-1])
+    # идём вперёд: следующая страница есть, если выбрали лишнюю строку; предыдущая — если был курсор
+    has_next = has_more if direction == 'n' else True
+    has_prev = bool(cursor) if direction == 'n' else has_more
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(*last, 'n') if has_next else None,
+        prev_cursor=encode_cursor(*first, 'p') if has_prev else None,
+    )
+
+
+def keyset_page(queryset, cursor=None, page_size=PAGE_SIZE):
+    """
+    Страница queryset в порядке (-created_at, -id) после/до курсора.
+    Стоимость не зависит от глубины: WHERE (created_at, id) < (...) LIMIT n по индексу.
+    Для .values() в выборку должны входить 'id' и 'created_at'.
+    """
+    query, direction, page_size = _page_query(queryset, cursor, page_size)
+    return _make_page(list(query), cursor, direction, page_size)
+
+
+async def akeyset_page(queryset, cursor=None, page_size=PAGE_SIZE):
+    """То же, что keyset_page, для async-представлений (асинхронная итерация по queryset)."""
+    query, direction, page_size = _page_query(queryset, cursor, page_size)
+    return _make_page([row async for row in query], cursor, direction, page_size)
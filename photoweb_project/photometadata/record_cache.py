@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.shortcuts import aget_object_or_404, get_object_or_404
+
+from .models import PhotoMetadata
+from .serializers import serialize_photo
+
+# Версия формата кешированных записей: увеличить при изменении serialize_photo,
+# чтобы старые значения в общем кеше (файлы/БД) не читались
+RECORD_CACHE_VERSION = 3
+
+
+# --------------------
+# Кеш сериализованных записей (для db_get_ajax)
+# --------------------
+def _cache():
+    return caches[getattr(settings, 'PHOTO_RECORD_CACHE', 'default')]
+
+
+def _ttl():
+    return getattr(settings, 'PHOTO_RECORD_CACHE_TTL', 3600)
+
+
+def record_key(pk):
+    return f'photometadata:record:{pk}'
+
+
+def get_record(pk):
+    """Сериализованная запись из кеша; при промахе — из БД с записью в кеш. Http404 — если записи нет."""
+    cache = _cache()
+    data = cache.get(record_key(pk), version=RECORD_CACHE_VERSION)
+    if data is None:
+        data = serialize_photo(get_object_or_404(PhotoMetadata, pk=pk))
+        cache.set(record_key(pk), data, _ttl(), version=RECORD_CACHE_VERSION)
+    return data
+
+
+async def aget_record(pk):
+    """Асинхронный вариант get_record (для async-представлений)."""
+    cache = _cache()
+    data = await cache.aget(record_key(pk), version=RECORD_CACHE_VERSION)
+    if data is None:
+        data = serialize_photo(await aget_object_or_404(PhotoMetadata, pk=pk))
+        await cache.aset(record_key(pk), data, _ttl(), version=RECORD_CACHE_VERSION)
+    return data
+
+
+def forget_records(pks):
+    """Delete-through: удаляет записи из кеша (после коммита изменения или удаления)."""
+    _cache().delete_many([record_key(pk) for pk in pks], version=RECORD_CACHE_VERSION)
@@ -0,0 +1,189 @@
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import connection, models
+from django.db.models.functions import Greatest
+from django.utils.module_loading import import_string
+
+from .models import PhotoMetadata
+from .tags import filter_by_tags, parse_tags
+
+# Максимум результатов поиска
+SEARCH_LIMIT = 200
+
+# Поля, по которым ищется подстрока (как в исходном db_search_ajax)
+SEARCH_FIELDS = ['title', 'photographer', 'description', 'location', 'camera', 'license', 'tags']
+
+# Поля с нечётким (триграммным) сравнением слов — для опечаток
+FUZZY_FIELDS = ['title', 'photographer', 'tags', 'location']
+
+# Триграммные индексы работают с подстроками от 3 символов
+TRIGRAM_MIN_LENGTH = 3
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Регистр, как его сворачивает LIKE в SQLite: только латиница A–Z
+_ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+
+def ascii_lower(value):
+    return value.translate(_ASCII_LOWER)
+
+
+def _substring_q(q):
+    cond = models.Q()
+    for field in SEARCH_FIELDS:
+        cond |= models.Q(**{f'{field}__icontains': q})
+    return cond
+
+
+class ILike(models.Lookup):
+    """
+    col ILIKE pattern (PostgreSQL). icontains сравнивает UPPER(col::text) — по выражению, которого нет
+    в триграммных индексах (миграция 0004, gin_trgm_ops по самим столбцам), и ведёт к полному сканированию.
+    """
+    lookup_name = 'ilike'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} ILIKE {rhs}', [*lhs_params, *rhs_params]
+
+
+def _ilike_substring_q(q):
+    """Подстрока q в SEARCH_FIELDS через ILIKE — по триграммным индексам столбцов."""
+    pattern = f'%{connection.ops.prep_for_like_query(q)}%'
+    cond = models.Q()
+    for field in SEARCH_FIELDS:
+        cond |= models.Q(ILike(models.F(field), pattern))
+    return cond
+
+
+# --------------------
+# Поисковые движки
+# --------------------
+class SimpleSearchEngine:
+    """
+    Переносимый поиск (SQLite и другие БД): подстрока по SEARCH_FIELDS.
+    Ранжирование: совпадение в title, затем в photographer/tags, затем остальное.
+    """
+
+    def matching(self, q, queryset=None):
+        """Все подходящие записи без ранжирования и лимита (для фасетов, экспорта, массовых операций)."""
+        queryset = PhotoMetadata.objects.all() if queryset is None else queryset
+        return queryset.filter(_substring_q(q))
+
+    def search(self, q, queryset=None, limit=SEARCH_LIMIT):
+        rank = models.Case(
+            models.When(title__icontains=q, then=models.Value(3)),
+            models.When(models.Q(photographer__icontains=q) | models.Q(tags__icontains=q), then=models.Value(2)),
+            default=models.Value(1),
+            output_field=models.IntegerField(),
+        )
+        return (
+            self.matching(q, queryset)
+            .annotate(rank=rank)
+            .order_by('-rank', '-created_at', '-id')[:limit]
+        )
+
+    def refine(self, rows, q, limit=SEARCH_LIMIT):
+        """
+        Результат search(q) из полного (не обрезанного limit) результата более короткого запроса,
+        который содержится в q: подстрока q есть только там, где есть и он (см. search_cache.py).
+        rows — словари с SEARCH_FIELDS, created_at и id. None — если так посчитать нельзя:
+        в Python регистр сворачивается как в LIKE SQLite только для ASCII-запроса.
+        """
+        if connection.vendor != 'sqlite' or not q.isascii():
+            return None
+        needle = ascii_lower(q)
+
+        def contains(row, field):
+            return needle in ascii_lower(row[field] or '')
+
+        ranked = []
+        for row in rows:
+            if not any(contains(row, field) for field in SEARCH_FIELDS):
+                continue
+            # те же ступени, что и rank в search()
+            if contains(row, 'title'):
+                rank = 3
+            elif contains(row, 'photographer') or contains(row, 'tags'):
+                rank = 2
+            else:
+                rank = 1
+            ranked.append((rank, row['created_at'], row['id'], row))
+        ranked.sort(key=lambda item: item[:3], reverse=True)
+        return [item[3] for item in ranked[:limit]]
+
+
+class PostgresSearchEngine:
+    """
+    PostgreSQL: полнотекстовый поиск по search_vector (GIN, веса A/B/C поддерживает триггер
+    из миграции 0004) + подстрока и нечёткое совпадение по триграммным индексам pg_trgm.
+    Каждое слово запроса ищется как префикс ('sea' находит 'seaside'), поэтому поиск
+    «по мере ввода» идёт по индексу, а не последовательным сканированием.
+    """
+
+    def prefix_query(self, q):
+        words = _WORD_RE.findall(q.lower())
+        if not words:
+            return None
+        return SearchQuery(' & '.join(f'{w}:*' for w in words), config='simple', search_type='raw')
+
+    def matching(self, q, queryset=None):
+        """Все подходящие записи без ранжирования и лимита (для фасетов, экспорта, массовых операций)."""
+        queryset = PhotoMetadata.objects.all() if queryset is None else queryset
+        query = self.prefix_query(q)
+        cond = models.Q()
+        if query is not None:
+            cond |= models.Q(search_vector=query)
+        if len(q) >= TRIGRAM_MIN_LENGTH:
+            cond |= _ilike_substring_q(q)
+            for field in FUZZY_FIELDS:
+                cond |= models.Q(**{f'{field}__trigram_word_similar': q})
+        elif query is None:
+            return queryset.none()
+        return queryset.filter(cond)
+
+    def search(self, q, queryset=None, limit=SEARCH_LIMIT):
+        query = self.prefix_query(q)
+        similarity = Greatest(*(TrigramWordSimilarity(q, field) for field in FUZZY_FIELDS))
+        rank = similarity
+        if query is not None:
+            rank = SearchRank(models.F('search_vector'), query) + similarity
+        return (
+            self.matching(q, queryset)
+            .annotate(rank=rank)
+            .order_by('-rank', '-created_at', '-id')[:limit]
+        )
+
+    def refine(self, rows, q, limit=SEARCH_LIMIT):
+        # префиксы слов и нечёткое сравнение: запись может подойти к длинному запросу,
+        # не подходя к его началу (опечатка исправилась), — сужать результат нельзя
+        return None
+
+
+def get_search_engine():
+    """Движок из settings.PHOTO_SEARCH_ENGINE или по типу БД."""
+    path = getattr(settings, 'PHOTO_SEARCH_ENGINE', None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == 'postgresql':
+        return PostgresSearchEngine()
+    return SimpleSearchEngine()
+
+
+def filter_queryset(params, queryset=None):
+    """
+    Общий фильтр запросов (поиск, фасеты, экспорт): params — dict-подобный объект с ключами
+    q (строка поиска), tags (CSV) и mode ('any' | 'all'). Пустые параметры не фильтруют.
+    """
+    queryset = PhotoMetadata.objects.all() if queryset is None else queryset
+    q = (params.get('q') or '').strip()
+    if q:
+        queryset = get_search_engine().matching(q, queryset)
+    names = parse_tags(params.get('tags') or '')
+    if names:
+        queryset = filter_by_tags(queryset, names, params.get('mode') or 'any')
+    return queryset
@@ -0,0 +1,134 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import count_search_cache
+from .search import SEARCH_LIMIT, ascii_lower, get_search_engine
+from .serializers import RECORD_FIELDS
+
+# Версия формата закешированных результатов (как RECORD_CACHE_VERSION в record_cache.py)
+SEARCH_CACHE_VERSION = 1
+# Номер поколения: любое изменение записей увеличивает его, ключи прежних результатов больше не читаются
+GENERATION_KEY = 'photometadata:search:generation'
+# created_at нужен для сортировки при сужении результата (engine.refine), в ответ не попадает
+CACHED_FIELDS = RECORD_FIELDS + ['created_at']
+# Сколько более коротких префиксов запроса проверять (клиент с debounce пропускает промежуточные)
+PREFIX_LOOKBACK = 16
+
+
+# --------------------
+# Кеш результатов поиска «по мере ввода» (для db_search_ajax)
+# --------------------
+def _cache():
+    return caches[getattr(settings, 'PHOTO_SEARCH_CACHE', 'default')]
+
+
+def _ttl():
+    return getattr(settings, 'PHOTO_SEARCH_CACHE_TTL', 300)
+
+
+def normalize_query(q):
+    """
+    Ключ запроса: без пробелов по краям и с латиницей в нижнем регистре — на результат это не влияет
+    ни в SQLite (LIKE), ни в PostgreSQL. Прочие буквы SQLite сравнивает с учётом регистра, их не трогаем.
+    """
+    return ascii_lower(q.strip())
+
+
+def _generation(cache):
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # не 1: в кеше могли остаться результаты поколения, ключ которого вытеснен
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def invalidate_search():
+    """Устаревают все закешированные результаты поиска (после любого изменения записей)."""
+    cache = _cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, time.time_ns(), None)
+
+
+def _key(generation, engine, q):
+    digest = hashlib.sha1(q.encode()).hexdigest()
+    return f'photometadata:search:{generation}:{type(engine).__name__}:{digest}'
+
+
+def _lookup(q):
+    """
+    (ключ, строки) из кеша; строки None — промах. Если в кеше есть полный результат более короткого
+    префикса, ответ получается его сужением (engine.refine) без запроса к БД и тоже кешируется.
+    """
+    cache = _cache()
+    engine = get_search_engine()
+    # поколение читается до запроса к БД: изменение, сделанное во время поиска, сменит ключ
+    generation = _generation(cache)
+    prefixes = [q[:n] for n in range(len(q), max(len(q) - 1 - PREFIX_LOOKBACK, 0), -1)]
+    keys = {prefix: _key(generation, engine, prefix) for prefix in prefixes}
+    found = cache.get_many(list(keys.values()), version=SEARCH_CACHE_VERSION)
+
+    entry = found.get(keys[q])
+    if entry is not None:
+        count_search_cache('hit')
+        return keys[q], entry['rows']
+    for prefix in prefixes[1:]:
+        entry = found.get(keys[prefix])
+        if entry is None or not entry['complete']:
+            continue
+        rows = engine.refine(entry['rows'], q)
+        if rows is not None:
+            count_search_cache('refined')
+            cache.set(keys[q], {'rows': rows, 'complete': True}, _ttl(), version=SEARCH_CACHE_VERSION)
+            return keys[q], rows
+    return keys[q], None
+
+
+def _search(q, key):
+    rows = list(get_search_engine().search(q).values(*CACHED_FIELDS))
+    # полный результат (меньше лимита) годится для сужения более длинными запросами
+    entry = {'rows': rows, 'complete': len(rows) < SEARCH_LIMIT}
+    _cache().set(key, entry, _ttl(), version=SEARCH_CACHE_VERSION)
+    return rows
+
+
+# Запросы к БД, выполняющиеся сейчас: ключ -> Future. Одинаковые одновременные запросы
+# ждут первый, а не повторяют его (concurrent.futures: под WSGI у каждого запроса свой цикл событий)
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+async def search_records(q):
+    """Результаты поиска для q (словари RECORD_FIELDS): кеш, сужение префикса или один запрос к БД."""
+    q = normalize_query(q)
+    key, rows = await sync_to_async(_lookup)(q)
+    if rows is None:
+        with _inflight_lock:
+            future = _inflight.get(key)
+            leader = future is None
+            if leader:
+                future = _inflight[key] = concurrent.futures.Future()
+        if leader:
+            count_search_cache('miss')
+            try:
+                rows = await sync_to_async(_search)(q, key)
+                future.set_result(rows)
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with _inflight_lock:
+                    del _inflight[key]
+        else:
+            count_search_cache('coalesced')
+            rows = await asyncio.wrap_future(future)
+    return [{field: row[field] for field in RECORD_FIELDS} for row in rows]
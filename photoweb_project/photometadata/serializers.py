@@ -0,0 +1,24 @@
+# --------------------
+# Единое представление записи PhotoMetadata в JSON
+# --------------------
+
+# Поля записи в ответах AJAX (id + 11 полей метаданных + sha локального изображения для миниатюр
+# + версия, которую редактор возвращает при сохранении, см. PhotoMetadata.save_versioned)
+RECORD_FIELDS = [
+    'id', 'title', 'photographer', 'date_taken', 'url',
+    'description', 'location', 'tags', 'width', 'height', 'camera', 'license', 'image_sha256', 'version',
+]
+
+# Поля постраничных списков: нужен created_at для курсора (см. pagination.py)
+LIST_FIELDS = RECORD_FIELDS + ['created_at']
+
+
+def serialize_photo(obj):
+    """Словарь из RECORD_FIELDS для экземпляра модели; дата — в ISO (YYYY-MM-DD)."""
+    data = {field: getattr(obj, field) for field in RECORD_FIELDS}
+    date_taken = data['date_taken']
+    if hasattr(date_taken, 'isoformat'):
+        data['date_taken'] = date_taken.isoformat()
+    else:
+        data['date_taken'] = str(date_taken) if date_taken else ''
+    return data
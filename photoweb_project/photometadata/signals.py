@@ -0,0 +1,103 @@
+import contextlib
+import contextvars
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import facets
+from .changes import log_changes
+from .record_cache import forget_records
+from .models import ChangeLog, PhotoMetadata
+from .search_cache import invalidate_search
+from .snapshot import mark_changed
+from .tags import normalized_tags_enabled, sync_photo_tags
+
+
+# Массовые операции сами обновляют теги, фасеты и кеш одним запросом на пачку
+_bulk_operation = contextvars.ContextVar('photometadata_bulk_operation', default=False)
+
+
+@contextlib.contextmanager
+def bulk_operation():
+    """Отключает построчную обработку сигналов (queryset.delete() шлёт post_delete на каждую запись)."""
+    token = _bulk_operation.set(True)
+    try:
+        yield
+    finally:
+        _bulk_operation.reset(token)
+
+
+# --------------------
+# Поддержка производных таблиц при изменении PhotoMetadata
+# --------------------
+@receiver(post_save, sender=PhotoMetadata)
+def photo_saved_sync_tags(sender, instance, **kwargs):
+    if normalized_tags_enabled():
+        sync_photo_tags([instance])
+
+
+@receiver(pre_save, sender=PhotoMetadata)
+def photo_remember_facets(sender, instance, **kwargs):
+    # старые значения нужны, чтобы вычесть их из счётчиков фасетов
+    instance._facet_old = None
+    if instance.pk:
+        instance._facet_old = (
+            PhotoMetadata.objects.filter(pk=instance.pk).values(*facets.FACET_SOURCE_FIELDS).first()
+        )
+
+
+@receiver(post_save, sender=PhotoMetadata)
+def photo_saved_update_facets(sender, instance, **kwargs):
+    facets.record_changes(old=getattr(instance, '_facet_old', None), new=instance)
+
+
+@receiver(post_delete, sender=PhotoMetadata)
+def photo_deleted_update_facets(sender, instance, **kwargs):
+    if not _bulk_operation.get():
+        facets.record_changes(old=instance)
+
+
+@receiver(post_save, sender=PhotoMetadata)
+def photo_saved_forget_record(sender, instance, **kwargs):
+    # удаление, а не запись в кеш: колбэки двух транзакций могут выполниться не в порядке коммитов,
+    # и записанная последней устаревшая версия жила бы в кеше до истечения TTL
+    pk = instance.pk
+    transaction.on_commit(lambda: forget_records([pk]))
+
+
+@receiver(post_delete, sender=PhotoMetadata)
+def photo_deleted_forget_record(sender, instance, **kwargs):
+    if _bulk_operation.get():
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: forget_records([pk]))
+
+
+@receiver(post_save, sender=PhotoMetadata)
+@receiver(post_delete, sender=PhotoMetadata)
+def photo_changed_invalidate_search(sender, instance, **kwargs):
+    # массовые операции сбрасывают кеш поиска один раз на всю операцию (bulk.py)
+    if not _bulk_operation.get():
+        transaction.on_commit(invalidate_search)
+
+
+@receiver(post_save, sender=PhotoMetadata)
+@receiver(post_delete, sender=PhotoMetadata)
+def photo_changed_mark_snapshot(sender, instance, **kwargs):
+    if _bulk_operation.get():
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: mark_changed([pk]))
+
+
+@receiver(post_save, sender=PhotoMetadata)
+def photo_saved_log_change(sender, instance, **kwargs):
+    log_changes([instance.pk], ChangeLog.OP_UPSERT)
+
+
+@receiver(post_delete, sender=PhotoMetadata)
+def photo_deleted_log_change(sender, instance, **kwargs):
+    # удаление внутри транзакции Collector.delete — tombstone атомарен с ним
+    if not _bulk_operation.get():
+        log_changes([instance.pk], ChangeLog.OP_DELETE)
@@ -0,0 +1,254 @@
+import contextlib
+import gzip
+import hashlib
+import itertools
+import json
+import os
+import re
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import PhotoMetadata
+from .serializers import LIST_FIELDS
+
+try:
+    import fcntl
+except ImportError:  # Windows: межпроцессной блокировки нет
+    fcntl = None
+
+# Готовый снимок таблицы для клиентов, которым нужен весь каталог (media/snapshot):
+# куски по CHUNK_ROWS id в JSON Lines + gzip и манифест со списком кусков
+SNAPSHOT_DIR = getattr(settings, 'PHOTO_SNAPSHOT_DIR', os.path.join(settings.MEDIA_ROOT, 'snapshot'))
+# Записей с подряд идущими id в одном куске: изменение записи пересобирает только её кусок
+CHUNK_ROWS = getattr(settings, 'PHOTO_SNAPSHOT_CHUNK_ROWS', 1000)
+# Версия формата: при её смене (или смене CHUNK_ROWS) снимок собирается заново
+SNAPSHOT_FORMAT = 1
+# Сколько секунд хранить куски, выпавшие из манифеста (клиент мог получить прежний манифест)
+GC_GRACE_SECONDS = 300
+
+MANIFEST_NAME = 'manifest.json'
+DIRTY_NAME = 'dirty'
+LOCK_NAME = '.lock'
+# Отдельная короткая блокировка файла пометок: запись после коммита не ждёт идущую сборку
+DIRTY_LOCK_NAME = '.dirty-lock'
+# Через сколько секунд клиенту повторить запрос, если снимок ещё не собран
+RETRY_AFTER_SECONDS = 30
+# Пометка в DIRTY_NAME вместо номера куска
+FULL_REBUILD = '*'
+_CHUNK_RE = re.compile(r'^chunk-(\d{6,})-([0-9a-f]{20})\.jsonl\.gz$')
+
+
+class SnapshotNotReady(Exception):
+    """Снимок ещё ни разу не собран: полная сборка идёт в build_snapshot или воркере, не в запросе."""
+
+
+def chunk_index(pk):
+    return (pk - 1) // CHUNK_ROWS
+
+
+@contextlib.contextmanager
+def _locked(name=LOCK_NAME):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(SNAPSHOT_DIR, name), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _write_atomic(path, data):
+    fd, tmp = tempfile.mkstemp(dir=SNAPSHOT_DIR, prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as out:
+        out.write(data)
+    os.replace(tmp, path)
+
+
+def _read_manifest():
+    try:
+        with open(os.path.join(SNAPSHOT_DIR, MANIFEST_NAME)) as fh:
+            manifest = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('format') != SNAPSHOT_FORMAT or manifest.get('chunk_rows') != CHUNK_ROWS:
+        return None
+    return manifest
+
+
+# --------------------
+# События изменений
+# --------------------
+def mark_changed(pks):
+    """
+    Помечает куски с записями pks для пересборки; вызывается после коммита (signals.py, bulk.py).
+    Пока снимок ни разу не собирался, достаточно первой пометки: первая сборка прочитает всю таблицу.
+    id None (bulk_create без RETURNING на старом SQLite) — пересобрать весь снимок.
+    """
+    pks = list(pks)
+    if not pks:
+        return
+    marks = {FULL_REBUILD} if any(pk is None for pk in pks) else {chunk_index(pk) for pk in pks}
+    # блокировка только файла пометок: сборка забирает их до чтения таблицы, поэтому пометка,
+    # сделанная во время сборки (в том числе первой), останется и после неё
+    with _locked(DIRTY_LOCK_NAME):
+        if _has_dirty() and not os.path.exists(os.path.join(SNAPSHOT_DIR, MANIFEST_NAME)):
+            return
+        _append_dirty(marks)
+
+
+def _append_dirty(marks):
+    # вызывается под _locked(DIRTY_LOCK_NAME)
+    with open(os.path.join(SNAPSHOT_DIR, DIRTY_NAME), 'a') as fh:
+        fh.write(''.join(f'{mark}\n' for mark in sorted(marks)))
+
+
+def _take_dirty():
+    """Забирает пометки (файл удаляется): изменения после этого момента пометят куски заново."""
+    with _locked(DIRTY_LOCK_NAME):
+        dirty = _read_dirty()
+        if dirty:
+            os.remove(os.path.join(SNAPSHOT_DIR, DIRTY_NAME))
+    return dirty
+
+
+def _return_dirty(dirty):
+    if dirty:
+        with _locked(DIRTY_LOCK_NAME):
+            _append_dirty(dirty)
+
+
+def _read_dirty():
+    """Номера помеченных кусков; FULL_REBUILD среди них — пересобрать всё."""
+    try:
+        with open(os.path.join(SNAPSHOT_DIR, DIRTY_NAME)) as fh:
+            return {line.strip() for line in fh if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+def _has_dirty():
+    try:
+        return os.path.getsize(os.path.join(SNAPSHOT_DIR, DIRTY_NAME)) > 0
+    except OSError:
+        return False
+
+
+# --------------------
+# Сборка
+# --------------------
+def _write_chunk(index, rows):
+    raw = ''.join(json.dumps(row, ensure_ascii=False, cls=DjangoJSONEncoder) + '\n' for row in rows).encode()
+    etag = hashlib.sha256(raw).hexdigest()[:20]
+    name = f'chunk-{index:06d}-{etag}.jsonl.gz'
+    path = os.path.join(SNAPSHOT_DIR, name)
+    # имя зависит от содержимого: такой кусок уже лежит на диске — переписывать нечего
+    if not os.path.exists(path):
+        _write_atomic(path, gzip.compress(raw, mtime=0))
+    return {'index': index, 'name': name, 'etag': etag, 'rows': len(rows), 'bytes': os.path.getsize(path)}
+
+
+def _chunk_rows(index):
+    first = index * CHUNK_ROWS + 1
+    return list(
+        PhotoMetadata.objects.filter(id__gte=first, id__lt=first + CHUNK_ROWS).order_by('id').values(*LIST_FIELDS)
+    )
+
+
+def _build(manifest, dirty=None):
+    """Пересобирает куски dirty (None — весь снимок) и записывает новый манифест вместо manifest."""
+    previous = {chunk['name'] for chunk in manifest['chunks']} if manifest else set()
+    if dirty is None:
+        chunks = {}
+        rows = PhotoMetadata.objects.order_by('id').values(*LIST_FIELDS).iterator(chunk_size=CHUNK_ROWS)
+        for index, group in itertools.groupby(rows, key=lambda row: chunk_index(row['id'])):
+            chunks[index] = _write_chunk(index, list(group))
+    else:
+        chunks = {chunk['index']: chunk for chunk in manifest['chunks']}
+        for index in sorted(dirty):
+            rows = _chunk_rows(index)
+            if rows:
+                chunks[index] = _write_chunk(index, rows)
+            else:
+                chunks.pop(index, None)
+
+    chunks = [chunks[index] for index in sorted(chunks)]
+    version = hashlib.sha256(' '.join(chunk['etag'] for chunk in chunks).encode()).hexdigest()[:20]
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'chunk_rows': CHUNK_ROWS,
+        'version': version,
+        'fields': LIST_FIELDS,
+        'rows': sum(chunk['rows'] for chunk in chunks),
+        'chunks': chunks,
+    }
+    _write_atomic(os.path.join(SNAPSHOT_DIR, MANIFEST_NAME), json.dumps(manifest).encode())
+    # срок хранения выпавших кусков отсчитывается от этого момента, а не от их создания
+    for name in previous - {chunk['name'] for chunk in chunks}:
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(os.path.join(SNAPSHOT_DIR, name))
+    _collect_garbage(manifest)
+    return manifest
+
+
+def _collect_garbage(manifest):
+    live = {chunk['name'] for chunk in manifest['chunks']}
+    expired = time.time() - GC_GRACE_SECONDS
+    for name in os.listdir(SNAPSHOT_DIR):
+        path = os.path.join(SNAPSHOT_DIR, name)
+        if name.startswith('.tmp-') or (_CHUNK_RE.match(name) and name not in live):
+            with contextlib.suppress(FileNotFoundError):
+                if os.path.getmtime(path) < expired:
+                    os.remove(path)
+
+
+def full_build_pending():
+    """Нужна полная сборка: снимка нет (или он другого формата) либо помечен FULL_REBUILD."""
+    return _read_manifest() is None or FULL_REBUILD in _read_dirty()
+
+
+def current_manifest(full=False, build_full=True):
+    """
+    Актуальный манифест: если с прошлого раза записи менялись, пересобирает их куски
+    (нет снимка, другой формат или full — весь снимок).
+    build_full=False — для запросов: полная сборка не выполняется, вместо неё SnapshotNotReady
+    (снимка ещё нет) или прежний манифест (пометки остаются для build_snapshot и воркера).
+    """
+    if not full and not _has_dirty():
+        # манифест заменяется атомарно — читать его можно без блокировки
+        manifest = _read_manifest()
+        if manifest is not None:
+            return manifest
+    with _locked():
+        manifest = _read_manifest()
+        if not build_full and (manifest is None or FULL_REBUILD in _read_dirty()):
+            if manifest is None:
+                raise SnapshotNotReady
+            return manifest
+        dirty = _take_dirty()
+        try:
+            if full or manifest is None or FULL_REBUILD in dirty:
+                return _build(manifest)
+            if dirty:
+                return _build(manifest, {int(index) for index in dirty})
+            return manifest
+        except BaseException:
+            # сборка не удалась — пометки возвращаются для следующей попытки
+            _return_dirty(dirty)
+            raise
+
+
+def chunk_path(name):
+    """Путь к куску снимка по имени из манифеста. FileNotFoundError — если имя чужое или кусок удалён."""
+    if not _CHUNK_RE.match(name):
+        raise FileNotFoundError(name)
+    path = os.path.join(SNAPSHOT_DIR, name)
+    if not os.path.exists(path):
+        raise FileNotFoundError(name)
+    return path
+
+
+def chunk_etag(name):
+    return _CHUNK_RE.match(name).group(2)
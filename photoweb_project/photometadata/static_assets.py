@@ -0,0 +1,136 @@
+import functools
+import gzip
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import storages
+from django.utils._os import safe_join
+
+try:
+    import brotli
+except ImportError:  # без пакета Brotli — только gzip
+    brotli = None
+
+# Что сжимать при collectstatic: текстовые форматы (изображения и шрифты уже сжаты)
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.mjs', '.json', '.map', '.svg', '.txt', '.html', '.xml', '.ico'}
+# Файлы меньше этого (байт) не сжимаются: выигрыш меньше заголовков
+MIN_COMPRESS_BYTES = 256
+# Сжатая копия сохраняется, только если она меньше исходника хотя бы на столько
+MIN_COMPRESS_RATIO = 0.95
+# (Content-Encoding, расширение файла) в порядке предпочтения
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+# --------------------
+# collectstatic: имена с хешем содержимого (ManifestStaticFilesStorage) и сжатые копии .br/.gz
+# --------------------
+def compress_file(path):
+    """Пишет рядом с path копии .gz и (если установлен Brotli) .br; возвращает пути актуальных копий."""
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    if len(data) < MIN_COMPRESS_BYTES:
+        return []
+    variants = [('.gz', lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', lambda: brotli.compress(data, quality=11)))
+    written = []
+    mtime = os.path.getmtime(path)
+    for suffix, compress in variants:
+        target = path + suffix
+        if os.path.exists(target) and os.path.getmtime(target) >= mtime:
+            written.append(target)
+            continue
+        packed = compress()
+        if len(packed) > len(data) * MIN_COMPRESS_RATIO:
+            # не сжимается — прежняя копия (от другой версии файла) не должна отдаваться
+            if os.path.exists(target):
+                os.remove(target)
+            continue
+        tmp = target + '.tmp'
+        with open(tmp, 'wb') as out:
+            out.write(packed)
+        os.replace(tmp, target)
+        written.append(target)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage, который после подстановки хешей сжимает текстовые файлы (gzip, brotli):
+    сервер отдаёт готовую копию по Accept-Encoding, не сжимая на каждый запрос.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if not isinstance(processed, Exception):
+                names.update({name, hashed_name} if hashed_name else {name})
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for name in names:
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+                compress_file(self.path(name))
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # collectstatic ещё не запускался (разработка, бенчмарки): ссылка на файл без хеша,
+            # его отдаст static_asset без долгого кеширования
+            return name
+
+
+# --------------------
+# Отдача (views.static_asset)
+# --------------------
+@functools.lru_cache(maxsize=1)
+def _manifest_names(path, mtime):
+    # хранилище читает манифест один раз при создании, поэтому после collectstatic он перечитывается здесь
+    if path is None:
+        return frozenset()
+    return frozenset(storages['staticfiles'].load_manifest()[0].values())
+
+
+def _hashed_names():
+    """Имена с хешем из манифеста collectstatic; кеш сбрасывается при изменении mtime манифеста."""
+    storage = storages['staticfiles']
+    try:
+        path = storage.manifest_storage.path(storage.manifest_name)
+        mtime = os.stat(path).st_mtime_ns
+    except (AttributeError, OSError):
+        path = mtime = None
+    return _manifest_names(path, mtime)
+
+
+def find_asset(name):
+    """
+    (путь к файлу, имя с хешем ли) для имени под STATIC_URL. Сначала STATIC_ROOT (после collectstatic),
+    затем исходники из STATICFILES_DIRS и приложений (collectstatic не запускался). FileNotFoundError — файла нет.
+    """
+    try:
+        path = safe_join(settings.STATIC_ROOT, name)
+    except SuspiciousFileOperation:
+        raise FileNotFoundError(name)
+    if os.path.isfile(path):
+        return path, name in _hashed_names()
+    found = finders.find(name)
+    if found and os.path.isfile(found):
+        return found, False
+    raise FileNotFoundError(name)
+
+
+def pick_encoding(path, accept_encoding):
+    """(путь к отдаваемой копии, Content-Encoding или None) — сжатая копия, если клиент её принимает."""
+    accepted = set()
+    for part in accept_encoding.lower().split(','):
+        coding, _, params = part.partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.strip())
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted and os.path.isfile(path + suffix):
+            return path + suffix, encoding
+    return path, None
@@ -0,0 +1,539 @@
+import contextlib
+import json
+import os
+import re
+import tempfile
+import threading
+import uuid
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .fingerprint import content_hash
+from .metrics import count_json_io
+from .ingest import CHUNK_SIZE, JsonArrayReader, iter_unique_batches, ingest_json_upload, scan_json_file
+
+try:
+    import fcntl
+except ImportError:  # Windows: межпроцессной блокировки нет, остаётся только блокировка потоков
+    fcntl = None
+
+# Папка для JSON файлов (media/json)
+JSON_DIR = os.path.join(settings.MEDIA_ROOT, 'json')
+
+# Размер сегмента, после которого открывается новый (байт)
+SEGMENT_MAX_BYTES = getattr(settings, 'PHOTO_JSONL_SEGMENT_MAX_BYTES', 64 * 1024 * 1024)
+# Сколько закрытых сегментов должно накопиться, чтобы запустить фоновую компактификацию
+COMPACT_MIN_SEGMENTS = getattr(settings, 'PHOTO_JSONL_COMPACT_MIN_SEGMENTS', 4)
+
+
+# --------------------
+# Базовый интерфейс файлового хранилища
+# --------------------
+class BaseFileStore:
+    """
+    Хранилище записей в файлах внутри папки root.
+    Все представления читают и пишут файлы только через этот интерфейс.
+    Изменения файлов идут под _locked(): воркеры gunicorn — отдельные процессы.
+    """
+
+    LOCK_NAME = '.store.lock'
+
+    def __init__(self, root=JSON_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._thread_lock = threading.RLock()
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Блокировка хранилища: потоки процесса + flock между процессами (воркерами gunicorn)."""
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            fd = os.open(os.path.join(self.root, self.LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def list_files(self):
+        """Имена файлов с данными (для списка и просмотра)."""
+        raise NotImplementedError
+
+    def iter_records(self, name):
+        """Записи файла name по одной. FileNotFoundError — если такого файла нет."""
+        raise NotImplementedError
+
+    def read_records(self, name):
+        return list(self.iter_records(name))
+
+    def content_hashes(self):
+        """Отпечатки всех сохранённых записей (см. fingerprint.content_hash)."""
+        raise NotImplementedError
+
+    def append(self, records):
+        """
+        Дописывает записи, пропуская дубли. Возвращает (имя файла, число добавленных, создан ли файл).
+        """
+        raise NotImplementedError
+
+    def ingest(self, fileobj, report, progress=None, executor=None):
+        """
+        Потоково загружает JSON-массив из fileobj (см. ingest.iter_unique_batches).
+        executor — пул процессов для проверки записей (см. ingest.iter_validated).
+        Если в загрузке есть ошибки валидации, ничего не сохраняется.
+        Возвращает (имя файла, создан ли файл).
+        """
+        raise NotImplementedError
+
+    def path(self, name):
+        if os.path.basename(name) != name or name not in self.list_files():
+            raise FileNotFoundError(name)
+        return os.path.join(self.root, name)
+
+
+def get_file_store():
+    """Хранилище из settings.PHOTO_FILE_STORE (одно на процесс)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                path = getattr(settings, 'PHOTO_FILE_STORE', 'photometadata.storage.JsonlSegmentStore')
+                _store = import_string(path)()
+    return _store
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def use_file_store(store):
+    """Временно подменяет хранилище get_file_store() (бенчмарк работает в отдельном каталоге)."""
+    global _store
+    with _store_lock:
+        previous, _store = _store, store
+    try:
+        yield store
+    finally:
+        with _store_lock:
+            _store = previous
+
+
+# --------------------
+# Прежний формат: один JSON-массив, перезаписываемый целиком
+# --------------------
+def _json_files(root):
+    return [f for f in os.listdir(root) if f.lower().endswith('.json')]
+
+
+def _iter_json_array(path):
+    with open(path, 'rb') as fh:
+        reader = JsonArrayReader(fh)
+        try:
+            yield from reader
+        finally:
+            count_json_io('read', reader.bytes_read)
+
+
+class JsonArrayStore(BaseFileStore):
+    """
+    Записи хранятся в первом найденном *.json файле (массив с indent=4).
+    Каждое изменение — чтение и перезапись файла целиком, поэтому оно идёт под блокировкой хранилища
+    (иначе два воркера теряют записи друг друга), а новый файл подменяет старый атомарно (os.replace).
+    """
+
+    def list_files(self):
+        return _json_files(self.root)
+
+    def iter_records(self, name):
+        return _iter_json_array(self.path(name))
+
+    def _target(self):
+        existing = [f for f in os.listdir(self.root) if f.endswith('.json')]
+        if existing:
+            return existing[0], False
+        return f"{uuid.uuid4().hex}.json", True
+
+    def content_hashes(self):
+        name, created = self._target()
+        if created:
+            return set()
+        return scan_json_file(os.path.join(self.root, name))[0]
+
+    def append(self, records):
+        with self._locked():
+            return self._append(records)
+
+    def _append(self, records):
+        name, created = self._target()
+        json_path = os.path.join(self.root, name)
+        existing_data = []
+        if not created:
+            try:
+                with open(json_path, 'r', encoding='utf-8') as fh:
+                    count_json_io('read', os.fstat(fh.fileno()).st_size)
+                    existing_data = json.load(fh)
+                    if not isinstance(existing_data, list):
+                        existing_data = [existing_data]
+            except json.JSONDecodeError:
+                existing_data = []
+        seen = {content_hash(item) for item in existing_data}
+        added = 0
+        for record in records:
+            record_hash = content_hash(record)
+            if record_hash not in seen:
+                seen.add(record_hash)
+                existing_data.append(record)
+                added += 1
+        if added:
+            fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+                    json.dump(existing_data, fh, ensure_ascii=False, indent=4)
+                    count_json_io('write', fh.tell())
+                    fh.flush()
+                    os.fsync(fh.fileno())
+                os.replace(tmp_path, json_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            _fsync_dir(self.root)
+        return name, added, created and bool(added)
+
+    def ingest(self, fileobj, report, progress=None, executor=None):
+        # вся загрузка под блокировкой: сверка с файлом и его подмена должны видеть одно и то же содержимое
+        with self._locked():
+            name, created = self._target()
+            changed = ingest_json_upload(
+                fileobj, os.path.join(self.root, name), report, progress=progress, executor=executor)
+        if changed:
+            _fsync_dir(self.root)
+        return name, created and changed
+
+
+# --------------------
+# JSON Lines: сегменты только на дозапись
+# --------------------
+class JsonlSegmentStore(BaseFileStore):
+    """
+    Записи хранятся построчно в сегментах seg-NNNNNN.jsonl.
+    Запись идёт только в последний (активный) сегмент: строки дописываются одним
+    write() под межпроцессной блокировкой и сразу fsync'аются. Когда активный
+    сегмент превышает SEGMENT_MAX_BYTES, создаётся следующий (O_EXCL). Закрытые
+    сегменты в фоне склеиваются в один с удалением дублей и оборванных строк.
+
+    Отпечатки записей кешируются в процессе и дочитываются только с того места,
+    где остановились в прошлый раз, — проверка на дубль не перечитывает файлы.
+
+    *.json прежнего формата (JsonArrayStore) в той же папке видны в списке и при проверке на дубль,
+    но не меняются; перенести их в сегменты — manage.py convert_json_store.
+    """
+
+    SEGMENT_RE = re.compile(r'^seg-(\d{6})\.jsonl$')
+
+    def __init__(self, root=JSON_DIR, segment_max_bytes=None, compact_min_segments=None):
+        super().__init__(root)
+        self.segment_max_bytes = segment_max_bytes or SEGMENT_MAX_BYTES
+        self.compact_min_segments = compact_min_segments or COMPACT_MIN_SEGMENTS
+        self._hashes = set()
+        self._offsets = {}   # имя сегмента -> (inode, прочитано байт)
+        self._legacy = {}    # имя .json прежнего формата -> (inode, mtime, размер)
+        self._legacy_hashes = set()
+        self._compacting = False
+
+    # ---- сегменты ----
+    def _segments(self):
+        names = [f for f in os.listdir(self.root) if self.SEGMENT_RE.match(f)]
+        return sorted(names)
+
+    @staticmethod
+    def _segment_name(number):
+        return f"seg-{number:06d}.jsonl"
+
+    def list_files(self):
+        return sorted(_json_files(self.root)) + self._segments()
+
+    def _active_segment(self):
+        """Имя активного сегмента (с ротацией по размеру) и признак, что он только что создан."""
+        segments = self._segments()
+        if segments:
+            name = segments[-1]
+            if os.path.getsize(os.path.join(self.root, name)) < self.segment_max_bytes:
+                return name, False
+            number = int(self.SEGMENT_RE.match(name).group(1)) + 1
+        else:
+            number = 1
+        name = self._segment_name(number)
+        fd = os.open(os.path.join(self.root, name), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        os.close(fd)
+        _fsync_dir(self.root)
+        return name, True
+
+    # ---- чтение ----
+    @staticmethod
+    def _iter_lines(fh, offset=0):
+        """
+        Отдаёт (смещение конца строки, строка) для полных строк начиная с offset.
+        Оборванная последняя строка (запись прервалась) пропускается.
+        """
+        fh.seek(offset)
+        pos = offset
+        for line in fh:
+            if not line.endswith(b'\n'):
+                break
+            pos += len(line)
+            if line.strip():
+                yield pos, line
+
+    def iter_records(self, name):
+        if not self.SEGMENT_RE.match(name):
+            yield from _iter_json_array(self.path(name))
+            return
+        with open(self.path(name), 'rb') as fh:
+            for _, line in self._iter_lines(fh):
+                count_json_io('read', len(line))
+                yield json.loads(line)
+
+    def _refresh_hashes(self):
+        """Дочитывает новые строки всех сегментов в кеш отпечатков; файлы .json перечитываются, если изменились."""
+        segments = self._segments()
+        stats = {}
+        for name in segments:
+            try:
+                stats[name] = os.stat(os.path.join(self.root, name)).st_ino
+            except FileNotFoundError:
+                continue
+        legacy = {}
+        for name in _json_files(self.root):
+            try:
+                stat = os.stat(os.path.join(self.root, name))
+            except FileNotFoundError:
+                continue
+            legacy[name] = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if legacy != self._legacy:
+            self._legacy = legacy
+            self._legacy_hashes = set()
+            for name, (_, _, size) in legacy.items():
+                self._legacy_hashes |= scan_json_file(os.path.join(self.root, name))[0]
+                count_json_io('read', size)
+        # сегмент пропал или подменён компактификацией — перестраиваем кеш целиком
+        if any(stats.get(name) != ino for name, (ino, _) in self._offsets.items()):
+            self._hashes = set()
+            self._offsets = {}
+        for name, ino in stats.items():
+            _, start = self._offsets.get(name, (ino, 0))
+            offset = start
+            try:
+                with open(os.path.join(self.root, name), 'rb') as fh:
+                    for offset, line in self._iter_lines(fh, offset):
+                        self._hashes.add(content_hash(json.loads(line)))
+            except FileNotFoundError:
+                continue
+            count_json_io('read', offset - start)
+            self._offsets[name] = (ino, offset)
+
+    def content_hashes(self):
+        with self._thread_lock:
+            self._refresh_hashes()
+            return self._hashes | self._legacy_hashes
+
+    # ---- запись ----
+    def _write_lines(self, name, payload):
+        count_json_io('write', len(payload))
+        fd = os.open(os.path.join(self.root, name), os.O_WRONLY | os.O_APPEND)
+        try:
+            view = memoryview(payload)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _repair_tail(self, name):
+        """Обрезает оборванную последнюю строку, чтобы новая запись не склеилась с ней."""
+        path = os.path.join(self.root, name)
+        size = os.path.getsize(path)
+        if not size:
+            return
+        with open(path, 'r+b') as fh:
+            fh.seek(size - 1)
+            if fh.read(1) == b'\n':
+                return
+            pos = size
+            while pos > 0:
+                step = min(CHUNK_SIZE, pos)
+                fh.seek(pos - step)
+                block = fh.read(step)
+                newline = block.rfind(b'\n')
+                if newline != -1:
+                    pos = pos - step + newline + 1
+                    break
+                pos -= step
+            fh.truncate(pos)
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    def _commit(self, lines, skip_legacy=True):
+        """
+        Под блокировкой: отбрасывает дубли, дописывает строки в активный сегмент
+        (с ротацией, если он переполнился по ходу записи).
+        lines — итерируемое (отпечаток, строка JSON без перевода строки).
+        skip_legacy — дублем считается и запись из файлов .json прежнего формата (не при их переносе).
+        Возвращает (первый сегмент, в который шла запись, число добавленных, создан ли он).
+        Если добавлять нечего, сегмент не создаётся: возвращается последний файл хранилища (или None).
+        """
+        with self._locked():
+            self._refresh_hashes()
+            legacy_hashes = self._legacy_hashes if skip_legacy else set()
+            first = name = None
+            created = rotated = False
+            buf = []
+            size = 0
+            added = 0
+
+            def flush():
+                nonlocal first, name, created, rotated
+                # активный сегмент берётся только перед первой записью
+                name, new_segment = self._active_segment()
+                if first is None:
+                    first, created = name, new_segment
+                    self._repair_tail(name)
+                rotated = rotated or new_segment
+                self._write_lines(name, b''.join(buf))
+                # свои строки уже учтены в кеше — сдвигаем смещение, чтобы не перечитывать их
+                path = os.path.join(self.root, name)
+                self._offsets[name] = (os.stat(path).st_ino, os.path.getsize(path))
+
+            for record_hash, line in lines:
+                if record_hash in self._hashes or record_hash in legacy_hashes:
+                    continue
+                self._hashes.add(record_hash)
+                buf.append(line.encode('utf-8') + b'\n')
+                size += len(buf[-1])
+                added += 1
+                if size >= CHUNK_SIZE * 16:
+                    flush()
+                    buf, size = [], 0
+            if buf:
+                flush()
+            if first is None:
+                first = (self.list_files() or [None])[-1]
+        if rotated:
+            self.maybe_compact()
+        return first, added, created
+
+    def append(self, records):
+        lines = [(content_hash(r), json.dumps(r, ensure_ascii=False)) for r in records]
+        return self._commit(lines)
+
+    def ingest(self, fileobj, report, progress=None, executor=None):
+        # Отбор и валидация идут без блокировки во временный файл «отпечаток строка»;
+        # под блокировкой только дозапись (с повторной проверкой на дубли).
+        seen = self.content_hashes()
+        staging = tempfile.NamedTemporaryFile(
+            'w+', encoding='utf-8', dir=self.root, suffix='.part', delete=False)
+        try:
+            with staging:
+                for batch in iter_unique_batches(fileobj, seen, report, progress=progress, executor=executor):
+                    for record in batch:
+                        staging.write(f"{content_hash(record)} {json.dumps(record, ensure_ascii=False)}\n")
+                if report.invalid:
+                    return None, False
+                staging.seek(0)
+                lines = (line.rstrip('\n').split(' ', 1) for line in staging)
+                name, report.added, created = self._commit(lines)
+            return name, created
+        finally:
+            os.unlink(staging.name)
+
+    # ---- компактификация ----
+    def maybe_compact(self):
+        """Запускает компактификацию в фоновом потоке, если закрытых сегментов накопилось достаточно."""
+        if self._compacting or len(self._segments()) - 1 < self.compact_min_segments:
+            return
+        self._compacting = True
+        threading.Thread(target=self._compact_background, daemon=True).start()
+
+    def _compact_background(self):
+        try:
+            self.compact()
+        finally:
+            self._compacting = False
+
+    def compact(self):
+        """
+        Склеивает все закрытые сегменты в первый из них: без дублей и оборванных строк.
+        Всё — под блокировкой хранилища: список закрытых сегментов перечитывается под ней, поэтому
+        воркеры gunicorn, начавшие компактификацию одновременно, не склеивают одни и те же сегменты
+        (второй увидит уже склеенный). Новый сегмент пишется во временный файл и подменяется атомарно;
+        активный сегмент не трогается. Возвращает число склеенных сегментов.
+        """
+        with self._locked():
+            sealed = self._segments()[:-1]
+            if len(sealed) < 2:
+                return 0
+            fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.compact')
+            try:
+                seen = set()
+                merged = []
+                with os.fdopen(fd, 'wb') as out:
+                    for name in sealed:
+                        try:
+                            fh = open(os.path.join(self.root, name), 'rb')
+                        except FileNotFoundError:
+                            # сегмент уже убран — склеиваем оставшиеся
+                            continue
+                        with fh:
+                            for _, line in self._iter_lines(fh):
+                                record_hash = content_hash(json.loads(line))
+                                if record_hash in seen:
+                                    continue
+                                seen.add(record_hash)
+                                out.write(line)
+                        merged.append(name)
+                    out.flush()
+                    os.fsync(out.fileno())
+                if len(merged) < 2:
+                    os.unlink(tmp_path)
+                    return 0
+                os.replace(tmp_path, os.path.join(self.root, merged[0]))
+                for name in merged[1:]:
+                    with contextlib.suppress(FileNotFoundError):
+                        os.unlink(os.path.join(self.root, name))
+                _fsync_dir(self.root)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+        return len(merged)
+
+    # ---- перенос старых файлов ----
+    def import_json_file(self, json_path):
+        """Переносит записи из JSON-массива в сегменты (потоково, без дублей). Возвращает число добавленных."""
+        added = 0
+        with open(json_path, 'rb') as fh:
+            batch = []
+            for record in JsonArrayReader(fh):
+                batch.append((content_hash(record), json.dumps(record, ensure_ascii=False)))
+                if len(batch) >= 1000:
+                    added += self._commit(batch, skip_legacy=False)[1]
+                    batch = []
+            if batch:
+                added += self._commit(batch, skip_legacy=False)[1]
+        return added
+
+
+def _fsync_dir(path):
+    """fsync каталога, чтобы создание/переименование файла пережило сбой питания."""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
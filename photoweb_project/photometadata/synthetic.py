@@ -0,0 +1,210 @@
+import json
+import random
+from datetime import date, timedelta
+
+from .bulk import IMPORT_FIELDS
+
+# --------------------
+# Словари синтетических данных
+# Частоты неравномерные (как в настоящих архивах): немногие фотографы, камеры и теги
+# встречаются в большинстве записей, остальные — в «длинном хвосте».
+# --------------------
+FIRST_NAMES = [
+    'Anna', 'Ivan', 'Maria', 'Alexei', 'Olga', 'Dmitry', 'Elena', 'Sergei', 'Natalia', 'Pavel',
+    'Irina', 'Mikhail', 'Svetlana', 'Andrei', 'Tatiana', 'Nikolai', 'Yulia', 'Artem', 'Daria', 'Kirill',
+    'John', 'Emma', 'Lucas', 'Sofia', 'Mateo', 'Chloe', 'Noah', 'Mia', 'Kenji', 'Aiko',
+]
+LAST_NAMES = [
+    'Ivanova', 'Petrov', 'Smirnova', 'Volkov', 'Kuznetsova', 'Sokolov', 'Popova', 'Lebedev', 'Kozlova',
+    'Novikov', 'Morozova', 'Orlov', 'Pavlova', 'Fedorov', 'Vinogradova', 'Belov', 'Tarasova', 'Zaitsev',
+    'Smith', 'Garcia', 'Martin', 'Rossi', 'Muller', 'Dubois', 'Tanaka', 'Kowalski', 'Nielsen', 'Silva',
+]
+CAMERAS = [
+    ('Canon EOS 5D Mark IV', 14), ('Nikon D850', 12), ('Sony A7 III', 12), ('Fujifilm X-T4', 9),
+    ('iPhone 13 Pro', 10), ('iPhone 15 Pro', 8), ('Samsung Galaxy S23', 6), ('Google Pixel 7', 5),
+    ('Canon EOS R6', 6), ('Sony A7R IV', 5), ('Nikon Z6 II', 4), ('Fujifilm X100V', 4),
+    ('Olympus OM-D E-M10', 3), ('Panasonic Lumix GH5', 2), ('Leica Q2', 1), ('Ricoh GR III', 1),
+    ('Pentax K-1', 1), ('DJI Mavic 3', 2), ('GoPro HERO11', 2), ('Canon PowerShot G7 X', 1),
+]
+LOCATIONS = [
+    ('Moscow', 14), ('Saint Petersburg', 12), ('Kazan', 4), ('Sochi', 5), ('Baikal', 4), ('Kamchatka', 2),
+    ('Riga', 4), ('Tallinn', 3), ('Helsinki', 3), ('Berlin', 5), ('Paris', 6), ('Rome', 5), ('Barcelona', 5),
+    ('Lisbon', 3), ('Prague', 4), ('Vienna', 3), ('Istanbul', 4), ('Tbilisi', 3), ('Yerevan', 2),
+    ('Tokyo', 5), ('Kyoto', 3), ('New York', 6), ('San Francisco', 3), ('Reykjavik', 2), ('Cape Town', 1),
+    ('Sydney', 2), ('Buenos Aires', 1), ('Marrakesh', 1), ('Dubai', 2), ('Altai', 2),
+]
+LICENSES = [
+    ('All rights reserved', 40), ('CC BY 4.0', 25), ('CC BY-SA 4.0', 12), ('CC BY-NC 4.0', 10),
+    ('CC0', 8), ('Public Domain', 5),
+]
+TAGS = [
+    'sea', 'sky', 'sunset', 'city', 'night', 'portrait', 'nature', 'mountains', 'forest', 'street',
+    'architecture', 'travel', 'winter', 'summer', 'autumn', 'spring', 'people', 'animals', 'bird', 'cat',
+    'dog', 'flowers', 'macro', 'landscape', 'river', 'lake', 'beach', 'bridge', 'snow', 'rain',
+    'fog', 'clouds', 'sunrise', 'blackandwhite', 'film', 'drone', 'aerial', 'food', 'market', 'church',
+    'museum', 'park', 'garden', 'reflection', 'lights', 'festival', 'concert', 'sport', 'boat', 'train',
+    'car', 'road', 'desert', 'island', 'waterfall', 'volcano', 'glacier', 'canyon', 'village', 'harbor',
+    'lighthouse', 'castle', 'ruins', 'skyline', 'graffiti', 'children', 'wedding', 'family', 'fashion', 'studio',
+    'minimal', 'abstract', 'texture', 'pattern', 'silhouette', 'shadow', 'golden-hour', 'blue-hour', 'stars', 'moon',
+]
+# (ширина, высота) типичных кадров: полный кадр, APS-C, телефоны, видео
+FRAME_SIZES = [
+    ((6000, 4000), 20), ((4000, 3000), 18), ((4032, 3024), 16), ((3840, 2160), 8), ((1920, 1080), 8),
+    ((5472, 3648), 8), ((8256, 5504), 4), ((6240, 4160), 6), ((2048, 1536), 4), ((1080, 1080), 4),
+    ((7952, 5304), 2), ((3000, 2000), 2),
+]
+SUBJECTS = [
+    'view', 'morning', 'evening', 'walk', 'street', 'harbor', 'bridge', 'portrait', 'skyline', 'garden',
+    'market', 'shore', 'trail', 'square', 'rooftops', 'lights', 'reflections', 'clouds', 'details', 'crossing',
+]
+ADJECTIVES = [
+    'Quiet', 'Golden', 'Misty', 'Old', 'Blue', 'Late', 'Early', 'Rainy', 'Bright', 'Silent',
+    'Winter', 'Summer', 'Northern', 'Empty', 'Busy', 'Distant', 'Warm', 'Cold', 'Hidden', 'Last',
+]
+SENTENCES = [
+    "Shot handheld at {location}.",
+    "{adjective} light over {location}, {tag} in the frame.",
+    "Part of a series about {tag} and {tag2}.",
+    "Taken on a {camera} during a trip to {location}.",
+    "Long exposure, tripod, no filters.",
+    "The {tag} was the reason I stopped here.",
+    "One of the first frames of the day.",
+    "Edited lightly: exposure and white balance only.",
+    "Waited almost an hour for the {tag2} to line up.",
+    "{location} at its most {adjective_lower}.",
+]
+
+PHOTOGRAPHER_COUNT = 300
+MAX_TAGS = 10
+FIRST_YEAR = 2005
+LAST_DATE = date(2025, 6, 30)
+
+
+def _zipf_weights(n, s=1.1):
+    return [1 / (rank ** s) for rank in range(1, n + 1)]
+
+
+def _weighted(pairs):
+    values, weights = zip(*pairs)
+    return list(values), list(weights)
+
+
+# --------------------
+# Генератор записей
+# --------------------
+class PhotoGenerator:
+    """
+    Воспроизводимые (по seed) синтетические записи с полями IMPORT_FIELDS, проходящие validate_json_data.
+    Распределения: фотографы и теги — по закону Ципфа, камеры, места, лицензии и размеры кадра —
+    по весам выше, даты — чаще недавние, описания — от одного до нескольких предложений.
+    duplicate_ratio — доля записей, повторяющих одну из уже выданных (для проверки отсева дублей).
+    """
+
+    def __init__(self, seed=0, duplicate_ratio=0.0):
+        self.rng = random.Random(seed)
+        self.duplicate_ratio = duplicate_ratio
+        self.serial = 0
+        self.recent = []
+        names = random.Random(0)
+        self.photographers = [
+            f"{names.choice(FIRST_NAMES)} {names.choice(LAST_NAMES)}" for _ in range(PHOTOGRAPHER_COUNT)
+        ]
+        self.photographer_weights = _zipf_weights(PHOTOGRAPHER_COUNT)
+        self.tag_weights = _zipf_weights(len(TAGS))
+        self.cameras = _weighted(CAMERAS)
+        self.locations = _weighted(LOCATIONS)
+        self.licenses = _weighted(LICENSES)
+        self.sizes = _weighted(FRAME_SIZES)
+        years = list(range(FIRST_YEAR, LAST_DATE.year + 1))
+        # каждый следующий год снимают примерно на 15% больше
+        self.years = (years, [1.15 ** (year - FIRST_YEAR) for year in years])
+
+    def _pick(self, pair):
+        return self.rng.choices(pair[0], pair[1])[0]
+
+    def _date(self):
+        year = self._pick(self.years)
+        first = date(year, 1, 1)
+        last = min(date(year, 12, 31), LAST_DATE)
+        return first + timedelta(days=self.rng.randrange((last - first).days + 1))
+
+    def _tags(self):
+        # в среднем около трёх тегов, у части записей тегов нет; больше MAX_TAGS не бывает
+        count = MAX_TAGS + 1
+        while count > MAX_TAGS:
+            count = int(self.rng.expovariate(1 / 3))
+        tags = []
+        while len(tags) < count:
+            tag = self.rng.choices(TAGS, self.tag_weights)[0]
+            if tag not in tags:
+                tags.append(tag)
+        return tags
+
+    def make(self):
+        """Одна новая запись (dict)."""
+        rng = self.rng
+        self.serial += 1
+        photographer = rng.choices(self.photographers, self.photographer_weights)[0]
+        location = self._pick(self.locations)
+        camera = self._pick(self.cameras)
+        tags = self._tags()
+        width, height = self._pick(self.sizes)
+        if rng.random() < 0.3:
+            width, height = height, width
+        adjective = rng.choice(ADJECTIVES)
+        context = {
+            'location': location, 'camera': camera, 'adjective': adjective, 'adjective_lower': adjective.lower(),
+            'tag': tags[0] if tags else 'light', 'tag2': tags[-1] if tags else 'shadow',
+        }
+        description = ' '.join(
+            rng.choice(SENTENCES).format(**context) for _ in range(1 + min(int(rng.expovariate(0.7)), 6))
+        )
+        title = f"{adjective} {rng.choice(SUBJECTS)}"
+        if rng.random() < 0.5:
+            title += f", {location}"
+        slug = photographer.lower().replace(' ', '-')
+        return {
+            'title': title,
+            'photographer': photographer,
+            'date_taken': self._date().isoformat(),
+            'url': f"https://photos.example.com/{slug}/{rng.getrandbits(64):016x}-{self.serial}.jpg",
+            'description': description,
+            'location': location,
+            'tags': ','.join(tags),
+            'width': width,
+            'height': height,
+            'camera': camera,
+            'license': self._pick(self.licenses),
+        }
+
+    def __iter__(self):
+        while True:
+            if self.recent and self.rng.random() < self.duplicate_ratio:
+                yield dict(self.rng.choice(self.recent))
+                continue
+            record = self.make()
+            # дубли берутся из последних записей — как повторная загрузка того же файла
+            if len(self.recent) < 1000:
+                self.recent.append(record)
+            else:
+                self.recent[self.rng.randrange(1000)] = record
+            yield record
+
+
+def generate_photos(count, seed=0, duplicate_ratio=0.0):
+    """count синтетических записей (генератор dict с полями IMPORT_FIELDS)."""
+    generator = iter(PhotoGenerator(seed, duplicate_ratio))
+    for _ in range(count):
+        yield next(generator)
+
+
+def write_json_array(records, out):
+    """Пишет записи в текстовый поток out как JSON-массив, не собирая их в памяти. Возвращает число записей."""
+    count = 0
+    out.write('[')
+    for record in records:
+        out.write(',\n' if count else '\n')
+        json.dump({f: record[f] for f in IMPORT_FIELDS}, out, ensure_ascii=False)
+        count += 1
+    out.write('\n]\n')
+    return count
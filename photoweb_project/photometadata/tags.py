@@ -0,0 +1,113 @@
+import re
+
+from django.conf import settings
+from django.db import models
+
+from .models import PhotoTag, Tag
+
+_HASHTAG_RE = re.compile(r'^#\S+(\s+#\S+)+$')
+
+
+# --------------------
+# Разбор CSV-тегов
+# --------------------
+def normalize_tag(name):
+    """'  #Sea ' -> 'sea'."""
+    return name.strip().lstrip('#').strip().lower()
+
+
+def parse_tags(csv):
+    """
+    Разбивает CSV-строку тегов на нормализованные имена без повторов (порядок сохраняется).
+    Часть вида '#sea #sky' (хештеги через пробел) тоже делится на отдельные теги.
+    """
+    names = []
+    for part in (csv or '').split(','):
+        part = part.strip()
+        tokens = part.split() if _HASHTAG_RE.match(part) else [part]
+        for token in tokens:
+            name = normalize_tag(token)[:100]
+            if name and name not in names:
+                names.append(name)
+    return names
+
+
+def normalized_tags_enabled():
+    return getattr(settings, 'PHOTO_NORMALIZED_TAGS', False)
+
+
+# --------------------
+# Синхронизация таблиц Tag / PhotoTag с CSV-полем
+# --------------------
+def sync_photo_tags(photos):
+    """
+    Пересобирает связи PhotoTag для записей photos (экземпляры или dict с 'id' и 'tags').
+    Пакетно: один запрос на недостающие теги, одно удаление и одна вставка связей.
+    """
+    wanted = {}
+    for photo in photos:
+        if isinstance(photo, dict):
+            wanted[photo['id']] = parse_tags(photo['tags'])
+        else:
+            wanted[photo.pk] = parse_tags(photo.tags)
+    if not wanted:
+        return
+
+    names = {name for tag_names in wanted.values() for name in tag_names}
+    Tag.objects.bulk_create([Tag(name=n) for n in names], ignore_conflicts=True)
+    tag_ids = dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+
+    PhotoTag.objects.filter(photo_id__in=list(wanted)).delete()
+    PhotoTag.objects.bulk_create([
+        PhotoTag(photo_id=photo_id, tag_id=tag_ids[name])
+        for photo_id, tag_names in wanted.items()
+        for name in tag_names
+    ], batch_size=1000)
+
+
+# --------------------
+# Запросы по тегам
+# --------------------
+def _csv_tag_q(name):
+    """
+    Точное совпадение тега в CSV-строке (без таблиц) по тем же правилам, что parse_tags:
+    тег — часть между запятыми ('street photo' — один тег, 'street' с ним не совпадает),
+    а часть из одних хештегов через пробел ('#sea #sky') — несколько тегов. '#sea' не совпадает с '#seaside'.
+    """
+    name = re.escape(name)
+    whole_part = r'\s*#*\s*' + name + r'\s*'
+    hashtag = r'(#[^\s,]+\s+)*#+' + name + r'(\s+#[^\s,]+)*\s*'
+    return models.Q(tags__iregex=r'(^|,)\s*(' + whole_part + '|' + hashtag + r')(,|$)')
+
+
+def filter_by_tags(queryset, names, mode='any'):
+    """
+    Отбирает записи с тегами names.
+    mode='any' — хотя бы один из тегов, 'all' — все теги; один тег — точное совпадение.
+    При PHOTO_NORMALIZED_TAGS запрос идёт по индексу PhotoTag, иначе — по CSV-полю.
+    """
+    names = [n for n in (normalize_tag(n) for n in names) if n]
+    if not names:
+        return queryset.none()
+    names = list(dict.fromkeys(names))
+
+    if not normalized_tags_enabled():
+        cond = models.Q()
+        for name in names:
+            if mode == 'all':
+                cond &= _csv_tag_q(name)
+            else:
+                cond |= _csv_tag_q(name)
+        return queryset.filter(cond)
+
+    links = PhotoTag.objects.filter(tag__name__in=names)
+    if mode == 'all' and len(names) > 1:
+        photo_ids = (
+            links.values('photo_id')
+            .annotate(matched=models.Count('tag_id', distinct=True))
+            .filter(matched=len(names))
+            .values('photo_id')
+        )
+    else:
+        photo_ids = links.values('photo_id')
+    return queryset.filter(id__in=photo_ids)
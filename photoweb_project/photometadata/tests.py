@@ -1,3 +1,1560 @@
-from django.test import TestCase
+import copy
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import runpy
+import shutil
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connection, transaction
+from django.db.utils import ConnectionHandler
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, modify_settings, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from photoweb_project import tuning
+
+from . import (
+    catalogue, export, facets, images, jobs, metrics, middleware, near_duplicates, search_cache, snapshot, static_assets,
+    validation,
+)
+from .bulk import bulk_update_records, import_batch
+from .changes import assign_sequence, compact_changes, encode_cursor, log_changes, read_changes
+from .fingerprint import content_hash, existing_hashes
+from .ingest import IngestReport, JsonArrayReader
+from .models import ChangeLog, Job, PhotoMetadata, PhotoTag
+from .pagination import decode_cursor, keyset_page
+from .record_cache import get_record
+from .search import PostgresSearchEngine, SimpleSearchEngine
+from .serializers import LIST_FIELDS, RECORD_FIELDS
+from .storage import JsonlSegmentStore
+from .synthetic import generate_photos
+from .tags import filter_by_tags, parse_tags
+
+
+def make_photo(**fields):
+    data = {
+        'title': 'photo', 'photographer': 'Test', 'date_taken': '2024-01-01', 'url': 'https://example.com/1.jpg',
+        'description': 'test photo', 'location': 'Berlin', 'width': 10, 'height': 10, 'camera': 'X100V',
+        'license': 'CC BY',
+    }
+    data.update(fields)
+    return PhotoMetadata.objects.create(**data)
+
+
+def use_temp_snapshot_dir(test):
+    """Колбэки коммита помечают куски снимка (snapshot.mark_changed) — во временном каталоге, не в рабочем media/."""
+    root = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, root, True)
+    patcher = mock.patch.object(snapshot, 'SNAPSHOT_DIR', root)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
+FIXTURE_IMAGES = os.path.join(os.path.dirname(__file__), 'fixtures', 'images')
+
+
+def fixture_image(name):
+    return os.path.join(FIXTURE_IMAGES, name)
+
+
+# --------------------
+# Потоковое чтение JSON-массива (ingest.py)
+# --------------------
+class JsonArrayReaderTests(SimpleTestCase):
+    def read(self, data, **kwargs):
+        return list(JsonArrayReader(io.BytesIO(data.encode()), **kwargs))
+
+    def test_array_across_chunk_boundaries(self):
+        records = [{'title': f'Фото {i}', 'width': i} for i in range(200)]
+        self.assertEqual(self.read(json.dumps(records, ensure_ascii=False), chunk_size=7), records)
+
+    def test_single_object_and_empty_array(self):
+        self.assertEqual(self.read('{"a": 1}'), [{'a': 1}])
+        self.assertEqual(self.read(' [ ] '), [])
+
+    def test_number_at_chunk_end_is_not_truncated(self):
+        self.assertEqual(self.read('[12345678]', chunk_size=4), [12345678])
+
+    def test_syntax_error(self):
+        with self.assertRaises(json.JSONDecodeError):
+            self.read('[{"a": 1} {"b": 2}]')
+
+    def test_syntax_error_does_not_read_whole_file(self):
+        # битая запись, за которой ещё много данных: ошибка — как только хвост превысил max_record
+        data = '[{"a": 1, oops' + ' ' * 100000 + ']'
+        fh = io.BytesIO(data.encode())
+        reader = JsonArrayReader(fh, chunk_size=64, max_record=1000)
+        with self.assertRaises(json.JSONDecodeError):
+            list(reader)
+        self.assertLess(reader.bytes_read, 5000)
+
+    def test_record_longer_than_limit(self):
+        with self.assertRaises(json.JSONDecodeError):
+            self.read('[{"a": "' + 'x' * 5000 + '"}]', chunk_size=64, max_record=1000)
+
+
+# --------------------
+# Сегменты JSON Lines (storage.py)
+# --------------------
+class JsonlSegmentStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+
+    def make_store(self):
+        # компактификация в тестах запускается явно
+        return JsonlSegmentStore(self.root, segment_max_bytes=200, compact_min_segments=10 ** 6)
+
+    def fill(self, store, count):
+        records = [{'title': f'photo {i}', 'width': i} for i in range(count)]
+        for i in range(0, count, 3):
+            store.append(records[i:i + 3])
+        return records
+
+    def stored(self, store):
+        return [r for name in store.list_files() for r in store.iter_records(name)]
+
+    def test_append_skips_duplicates(self):
+        store = self.make_store()
+        records = self.fill(store, 30)
+        self.assertEqual(store.append(records[:5])[1], 0)
+        self.assertEqual(len(self.stored(store)), 30)
+        self.assertEqual(store.content_hashes(), {content_hash(r) for r in records})
+
+    def test_nothing_to_add_creates_no_segment(self):
+        store = self.make_store()
+        self.assertEqual(store.append([]), (None, 0, False))
+        self.assertEqual(store.list_files(), [])
+        records = self.fill(store, 3)
+        # активный сегмент переполнен: при одних дублях следующий не открывается
+        with mock.patch.object(store, 'segment_max_bytes', 1):
+            self.assertEqual(store.append(records), ('seg-000001.jsonl', 0, False))
+        self.assertEqual(store.list_files(), ['seg-000001.jsonl'])
+
+    def test_upload_with_nothing_new(self):
+        store = self.make_store()
+        url = reverse('photometadata:index')
+        with mock.patch('photometadata.views.get_file_store', return_value=store), \
+                mock.patch('photometadata.views.background_uploads_enabled', return_value=False), \
+                mock.patch('django.contrib.messages.api.add_message') as add_message:
+            self.client.post(url, {'upload_file': 'file', 'file': SimpleUploadedFile('empty.json', b'[]')})
+        self.assertEqual(store.list_files(), [])
+        text = add_message.call_args.args[2]
+        self.assertIn('Новых записей нет', text)
+        self.assertNotIn('None', text)
+
+    def test_reads_legacy_json_files(self):
+        legacy = [{'title': f'old {i}', 'width': i} for i in range(3)]
+        with open(os.path.join(self.root, 'photos.json'), 'w', encoding='utf-8') as out:
+            json.dump(legacy, out, indent=4)
+        store = self.make_store()
+        self.assertEqual(store.list_files(), ['photos.json'])
+        self.assertEqual(store.read_records('photos.json'), legacy)
+        self.assertEqual(store.append(legacy), ('photos.json', 0, False))
+        name, added, created = store.append(legacy[:1] + [{'title': 'new', 'width': 9}])
+        self.assertEqual((name, added, created), ('seg-000001.jsonl', 1, True))
+        self.assertEqual(store.list_files(), ['photos.json', 'seg-000001.jsonl'])
+        self.assertEqual(len(self.stored(store)), 4)
+        records, total = catalogue.read_page(store, 'photos.json', page=2, page_size=2)
+        self.assertEqual((records, total), (legacy[2:], 3))
+
+        # после переноса (convert_json_store переименовывает файл в .json.bak) отпечатки остаются в сегментах
+        self.assertEqual(store.import_json_file(os.path.join(self.root, 'photos.json')), 3)
+        os.replace(os.path.join(self.root, 'photos.json'), os.path.join(self.root, 'photos.json.bak'))
+        self.assertEqual(store.list_files(), ['seg-000001.jsonl'])
+        self.assertEqual(store.append(legacy)[1], 0)
+        self.assertEqual(len(self.stored(store)), 4)
+
+    def test_concurrent_compaction(self):
+        # два процесса (разные экземпляры — разные flock) склеивают одни и те же сегменты одновременно
+        first = self.make_store()
+        records = self.fill(first, 60)
+        self.assertGreater(len(first.list_files()), 3)
+        stores = [first, self.make_store()]
+        errors, merged = [], []
+        barrier = threading.Barrier(2)
+
+        def run(store):
+            barrier.wait()
+            try:
+                merged.append(store.compact())
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(store,)) for store in stores]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(merged)[0], 0)
+        self.assertEqual(len(first.list_files()), 2)
+        stored = self.stored(first)
+        self.assertEqual(len(stored), len(records))
+        self.assertEqual({content_hash(r) for r in stored}, {content_hash(r) for r in records})
+
+
+# --------------------
+# Индекс смещений записей в файлах хранилища (catalogue.py)
+# --------------------
+class CatalogueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+        self.store = JsonlSegmentStore(self.root, compact_min_segments=10 ** 6)
+
+    def append(self, start, count):
+        return self.store.append([{'title': f'photo {i}', 'width': i} for i in range(start, start + count)])[0]
+
+    def test_read_page_after_append(self):
+        name = self.append(0, 5)
+        records, total = catalogue.read_page(self.store, name, page=1, page_size=3)
+        self.assertEqual((total, [r['width'] for r in records]), (5, [0, 1, 2]))
+        index = catalogue.file_index(self.store.path(name))
+        size = index.size
+        self.assertEqual(self.append(5, 4), name)
+        records, total = catalogue.read_page(self.store, name, page=3, page_size=3)
+        self.assertEqual((total, [r['width'] for r in records]), (9, [6, 7, 8]))
+        # опубликованный индекс не дописывается на месте: его мог читать другой поток
+        self.assertEqual((index.count, index.size), (5, size))
+        self.assertEqual(catalogue.file_index(self.store.path(name)).count, 9)
+
+    def test_json_list_counts_follow_appends(self):
+        name = self.append(0, 2)
+        url = reverse('photometadata:json_list')
+        with mock.patch('photometadata.views.get_file_store', return_value=self.store):
+            self.assertEqual([(f['name'], f['count']) for f in self.client.get(url).context['files']], [(name, 2)])
+            self.append(2, 3)
+            self.assertEqual([(f['name'], f['count']) for f in self.client.get(url).context['files']], [(name, 5)])
+
+    def test_index_array_strings_with_brackets_and_escapes(self):
+        records = [
+            {'title': 'quote " and ] bracket', 'tags': '[not, an, array]'},
+            {'title': 'backslash at end \\', 'nested': {'a': [1, {'b': '}{'}]}},
+            {'title': '\\" escaped backslash then quote', 'url': 'https://example.com/{x}'},
+            {'title': 'unicode \u005d ]]}}'},
+        ]
+        path = os.path.join(self.root, 'array.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(records, indent=1))
+        index = catalogue.file_index(path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.assertEqual([json.loads(data[s:e]) for s, e in zip(index.starts, index.ends)], records)
+
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(records[1], f)
+        index = catalogue.file_index(path)
+        self.assertEqual(index.count, 1)
+
+
+# --------------------
+# Массовый импорт (bulk.py)
+# --------------------
+@override_settings(PHOTO_NORMALIZED_TAGS=True)
+class ImportBatchTests(TestCase):
+    def test_import_skips_duplicates(self):
+        records = list(generate_photos(20, seed=1))
+        report = IngestReport()
+        import_batch(records + records[:5], report)
+        self.assertEqual(PhotoMetadata.objects.count(), 20)
+        import_batch(records[:10], report)
+        self.assertEqual(PhotoMetadata.objects.count(), 20)
+
+    def test_ids_resolved_without_returning(self):
+        # SQLite < 3.35: bulk_create не возвращает id — теги и журнал должны получить настоящие id
+        records = list(generate_photos(30, seed=2))
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert',
+                               new_callable=mock.PropertyMock, return_value=False):
+            import_batch(records, IngestReport())
+        ids = set(PhotoMetadata.objects.values_list('id', flat=True))
+        self.assertEqual(len(ids), 30)
+        tagged = {pk for pk, tags in PhotoMetadata.objects.values_list('id', 'tags') if parse_tags(tags)}
+        self.assertTrue(tagged)
+        self.assertEqual(set(PhotoTag.objects.values_list('photo_id', flat=True)), tagged)
+        self.assertEqual(set(ChangeLog.objects.values_list('photo_id', flat=True)), ids)
+
+    @skipUnless(connection.vendor == 'postgresql', 'нужен PostgreSQL')
+    def test_copy_keeps_empty_strings(self):
+        # пустое поле CSV для COPY — NULL; tags: "" должно остаться пустой строкой
+        records = [{**record, 'tags': ''} for record in generate_photos(3, seed=3)]
+        report = IngestReport()
+        import_batch(records, report, use_copy=True)
+        self.assertEqual(report.added, 3)
+        self.assertEqual(set(PhotoMetadata.objects.values_list('tags', flat=True)), {''})
+
+
+
+# --------------------
+# Массовое изменение (bulk.py)
+# --------------------
+class BulkUpdateTests(TestCase):
+    def test_duplicate_keeps_its_hash(self):
+        # first уже содержит изменения: его отпечаток не меняется, а second после изменения совпал бы с ним
+        first = make_photo(title='same')
+        second = make_photo(title='other')
+        results = bulk_update_records([second.pk, first.pk], {'title': 'same'})
+        self.assertEqual(results, {second.pk: 'duplicate', first.pk: 'updated'})
+        self.assertEqual(PhotoMetadata.objects.get(pk=second.pk).title, 'other')
+
+    def test_outside_duplicate(self):
+        make_photo(title='same')
+        photo = make_photo(title='other')
+        self.assertEqual(bulk_update_records([photo.pk, 0], {'title': 'same'}), {photo.pk: 'duplicate', 0: 'not_found'})
+
+    def test_filter_values_must_be_strings(self):
+        photo = make_photo(title='sea', tags='sea')
+        for name, changes in [('db_bulk_update_ajax', {'changes': {'license': 'CC0'}}), ('db_bulk_delete_ajax', {})]:
+            for bad in ({'tags': ['sea']}, {'q': 5}, {'q': 'sea', 'mode': 1}):
+                with self.subTest(name, **bad):
+                    response = self.client.post(reverse(f'photometadata:{name}'),
+                                                json.dumps({**changes, 'filter': bad}), content_type='application/json')
+                    self.assertEqual(response.status_code, 400)
+        self.assertTrue(PhotoMetadata.objects.filter(pk=photo.pk, license=photo.license).exists())
+
+
+# --------------------
+# Оптимистичная блокировка по version (PhotoMetadata.save_versioned, db_update_ajax)
+# --------------------
+class VersionedSaveTests(TestCase):
+    def setUp(self):
+        self.photo = make_photo(title='original')
+
+    def edit(self, version, **fields):
+        data = {field: getattr(self.photo, field) for field in (
+            'title', 'photographer', 'date_taken', 'url', 'description', 'location', 'tags', 'width', 'height',
+            'camera', 'license')}
+        data.update(fields, date_taken=str(data['date_taken']), version=version)
+        return self.client.post(reverse('photometadata:db_update_ajax', args=[self.photo.pk]),
+                                json.dumps(data), content_type='application/json')
+
+    def test_second_save_with_same_version_fails(self):
+        first, second = PhotoMetadata.objects.get(pk=self.photo.pk), PhotoMetadata.objects.get(pk=self.photo.pk)
+        first.title, second.title = 'first', 'second'
+        self.assertTrue(first.save_versioned(1))
+        self.assertFalse(second.save_versioned(1))
+        current = PhotoMetadata.objects.get(pk=self.photo.pk)
+        self.assertEqual((current.title, current.version), ('first', 2))
+        PhotoMetadata.objects.filter(pk=self.photo.pk).delete()
+        self.assertFalse(first.save_versioned(2))
+
+    def test_concurrent_edits_one_conflict(self):
+        # оба редактора прошли проверку версии в представлении; второй сохраняет первым
+        save_versioned = PhotoMetadata.save_versioned
+
+        def racing(obj, version):
+            other = PhotoMetadata.objects.get(pk=obj.pk)
+            other.title = 'other editor'
+            self.assertTrue(save_versioned(other, version))
+            return save_versioned(obj, version)
+
+        with mock.patch.object(PhotoMetadata, 'save_versioned', autospec=True, side_effect=racing):
+            response = self.edit(1, title='mine')
+        self.assertEqual(response.status_code, 409)
+        self.assertTrue(response.json()['conflict'])
+        self.assertEqual(response.json()['item']['title'], 'other editor')
+        current = PhotoMetadata.objects.get(pk=self.photo.pk)
+        self.assertEqual((current.title, current.version), ('other editor', 2))
+
+    def test_stale_version(self):
+        response = self.edit(1, title='mine')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['item']['version'], 2)
+        response = self.edit(1, title='stale')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(PhotoMetadata.objects.get(pk=self.photo.pk).title, 'mine')
+
+    def test_bulk_update_bumps_version(self):
+        same = make_photo(title='same')
+        results = bulk_update_records([self.photo.pk, same.pk], {'title': 'same'})
+        self.assertEqual(results, {self.photo.pk: 'duplicate', same.pk: 'updated'})
+        versions = dict(PhotoMetadata.objects.values_list('id', 'version'))
+        self.assertEqual(versions, {self.photo.pk: 1, same.pk: 2})
+        bulk_update_records([self.photo.pk], {'license': 'CC0'})
+        self.assertEqual(PhotoMetadata.objects.get(pk=self.photo.pk).version, 2)
+        # редактор, открывший запись до массового изменения, получает 409
+        self.assertEqual(self.edit(1, title='mine').status_code, 409)
+
+# --------------------
+# Фильтр по тегам (tags.py): CSV-поле и таблицы Tag/PhotoTag дают одно и то же
+# --------------------
+class TagFilterTests(TestCase):
+    TAGS = [
+        'street photo', 'street, city', '#street #night', '#Street', 'streets', 'night street',
+        '  Sea ,  sky ', '#sea #seaside', 'seaside', 'город, Улица', '#street extra', '',
+    ]
+    QUERIES = ['street', 'street photo', 'sea', 'sky', 'seaside', 'night', 'улица', 'город', 'extra', '#street']
+
+    @override_settings(PHOTO_NORMALIZED_TAGS=True)
+    def setUp(self):
+        for i, tags in enumerate(self.TAGS):
+            make_photo(title=f'photo {i}', tags=tags)
+
+    def matched(self, names, mode, normalized):
+        with override_settings(PHOTO_NORMALIZED_TAGS=normalized):
+            queryset = filter_by_tags(PhotoMetadata.objects.all(), names, mode)
+            return set(queryset.values_list('tags', flat=True))
+
+    def test_csv_and_normalized_paths_agree(self):
+        for name in self.QUERIES:
+            with self.subTest(name=name):
+                expected = {tags for tags in self.TAGS if name.lstrip('#').lower() in parse_tags(tags)}
+                self.assertEqual(self.matched([name], 'any', False), expected)
+                self.assertEqual(self.matched([name], 'any', True), expected)
+        for names in (['street', 'night'], ['sea', 'sky'], ['город', 'улица']):
+            with self.subTest(names=names):
+                self.assertEqual(self.matched(names, 'all', False), self.matched(names, 'all', True))
+                self.assertEqual(self.matched(names, 'any', False), self.matched(names, 'any', True))
+
+    def test_whitespace_is_not_a_separator(self):
+        self.assertNotIn('street photo', self.matched(['street'], 'any', False))
+        self.assertIn('street photo', self.matched(['street photo'], 'any', False))
+
+
+# --------------------
+# Кеш фасетов (facets.py)
+# --------------------
+class FacetCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        use_temp_snapshot_dir(self)
+
+    def test_invalidated_after_commit(self):
+        self.assertEqual(facets.get_facets({})['total'], 0)
+        version = facets._cache_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            make_photo(tags='sea')
+            # до коммита кеш не сбрасывается: параллельный запрос закешировал бы незакоммиченные счётчики
+            self.assertEqual(facets._cache_version(), version)
+        self.assertNotEqual(facets._cache_version(), version)
+        self.assertEqual(facets.get_facets({})['total'], 1)
+
+    def test_stored_counts_match_filtered(self):
+        # все записи с тегом common: ?tags=common считается по таблице, без фильтра — из FacetCount
+        records = [{**r, 'tags': ','.join(filter(None, [r['tags'], 'common']))} for r in generate_photos(200, seed=4)]
+        with mock.patch.object(facets, 'UPSERT_BATCH_SIZE', 7):
+            import_batch(records, IngestReport())
+            ids = list(PhotoMetadata.objects.order_by('id').values_list('id', flat=True))
+            bulk_update_records(ids[:20], {'photographer': 'Someone Else', 'tags': 'common,edited'})
+        PhotoMetadata.objects.get(pk=ids[-1]).delete()
+
+        url = reverse('photometadata:db_facets_ajax')
+        stored = self.client.get(url, {'limit': 200}).json()
+        cache.clear()
+        filtered = self.client.get(url, {'tags': 'common', 'limit': 200}).json()
+        self.assertEqual(stored['total'], 199)
+        self.assertEqual(stored, filtered)
+        self.assertIn({'value': 'Someone Else', 'count': 20}, stored['facets']['photographer'])
+        self.assertEqual(self.client.get(url, {'mode': 'none'}).status_code, 400)
+
+
+# --------------------
+# Кеш записей (record_cache.py)
+# --------------------
+class RecordCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        use_temp_snapshot_dir(self)
+
+    def test_out_of_order_commit_callbacks_leave_no_stale_record(self):
+        photo = make_photo(title='v1')
+        self.assertEqual(get_record(photo.pk)['title'], 'v1')
+        first, second = PhotoMetadata.objects.get(pk=photo.pk), PhotoMetadata.objects.get(pk=photo.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            first.title = 'v2'
+            first.save()
+            second.title = 'v3'
+            second.save()
+        # колбэки двух транзакций выполнились в обратном порядке
+        for callback in reversed(callbacks):
+            callback()
+        self.assertEqual(get_record(photo.pk)['title'], 'v3')
+
+
+# --------------------
+# Изображения: EXIF, хранилище оригиналов, миниатюры (images.py)
+# --------------------
+class ImageTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, True)
+        patcher = mock.patch.multiple(
+            images, IMAGES_DIR=os.path.join(root, 'images'), THUMBS_DIR=os.path.join(root, 'thumbs'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def store(self, name):
+        with open(fixture_image(name), 'rb') as fh:
+            return images.store_image(fh)
+
+    def test_read_image_info(self):
+        self.assertEqual(images.read_image_info(fixture_image('diagram.png')), {'width': 300, 'height': 200})
+        self.assertEqual(images.read_image_info(fixture_image('forest.jpg')), {
+            'width': 512, 'height': 512, 'camera': 'NIKON CORPORATION NIKON D750', 'date_taken': '2020-10-01',
+        })
+        # Make повторяется в начале Model — не дублируется; DateTimeOriginal важнее DateTime; Artist — автор
+        self.assertEqual(images.read_image_info(fixture_image('sea.jpg')), {
+            'width': 640, 'height': 427, 'camera': 'FUJIFILM X100V', 'date_taken': '2021-07-14',
+            'photographer': 'Ann Lee',
+        })
+        # Orientation 6: снимок 600×400 показывается повёрнутым
+        info = images.read_image_info(fixture_image('tower-portrait.jpg'))
+        self.assertEqual((info['width'], info['height'], info['date_taken']), (400, 600, '2019-03-02'))
+
+    def test_read_image_info_keeps_file_position(self):
+        with open(fixture_image('sea.jpg'), 'rb') as fh:
+            fh.seek(10)
+            images.read_image_info(fh)
+            self.assertEqual(fh.tell(), 10)
+
+    def test_not_an_image(self):
+        with self.assertRaises(ValueError):
+            images.read_image_info(io.BytesIO(b'not an image'))
+        with self.assertRaises(ValueError):
+            images.store_image(io.BytesIO(b'not an image'))
+        self.assertEqual(os.listdir(images.IMAGES_DIR), [])
+
+    def test_store_image_is_content_addressed(self):
+        sha = self.store('forest.jpg')
+        self.assertTrue(images.is_image_hash(sha))
+        self.assertEqual(self.store('forest.jpg'), sha)
+        self.assertEqual(os.listdir(os.path.dirname(images.image_path(sha))), [sha])
+        self.assertEqual(images.image_mimetype(sha), 'image/jpeg')
+
+    def test_store_image_size_limit(self):
+        with open(fixture_image('sea.jpg'), 'rb') as fh, self.assertRaises(ValueError):
+            images.store_image(fh, max_bytes=1000)
+        self.assertEqual(os.listdir(images.IMAGES_DIR), [])
+
+    def test_listing_falls_back_to_url_without_local_image(self):
+        make_photo(url='https://example.com/remote.jpg')
+        local = make_photo(title='local', url='https://example.com/2.jpg')
+        images.assign_image(local, self.store('sea.jpg'))
+        local.save()
+        thumb = reverse('photometadata:photo_thumbnail', args=[local.image_sha256, images.THUMB_SIZES[0]])
+        for url in (reverse('photometadata:db_list'), reverse('photometadata:view_source', args=['db'])):
+            with self.subTest(url=url):
+                html = self.client.get(url).content.decode()
+                self.assertIn('<img src="https://example.com/remote.jpg"', html)
+                self.assertIn(f'<img src="{thumb}"', html)
+                self.assertNotIn('<img src="https://example.com/2.jpg"', html)
+
+    def test_ingest_images_reports_duplicate_record(self):
+        out = io.StringIO()
+        call_command('ingest_images', fixture_image('sea.jpg'), no_thumbs=True, stdout=out)
+        photo = PhotoMetadata.objects.get()
+        # запись без image_sha256 не находится по изображению — совпадение ловит уникальный content_hash
+        PhotoMetadata.objects.filter(pk=photo.pk).update(image_sha256='')
+        call_command('ingest_images', fixture_image('sea.jpg'), no_thumbs=True, stdout=out)
+        self.assertIn(f'дубликат — уже есть запись #{photo.pk}', out.getvalue())
+        self.assertIn('Добавлено записей: 0, уже были: 1', out.getvalue())
+        self.assertEqual(PhotoMetadata.objects.count(), 1)
+
+    def test_thumbnails(self):
+        for name, expected in [('diagram.png', (120, 80)), ('sea.jpg', (120, 80)), ('tower-portrait.jpg', (80, 120))]:
+            with self.subTest(name=name):
+                sha = self.store(name)
+                path = images.get_thumbnail(sha, 120)
+                with images.Image.open(path) as im:
+                    self.assertEqual((im.format, im.size), ('WEBP', expected))
+                self.assertEqual(images.get_thumbnail(sha, 120), path)
+        with self.assertRaises(FileNotFoundError):
+            images.get_thumbnail('0' * 64, 120)
+
+    def test_image_hashes(self):
+        photo = images.assign_image(PhotoMetadata(), self.store('forest.jpg'))
+        for field in ('ahash', 'dhash', 'phash'):
+            self.assertRegex(getattr(photo, field), r'^[0-9a-f]{16}$')
+        self.assertIsNotNone(photo.hashed_at)
+        # то же изображение в другом размере — близкий pHash
+        sha = self.store('sea.jpg')
+        with images.Image.open(images.image_path(sha)) as im:
+            smaller = io.BytesIO()
+            im.resize((320, 213)).save(smaller, 'JPEG', quality=90)
+        smaller.seek(0)
+        resized = images.image_hashes(images.store_image(smaller))
+        distance = bin(int(resized['phash'], 16) ^ int(images.image_hashes(sha)['phash'], 16)).count('1')
+        self.assertLessEqual(distance, 6)
+
+    def test_thumbnail_view(self):
+        sha = self.store('forest.jpg')
+        response = self.client.get(reverse('photometadata:photo_thumbnail', args=[sha, 120]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        response.close()
+        self.assertEqual(self.client.get(reverse('photometadata:photo_thumbnail', args=[sha, 121])).status_code, 404)
+        missing = reverse('photometadata:photo_thumbnail', args=['0' * 64, 120])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+
+# --------------------
+# Метрики процессов (metrics.py)
+# --------------------
+class MetricsCollectTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, True)
+        self.metrics_dir = os.path.join(root, 'metrics')
+
+    def test_collect_without_metrics_dir(self):
+        # процесс ещё ничего не сбрасывал (или отключён detach) — каталога нет
+        for lock in (metrics.fcntl, None):
+            with self.subTest(fcntl=lock), mock.patch.object(metrics, 'METRICS_DIR', self.metrics_dir), \
+                    mock.patch.object(metrics, 'fcntl', lock), mock.patch.object(metrics.registry, 'flush'):
+                total = metrics.collect()
+            self.assertEqual(total['processes'], 0)
+            self.assertEqual(total['counters'], {})
+
+    def test_retired_processes_are_kept(self):
+        os.makedirs(self.metrics_dir)
+        snap = {'counters': [['photometadata_http_response_bytes_total', [], 10]], 'histograms': []}
+        # pid, которого нет: его счётчики вливаются в retired.json
+        with open(os.path.join(self.metrics_dir, 'worker-999999999.json'), 'w') as fh:
+            json.dump(snap, fh)
+        with mock.patch.object(metrics, 'METRICS_DIR', self.metrics_dir), mock.patch.object(metrics.registry, 'flush'):
+            for _ in range(2):
+                total = metrics.collect()
+                self.assertEqual(total['counters'], {('photometadata_http_response_bytes_total', ()): 10})
+        self.assertEqual(sorted(os.listdir(self.metrics_dir)), ['.lock', metrics.RETIRED_FILE])
+
+
+@mock.patch.object(metrics, 'collect', return_value={})
+@mock.patch.object(metrics, 'render', return_value='# metrics\n')
+class MetricsAccessTests(TestCase):
+    def setUp(self):
+        self.url = reverse('photometadata:metrics')
+
+    def test_denied_by_default(self, *mocks):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_login(User.objects.create_user('user'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_staff(self, *mocks):
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        self.assertEqual(self.client.get(self.url).content, b'# metrics\n')
+
+    @override_settings(PHOTO_METRICS_TOKEN='secret')
+    def test_token(self, *mocks):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(self.client.get(self.url, headers={'authorization': 'Bearer wrong'}).status_code, 403)
+        self.assertEqual(self.client.get(self.url, headers={'authorization': 'Bearer secret'}).status_code, 200)
+
+    @override_settings(PHOTO_METRICS_ALLOWED_NETWORKS=['10.0.0.0/8', '::1'])
+    def test_allowed_networks(self, *mocks):
+        for address, status in [('10.1.2.3', 200), ('::1', 200), ('192.168.0.1', 403), ('127.0.0.1', 403)]:
+            with self.subTest(address=address):
+                self.assertEqual(self.client.get(self.url, REMOTE_ADDR=address).status_code, status)
+
+
+class MetricsMiddlewareTests(SimpleTestCase):
+    def run_middleware(self, response):
+        handler = middleware.metrics_middleware(lambda request: response)
+        with mock.patch.object(metrics, 'observe_request') as observe:
+            response = handler(RequestFactory().get('/'))
+            self.assertFalse(observe.called)
+            # после отдачи последнего куска сервер закрывает ответ — тогда и учитывается запрос
+            body = b''.join(response.streaming_content)
+            response.close()
+        self.assertEqual(observe.call_count, 1)
+        return body, observe.call_args.args[4]
+
+    def test_file_response_is_not_wrapped(self):
+        # FileResponse остаётся файлом: WSGI-сервер отдаёт его через wsgi.file_wrapper/sendfile
+        path = fixture_image('sea.jpg')
+        response = FileResponse(open(path, 'rb'))
+        with mock.patch.object(middleware, '_wrap_sync') as wrap:
+            body, stats = self.run_middleware(response)
+        wrap.assert_not_called()
+        self.assertIsNotNone(response.file_to_stream)
+        self.assertEqual(stats.response_bytes, os.path.getsize(path))
+        self.assertEqual(len(body), os.path.getsize(path))
+
+    def test_streaming_bytes_counted(self):
+        body, stats = self.run_middleware(StreamingHttpResponse(iter([b'abc', b'defg'])))
+        self.assertEqual((body, stats.response_bytes), (b'abcdefg', 7))
+
+    @override_settings(PHOTO_PROFILE=True)
+    def test_profiles_rotated_and_disabled_on_error(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, True)
+        request = RequestFactory().get('/', headers={'X-Profile': '1'})
+        with mock.patch.multiple(middleware, PROFILE_DIR=root, PROFILE_KEEP=2), \
+                mock.patch.object(metrics, 'observe_request'):
+            handler = middleware.metrics_middleware(lambda request: HttpResponse('ok'))
+            for _ in range(4):
+                self.assertIn('X-Profile-File', handler(request))
+            self.assertEqual(len(os.listdir(root)), 2)
+
+            def failing(request):
+                raise ValueError('boom')
+            with mock.patch.object(middleware.cProfile, 'Profile') as profile:
+                with self.assertRaises(ValueError):
+                    middleware.metrics_middleware(failing)(request)
+            profile.return_value.disable.assert_called_once_with()
+
+
+# --------------------
+# Отпечаток содержимого и уникальный индекс (fingerprint.py)
+# --------------------
+class ContentHashTests(TestCase):
+    def test_normalization(self):
+        record = {'title': 'Sea', 'photographer': 'Ann', 'date_taken': '2024-01-01', 'width': 10, 'height': 10}
+        self.assertEqual(content_hash(record), content_hash({**record, 'title': '  SEA ', 'photographer': 'ann'}))
+        self.assertNotEqual(content_hash(record), content_hash({**record, 'width': 11}))
+        self.assertEqual(content_hash(record), content_hash({**record, 'tags': ''}))
+
+    def test_model_and_dict_agree(self):
+        photo = make_photo(title='Sea', tags='sea, sky')
+        self.assertEqual(photo.content_hash, content_hash(photo))
+        row = PhotoMetadata.objects.values().get(pk=photo.pk)
+        self.assertEqual(content_hash(row), photo.content_hash)
+        self.assertEqual(existing_hashes(PhotoMetadata.objects, [photo.content_hash, 'x' * 64], chunk_size=1),
+                         {photo.content_hash})
+
+    def test_unique_index(self):
+        make_photo(title='Sea')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            make_photo(title=' sea ')
+        # записи без отпечатка ('') индекс не ограничивает
+        PhotoMetadata.objects.bulk_create([PhotoMetadata(title='a', date_taken='2024-01-01', width=1, height=1)
+                                           for _ in range(2)])
+        self.assertEqual(PhotoMetadata.objects.filter(content_hash='').count(), 2)
+
+
+# --------------------
+# Keyset-пагинация (pagination.py)
+# --------------------
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        photos = [make_photo(title=f'photo {i}') for i in range(7)]
+        # одинаковое created_at у части записей: порядок внутри — по id
+        PhotoMetadata.objects.filter(pk__in=[p.pk for p in photos[2:5]]).update(created_at=photos[2].created_at)
+        self.expected = list(PhotoMetadata.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def ids(self, page):
+        return [item['id'] for item in page.items]
+
+    def test_forward_and_back(self):
+        items = PhotoMetadata.objects.values('id', 'created_at')
+        pages, cursor = [], None
+        while True:
+            page = keyset_page(items, cursor, 3)
+            pages.append(page)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual([pk for page in pages for pk in self.ids(page)], self.expected)
+        self.assertEqual([len(page.items) for page in pages], [3, 3, 1])
+        self.assertIsNone(pages[0].prev_cursor)
+        self.assertEqual(self.ids(keyset_page(items, pages[2].prev_cursor, 3)), self.ids(pages[1]))
+        self.assertEqual(self.ids(keyset_page(items, pages[1].prev_cursor, 3)), self.ids(pages[0]))
+
+    def test_model_instances_and_limits(self):
+        page = keyset_page(PhotoMetadata.objects.all(), page_size=0)
+        self.assertEqual([p.pk for p in page.items], self.expected[:1])
+        self.assertEqual(decode_cursor(page.next_cursor)[2], self.expected[0])
+
+    def test_bad_cursor(self):
+        for cursor in ('garbage', 'eHx5fHo'):
+            with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                keyset_page(PhotoMetadata.objects.all(), cursor)
+        self.assertEqual(self.client.get(reverse('photometadata:db_view_ajax'), {'cursor': 'garbage'}).status_code,
+                         400)
+
+
+# --------------------
+# Поиск в PostgreSQL: подстрока через ILIKE по триграммным индексам (search.py)
+# --------------------
+@modify_settings(INSTALLED_APPS={'append': 'django.contrib.postgres'})
+class PostgresSearchEngineTests(TestCase):
+    def test_substring_uses_ilike_on_columns(self):
+        # SQL компилируется и без сервера: индексы gin_trgm_ops (0004) построены по самим столбцам,
+        # UPPER(col::text) LIKE ... ими не обслуживается
+        pg = ConnectionHandler({'default': {'ENGINE': 'django.db.backends.postgresql', 'NAME': 'photos'}})['default']
+        sql, params = PostgresSearchEngine().search('sea_side').query.get_compiler(connection=pg).as_sql()
+        self.assertIn('"photometadata_photometadata"."title" ILIKE %s', sql)
+        self.assertNotIn('UPPER(', sql)
+        self.assertIn('%sea\\_side%', params)
+
+    @skipUnless(connection.vendor == 'postgresql', 'нужен PostgreSQL')
+    def test_search_on_postgres(self):
+        make_photo(title='Seaside', tags='beach')
+        make_photo(title='Mountain', description='100% snow')
+        make_photo(title='Forest', description='100 snow')
+        engine = PostgresSearchEngine()
+        self.assertEqual([p.title for p in engine.search('aside')], ['Seaside'])
+        self.assertEqual([p.title for p in engine.search('0% s')], ['Mountain'])
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = engine.matching('aside').explain()
+        self.assertIn('trgm', plan)
+
+
+# --------------------
+# Кеш поиска: сужение результата более короткого запроса (search_cache.py)
+# --------------------
+@override_settings(PHOTO_SEARCH_ENGINE='photometadata.search.SimpleSearchEngine')
+class SearchCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for i, (title, tags) in enumerate([('Sea view', 'sea'), ('Seaside', ''), ('Forest', 'sea, trees'),
+                                           ('Desert', 'sand'), ('SEAL', 'animals')]):
+            make_photo(title=title, tags=tags, description=f'desc {i}')
+
+    def expected(self, q):
+        return list(SimpleSearchEngine().search(q).values(*RECORD_FIELDS))
+
+    def test_refine_matches_database_search(self):
+        search = async_to_sync(search_cache.search_records)
+        self.assertEqual(search('se'), self.expected('se'))
+        with mock.patch.object(search_cache, '_search', side_effect=AssertionError('запрос к БД')):
+            for q in ('sea', 'SEA ', 'seal', 'seas'):
+                with self.subTest(q=q):
+                    self.assertEqual(search(q), self.expected(q.strip().lower()))
+
+    def test_invalidate(self):
+        search = async_to_sync(search_cache.search_records)
+        self.assertEqual(len(search('sea')), 4)
+        make_photo(title='Sea again')
+        search_cache.invalidate_search()
+        self.assertEqual(len(search('sea')), 5)
+
+
+# --------------------
+# Снимок таблицы: манифест с ETag, куски с Range (snapshot.py, views.db_snapshot_*)
+# --------------------
+class SnapshotTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, True)
+        patcher = mock.patch.multiple(snapshot, SNAPSHOT_DIR=root, CHUNK_ROWS=2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.photos = [make_photo(title=f'photo {i}') for i in range(5)]
+
+    def manifest(self, **headers):
+        return self.client.get(reverse('photometadata:db_snapshot_ajax'), headers=headers)
+
+    def test_first_build_not_in_request(self):
+        response = self.manifest()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(snapshot.RETRY_AFTER_SECONDS))
+        self.assertTrue(snapshot.full_build_pending())
+        call_command('build_snapshot', stdout=io.StringIO())
+        self.assertFalse(snapshot.full_build_pending())
+        self.assertEqual(self.manifest().json()['rows'], 5)
+
+        # FULL_REBUILD оставляется воркеру: запрос отдаёт прежний снимок и не снимает пометки
+        snapshot.mark_changed([None])
+        with mock.patch.object(snapshot, '_build') as build:
+            self.assertEqual(self.manifest().json()['rows'], 5)
+        build.assert_not_called()
+        self.assertEqual(snapshot._read_dirty(), {snapshot.FULL_REBUILD})
+
+    def test_mark_does_not_wait_for_build(self):
+        call_command('build_snapshot', stdout=io.StringIO())
+        with snapshot._locked():
+            # сборка держит блокировку — пометка после коммита проходит без неё
+            marker = threading.Thread(target=snapshot.mark_changed, args=([self.photos[0].pk],))
+            marker.start()
+            marker.join(5)
+            self.assertFalse(marker.is_alive())
+        self.assertEqual(snapshot._read_dirty(), {str(snapshot.chunk_index(self.photos[0].pk))})
+
+    def test_manifest_etag(self):
+        call_command('build_snapshot', stdout=io.StringIO())
+        response = self.manifest()
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['rows'], 5)
+        self.assertEqual(sum(chunk['rows'] for chunk in data['chunks']), 5)
+        self.assertEqual(response['ETag'], f'"{data["version"]}"')
+        self.assertEqual(self.manifest(if_none_match=response['ETag']).status_code, 304)
+
+        # изменение записи меняет версию и etag только её куска
+        photo = self.photos[-1]
+        photo.title = 'changed'
+        photo.save()
+        snapshot.mark_changed([photo.pk])
+        changed = self.manifest(if_none_match=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        before = {c['index']: c['etag'] for c in data['chunks']}
+        after = {c['index']: c['etag'] for c in changed.json()['chunks']}
+        index = snapshot.chunk_index(photo.pk)
+        self.assertNotEqual(before.pop(index), after.pop(index))
+        self.assertEqual(before, after)
+
+    def test_chunk_range(self):
+        call_command('build_snapshot', stdout=io.StringIO())
+        chunk = self.manifest().json()['chunks'][0]
+        response = self.client.get(chunk['url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        body = b''.join(response.streaming_content)
+        self.assertEqual(len(body), chunk['bytes'])
+        lines = gzip.decompress(body).decode().splitlines()
+        self.assertEqual(len(lines), chunk['rows'])
+        self.assertEqual(self.client.get(chunk['url'], headers={'if_none_match': response['ETag']}).status_code, 304)
+
+        response = self.client.get(chunk['url'], headers={'range': 'bytes=0-9'})
+        self.assertEqual((response.status_code, response.content), (206, body[:10]))
+        self.assertEqual(response['Content-Range'], f'bytes 0-9/{len(body)}')
+        response = self.client.get(chunk['url'], headers={'range': 'bytes=-5'})
+        self.assertEqual((response.status_code, response.content), (206, body[-5:]))
+        response = self.client.get(chunk['url'], headers={'range': f'bytes={len(body)}-'})
+        self.assertEqual((response.status_code, response['Content-Range']), (416, f'bytes */{len(body)}'))
+        # If-Range с чужим etag — весь кусок
+        response = self.client.get(chunk['url'], headers={'range': 'bytes=0-9', 'if_range': '"other"'})
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    def test_change_during_first_build(self):
+        photo = self.photos[0]
+        write_chunk, marker = snapshot._write_chunk, []
+
+        def racing_write_chunk(index, rows):
+            # строки куска уже прочитаны, манифеста ещё нет: изменение коммитится в этот момент
+            if not marker:
+                PhotoMetadata.objects.filter(pk=photo.pk).update(title='changed')
+                marker.append(threading.Thread(target=snapshot.mark_changed, args=([photo.pk],)))
+                marker[0].start()
+                marker[0].join(0.2)
+            return write_chunk(index, rows)
+
+        with mock.patch.object(snapshot, '_write_chunk', racing_write_chunk):
+            snapshot.current_manifest()
+        marker[0].join()
+        self.assertEqual(snapshot._read_dirty(), {str(snapshot.chunk_index(photo.pk))})
+        chunk = snapshot.current_manifest()['chunks'][0]
+        with gzip.open(os.path.join(snapshot.SNAPSHOT_DIR, chunk['name'])) as fh:
+            self.assertEqual(json.loads(fh.readline())['title'], 'changed')
+        self.assertEqual(snapshot._read_dirty(), set())
+
+    def test_marks_before_first_build(self):
+        snapshot.mark_changed([self.photos[0].pk])
+        snapshot.mark_changed([self.photos[1].pk, None])
+        # до первой сборки хватает первой пометки
+        self.assertEqual(snapshot._read_dirty(), {str(snapshot.chunk_index(self.photos[0].pk))})
+        self.assertEqual(snapshot.current_manifest()['rows'], 5)
+        self.assertFalse(os.path.exists(os.path.join(snapshot.SNAPSHOT_DIR, snapshot.DIRTY_NAME)))
+
+        # неудачная сборка возвращает пометки
+        snapshot.mark_changed([self.photos[2].pk])
+        with mock.patch.object(snapshot, '_write_chunk', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                snapshot.current_manifest()
+        self.assertEqual(snapshot._read_dirty(), {str(snapshot.chunk_index(self.photos[2].pk))})
+
+    def test_unknown_chunk(self):
+        url = reverse('photometadata:db_snapshot_chunk', args=['chunk-000000-' + '0' * 20 + '.jsonl.gz'])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        manifest = reverse('photometadata:db_snapshot_chunk', args=['manifest.json'])
+        self.assertEqual(self.client.get(manifest).status_code, 404)
+
+
+# --------------------
+# Журнал изменений (changes.py)
+# --------------------
+class ChangesFeedTests(TestCase):
+    def test_feed_and_compaction(self):
+        # сохранение и удаление пишут журнал сигналами (signals.py), массовые операции — log_changes
+        first, second = make_photo(title='a'), make_photo(title='b')
+        first.save()
+        page = read_changes(limit=2)
+        self.assertTrue(page.has_more)
+        self.assertEqual([(c['op'], c['id']) for c in page.changes], [('upsert', first.pk), ('upsert', second.pk)])
+        page = read_changes(page.next_cursor)
+        self.assertEqual([c['id'] for c in page.changes], [first.pk])
+        self.assertEqual(page.changes[0]['record']['title'], 'a')
+        self.assertFalse(page.has_more)
+
+        second_pk = second.pk
+        second.delete()
+        after = read_changes(page.next_cursor)
+        self.assertEqual(after.changes, [{'seq': after.changes[0]['seq'], 'op': 'delete', 'id': second_pk}])
+        self.assertEqual(read_changes(after.next_cursor).changes, [])
+        # в одной пачке из нескольких изменений фото остаётся последнее
+        log_changes([first.pk], ChangeLog.OP_DELETE)
+        log_changes([first.pk], ChangeLog.OP_UPSERT)
+        self.assertEqual([(c['op'], c['id']) for c in read_changes(after.next_cursor).changes],
+                         [('upsert', first.pk)])
+
+        self.assertEqual(compact_changes(), (4, 0))
+        self.assertEqual([(c['op'], c['id']) for c in read_changes().changes],
+                         [('delete', second_pk), ('upsert', first.pk)])
+        self.assertEqual(compact_changes(retention=timedelta(0)), (0, 1))
+
+    def test_long_transaction_is_not_skipped(self):
+        # долгая транзакция получила id записи журнала раньше короткой, а закоммитилась позже:
+        # на PostgreSQL id выдаются до коммита, поэтому порядок id — не порядок коммитов
+        long_photo, short_photo = make_photo(title='long'), make_photo(title='short')
+        cursor = read_changes().next_cursor
+        base = ChangeLog.objects.latest('id').id
+        ChangeLog.objects.create(id=base + 2, photo_id=short_photo.pk, op=ChangeLog.OP_UPSERT)
+        self.assertEqual(assign_sequence(), 1)
+        page = read_changes(cursor)
+        self.assertEqual([c['id'] for c in page.changes], [short_photo.pk])
+
+        # коммит долгой транзакции: её запись нумеруется после уже выданных
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            ChangeLog.objects.create(id=base + 1, photo_id=long_photo.pk, op=ChangeLog.OP_UPSERT)
+            log_changes([long_photo.pk], ChangeLog.OP_DELETE)
+            self.assertIsNone(ChangeLog.objects.get(id=base + 1).seq)
+        self.assertEqual(len(callbacks), 1)
+        entries = ChangeLog.objects.filter(id__gt=base).order_by('seq').values_list('id', flat=True)
+        self.assertEqual(list(entries), [base + 2, base + 1, base + 3])
+        page = read_changes(page.next_cursor)
+        self.assertEqual([(c['op'], c['id']) for c in page.changes], [('delete', long_photo.pk)])
+        self.assertEqual(read_changes(page.next_cursor).changes, [])
+
+    def test_numbering_is_not_reused_after_compaction(self):
+        photo = make_photo()
+        photo_pk = photo.pk
+        photo.delete()
+        cursor = read_changes().next_cursor
+        # единственный tombstone с наибольшим seq не удаляется: от него продолжается нумерация
+        self.assertEqual(compact_changes(retention=timedelta(0)), (1, 0))
+        other = make_photo(title='other')
+        self.assertEqual([(c['op'], c['id']) for c in read_changes().changes],
+                         [('delete', photo_pk), ('upsert', other.pk)])
+        self.assertEqual([c['id'] for c in read_changes(cursor).changes], [other.pk])
+
+    def test_expired_and_bad_cursor(self):
+        url = reverse('photometadata:db_changes_ajax')
+        self.assertEqual(self.client.get(url, {'since': 'garbage'}).status_code, 400)
+        naive = encode_cursor(1, datetime(2024, 1, 1, 12, 0))
+        self.assertEqual(self.client.get(url, {'since': naive}).status_code, 400)
+        with override_settings(PHOTO_CHANGES_RETENTION_DAYS=0):
+            cursor = read_changes().next_cursor
+            response = self.client.get(url, {'since': cursor})
+        self.assertEqual(response.status_code, 410)
+        self.assertTrue(response.json()['resync'])
+
+
+# --------------------
+# Асинхронные представления AJAX через ASGI-клиент: ORM только через a*-методы и sync_to_async
+# --------------------
+class AsyncViewsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.photo = make_photo(title='Seaside', tags='sea')
+        make_photo(title='Mountain', tags='snow')
+
+    def edit_data(self, **fields):
+        data = {field: getattr(self.photo, field) for field in (
+            'title', 'photographer', 'url', 'description', 'location', 'tags', 'width', 'height', 'camera',
+            'license')}
+        data.update(date_taken=str(self.photo.date_taken), version=self.photo.version)
+        data.update(fields)
+        return json.dumps(data)
+
+    async def test_search_get_and_view(self):
+        response = await self.async_client.post(
+            reverse('photometadata:db_search_ajax'), json.dumps({'q': 'seas'}), content_type='application/json')
+        self.assertEqual([r['id'] for r in response.json()['results']], [self.photo.pk])
+
+        response = await self.async_client.get(reverse('photometadata:db_get_ajax', args=[self.photo.pk]))
+        self.assertEqual(response.json()['title'], 'Seaside')
+        response = await self.async_client.get(reverse('photometadata:db_get_ajax', args=[self.photo.pk + 100]))
+        self.assertEqual(response.status_code, 404)
+
+        url = reverse('photometadata:db_view_ajax')
+        page = (await self.async_client.get(url, {'limit': 1})).json()
+        self.assertEqual(len(page['results']), 1)
+        rest = (await self.async_client.get(url, {'cursor': page['next']})).json()
+        self.assertEqual(len(rest['results']), 1)
+        self.assertEqual((await self.async_client.get(url, {'cursor': 'garbage'})).status_code, 400)
+
+    async def test_update_and_delete(self):
+        url = reverse('photometadata:db_update_ajax', args=[self.photo.pk])
+        response = await self.async_client.post(url, self.edit_data(title='Seaside at dusk'),
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['item']['title'], 'Seaside at dusk')
+        current = await PhotoMetadata.objects.aget(pk=self.photo.pk)
+        self.assertEqual((current.title, current.version), ('Seaside at dusk', self.photo.version + 1))
+
+        # прежняя версия — конфликт; ошибка формы — 400
+        response = await self.async_client.post(url, self.edit_data(title='late'), content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        response = await self.async_client.post(url, self.edit_data(width='wide', version=current.version),
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('width', response.json()['errors'])
+
+        response = await self.async_client.post(reverse('photometadata:db_delete_ajax', args=[self.photo.pk]))
+        self.assertEqual(response.json(), {'ok': True})
+        self.assertFalse(await PhotoMetadata.objects.filter(pk=self.photo.pk).aexists())
+
+    async def test_job_status(self):
+        job = await Job.objects.acreate(kind=Job.KIND_IMPORT_DB, source_path='x.json', status=Job.STATUS_DONE)
+        response = await self.async_client.get(reverse('photometadata:db_job_ajax', args=[job.pk]))
+        self.assertEqual((response.json()['status'], response.json()['percent']), (Job.STATUS_DONE, 100))
+
+
+# --------------------
+# Фоновые задачи загрузки: очередь в БД (jobs.py, views.db_job_ajax)
+# --------------------
+class JobQueueTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, True)
+        patcher = mock.patch.multiple(jobs, JOBS_DIR=root)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_job(self, **fields):
+        return Job.objects.create(kind=Job.KIND_IMPORT_DB, source_path=os.path.join(jobs.JOBS_DIR, 'x.json'), **fields)
+
+    def test_conditional_claim_has_one_winner(self):
+        job = self.make_job()
+        real_now, rival = timezone.now, {}
+
+        def now():
+            # второй воркер захватывает задачу между выборкой очереди и условным UPDATE первого
+            if 'job' not in rival:
+                rival['job'] = None
+                rival['job'] = jobs.claim_next('b')
+            return real_now()
+
+        with mock.patch.object(jobs, 'requeue_stale'), mock.patch.object(timezone, 'now', now):
+            self.assertIsNone(jobs.claim_next('a'))
+        self.assertEqual(rival['job'].pk, job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker, job.attempts), (Job.STATUS_RUNNING, 'b', 1))
+        self.assertIsNone(jobs.claim_next('c'))
+
+    def test_stale_job_requeued_then_failed(self):
+        old = timezone.now() - timedelta(seconds=jobs.STALE_AFTER + 1)
+        job = self.make_job(status=Job.STATUS_RUNNING, worker='dead', attempts=1, heartbeat_at=old)
+        fresh = self.make_job(status=Job.STATUS_RUNNING, worker='alive', attempts=1, heartbeat_at=timezone.now())
+        claimed = jobs.claim_next('w')
+        self.assertEqual((claimed.pk, claimed.worker, claimed.attempts), (job.pk, 'w', 2))
+        Job.objects.filter(pk=job.pk).update(attempts=jobs.MAX_ATTEMPTS, heartbeat_at=old)
+        self.assertIsNone(jobs.claim_next('w'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertIsNotNone(job.finished_at)
+        fresh.refresh_from_db()
+        self.assertEqual((fresh.status, fresh.worker), (Job.STATUS_RUNNING, 'alive'))
+
+    def test_job_status_percent(self):
+        for fields, percent in [
+            ({'status': Job.STATUS_QUEUED}, 0),
+            ({'status': Job.STATUS_RUNNING, 'bytes_total': 200, 'bytes_read': 50}, 25),
+            # прочитан весь файл, но задача ещё пишет в БД
+            ({'status': Job.STATUS_RUNNING, 'bytes_total': 200, 'bytes_read': 200}, 99),
+            ({'status': Job.STATUS_DONE, 'bytes_total': 0}, 100),
+        ]:
+            with self.subTest(**fields):
+                self.assertEqual(jobs.job_status(self.make_job(**fields))['percent'], percent)
+
+    def test_run_import_job(self):
+        valid = {
+            'photographer': 'Test', 'date_taken': '2024-01-01', 'url': 'https://example.com/1.jpg',
+            'description': 'test photo', 'location': 'Berlin', 'width': 10, 'height': 10, 'camera': 'X100V',
+            'license': 'CC BY', 'tags': '',
+        }
+        records = [{**valid, 'title': 'one'}, {**valid, 'title': 'two'}, {'title': 'broken', 'width': 'wide'}]
+        upload = SimpleUploadedFile('photos.json', json.dumps(records).encode())
+        job = jobs.enqueue_upload(Job.KIND_IMPORT_DB, upload)
+        job = jobs.run_job(jobs.claim_next('w'))
+        self.assertFalse(os.path.exists(job.source_path))
+        data = self.client.get(reverse('photometadata:db_job_ajax', args=[job.pk])).json()
+        self.assertEqual(
+            {k: data[k] for k in ('status', 'percent', 'total', 'valid', 'invalid', 'added', 'source_name')},
+            {'status': Job.STATUS_DONE, 'percent': 100, 'total': 3, 'valid': 2, 'invalid': 1, 'added': 2,
+             'source_name': 'photos.json'},
+        )
+        self.assertEqual(data['bytes_read'], data['bytes_total'])
+        self.assertEqual(len(data['errors']), 1)
+        self.assertEqual(PhotoMetadata.objects.count(), 2)
+        self.assertEqual(self.client.get(reverse('photometadata:db_job_ajax', args=[job.pk + 1])).status_code, 404)
+
+    def test_requeued_job_left_to_new_worker(self):
+        upload = SimpleUploadedFile('photos.json', b'[]')
+        job = jobs.enqueue_upload(Job.KIND_IMPORT_DB, upload)
+        job = jobs.claim_next('slow')
+
+        def takeover(fh, report, **kwargs):
+            # пока первый воркер работает, задачу вернули в очередь и забрал другой
+            Job.objects.filter(pk=job.pk).update(status=Job.STATUS_QUEUED, worker='')
+            jobs.claim_next('fast')
+
+        with mock.patch.object(jobs, 'import_json_stream', takeover):
+            jobs.run_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker, job.finished_at), (Job.STATUS_RUNNING, 'fast', None))
+        self.assertTrue(os.path.exists(job.source_path))
+
+
+# --------------------
+# Проверка записей: построчно, по столбцам и в пуле процессов (validation.py)
+# --------------------
+class ValidationModesTests(SimpleTestCase):
+    def mixed_records(self):
+        valid = {
+            'title': 'photo', 'photographer': 'Test', 'date_taken': '2024-01-01', 'url': 'https://example.com/1.jpg',
+            'description': 'test photo', 'location': 'Berlin', 'tags': 'sea', 'width': 10, 'height': 10,
+            'camera': 'X100V', 'license': 'CC BY',
+        }
+        broken = [
+            ['not', 'an', 'object'],
+            {k: v for k, v in valid.items() if k not in ('url', 'tags')},
+            {**valid, 'title': '   '},
+            {**valid, 'photographer': 42, 'camera': ''},
+            {**valid, 'tags': ['sea']},
+            {**valid, 'width': '10', 'height': 20.0},   # строки и float с целым значением допустимы
+            {**valid, 'width': 0},
+            {**valid, 'height': 'tall'},
+            {**valid, 'width': True, 'height': 5},
+            {**valid, 'date_taken': '2024-13-01'},
+            {**valid, 'date_taken': 20240101, 'license': None, 'width': -1},
+        ]
+        return [{**valid, 'title': f'photo {i}'} if i % 3 else broken[i // 3 % len(broken)]
+                for i in range(validation.COLUMNAR_MIN_RECORDS + 50)]
+
+    def run_mode(self, validate):
+        return validate(copy.deepcopy(self.mixed_records()))
+
+    def test_modes_agree(self):
+        expected_valid, expected_errors = self.run_mode(lambda data: validation.validate_records(data, start=5))
+        self.assertIn({**expected_valid[0], 'title': 'photo', 'width': 10, 'height': 20}, expected_valid)
+        self.assertIn("Запись 5: ожидается JSON-объект.", expected_errors)
+        self.assertIn("Запись 8: отсутствуют поля tags, url.", expected_errors)
+        self.assertTrue(all(type(r['width']) is int and type(r['height']) is int for r in expected_valid))
+
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            modes = {
+                'columns': lambda data: validation.validate_columns(data, start=5),
+                'auto': lambda data: validation.validate_json_data(data, start=5),
+                # первый кусок проверяется по столбцам, второй (короче порога) — построчно
+                'parallel': lambda data: validation.validate_parallel(
+                    data, executor, start=5, chunk_size=validation.COLUMNAR_MIN_RECORDS + 1),
+            }
+            for name, validate in modes.items():
+                with self.subTest(mode=name):
+                    valid, errors = self.run_mode(validate)
+                    self.assertEqual(errors, expected_errors)
+                    self.assertEqual(valid, expected_valid)
+
+
+# --------------------
+# Почти одинаковые фото: мультииндекс и кластеры (near_duplicates.py, views.db_duplicates_ajax)
+# --------------------
+def flip_bits(value, per_chunk):
+    """value с инвертированными младшими битами кусков: per_chunk[i] бит в i-м куске."""
+    for i, count in enumerate(per_chunk):
+        value ^= ((1 << count) - 1) << (i * near_duplicates.CHUNK_BITS)
+    return value
+
+
+class MultiIndexTests(SimpleTestCase):
+    def test_pigeonhole_radius(self):
+        base = 0x0123456789abcdef
+        for radius, within, beyond in [
+            (8, (2, 2, 2, 2), (3, 2, 2, 2)),
+            (8, (3, 3, 2, 0), (3, 3, 3, 0)),
+            (7, (2, 2, 2, 1), (2, 2, 2, 2)),
+            (11, (3, 3, 3, 2), (3, 3, 3, 3)),
+        ]:
+            with self.subTest(radius=radius, within=within):
+                index = near_duplicates.MultiIndex()
+                index.add(flip_bits(base, within), 'near')
+                index.add(flip_bits(base, beyond), 'far')
+                self.assertEqual(index.search(base, radius), [(radius, 'near')])
+
+    def test_matches_linear_scan(self):
+        rng = random.Random(7)
+        values = [rng.getrandbits(64) for _ in range(300)]
+        # соседи, отличающиеся немногими битами в случайных позициях
+        values += [v ^ sum(1 << b for b in rng.sample(range(64), rng.randint(1, 12))) for v in values[:100]]
+        index = near_duplicates.MultiIndex()
+        for i, value in enumerate(values):
+            index.add(value, i)
+        for radius in (0, 4, 8, 12):
+            for query in values[:100:7]:
+                expected = sorted((near_duplicates.hamming(query, v), i) for i, v in enumerate(values)
+                                  if near_duplicates.hamming(query, v) <= radius)
+                self.assertEqual(sorted(index.search(query, radius)), expected)
+
+
+class NearDuplicatesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.dict(near_duplicates._indexes, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def photo(self, title, value):
+        return make_photo(title=title, phash=f'{value:016x}', hashed_at=timezone.now())
+
+    def test_clusters_merge_transitively(self):
+        base = 0x0f0f0f0f0f0f0f0f
+        a = self.photo('a', base)
+        b = self.photo('b', flip_bits(base, (2, 2, 1, 0)))
+        # c в 10 битах от a, но в 5 от b — попадает в ту же группу через b
+        c = self.photo('c', flip_bits(base, (2, 2, 1, 0)) ^ (0b11111 << 48))
+        self.photo('lonely', ~base & (2 ** 64 - 1))
+        e = self.photo('e', 0x123456789abcdef0)
+        f = self.photo('f', 0x123456789abcdef0 ^ 1)
+        make_photo(title='no image')
+        self.assertEqual(near_duplicates.find_clusters(), [sorted([a.pk, b.pk, c.pk]), sorted([e.pk, f.pk])])
+
+        # пересчитанный хеш и удаление дочитываются в индекс без перестроения
+        PhotoMetadata.objects.filter(pk=c.pk).update(phash=f'{0xffff0000ffff0000:016x}', hashed_at=timezone.now())
+        e.delete()
+        self.assertEqual(near_duplicates.find_clusters(), [sorted([a.pk, b.pk])])
+        self.assertEqual([r['id'] for r in near_duplicates.similar_to(a.phash, exclude=a.pk)], [b.pk])
+
+    def test_removed_hashes_leave_index(self):
+        base = 0x0f0f0f0f0f0f0f0f
+        a, b = self.photo('a', base), self.photo('b', base ^ 1)
+        c = self.photo('c', base ^ 3)
+        self.assertEqual(near_duplicates.find_clusters(), [sorted([a.pk, b.pk, c.pk])])
+        # повторный запрос без изменений — из кеша
+        with mock.patch.object(near_duplicates, '_compute_clusters') as compute:
+            near_duplicates.find_clusters()
+        compute.assert_not_called()
+
+        PhotoMetadata.objects.filter(pk=b.pk).update(phash='')
+        c.delete()
+        self.assertEqual(near_duplicates.find_clusters(), [])
+        self.assertEqual(near_duplicates.similar_to(a.phash, exclude=a.pk), [])
+        self.assertEqual(set(near_duplicates.get_index().hashes), {a.pk})
+
+        with mock.patch.object(near_duplicates, 'STALE_NODES_SLACK', 0):
+            near_duplicates.get_index().refresh()
+        self.assertEqual(near_duplicates.get_index().table.size, 1)
+
+    def test_duplicates_endpoint(self):
+        a = self.photo('a', 0x0f0f0f0f0f0f0f0f)
+        b = self.photo('b', 0x0f0f0f0f0f0f0f0f ^ 0b111)
+        url = reverse('photometadata:db_duplicates_ajax')
+        data = self.client.get(url).json()
+        self.assertEqual({k: data[k] for k in ('hash', 'distance', 'total')}, {'hash': 'phash', 'distance': 8, 'total': 1})
+        self.assertEqual(data['clusters'][0]['size'], 2)
+        self.assertEqual([(r['id'], r['distance']) for r in data['clusters'][0]['records']], [(a.pk, 0), (b.pk, 3)])
+        self.assertEqual(set(data['clusters'][0]['records'][0]), {*near_duplicates.DUPLICATE_FIELDS, 'distance'})
+
+        data = self.client.get(url, {'id': a.pk, 'distance': 2}).json()
+        self.assertEqual((data['id'], data['distance'], data['results']), (a.pk, 2, []))
+        data = self.client.get(url, {'id': a.pk}).json()
+        self.assertEqual([(r['id'], r['distance']) for r in data['results']], [(b.pk, 3)])
+
+        for params in ({'hash': 'md5'}, {'distance': 99}, {'distance': 'x'}, {'limit': 0}, {'id': 'x'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+        self.assertEqual(self.client.get(url, {'id': b.pk + 1}).status_code, 404)
+
+
+# --------------------
+# Потоковая выгрузка (export.py, views.db_export)
+# --------------------
+@mock.patch.object(export, 'EXPORT_BUFFER_SIZE', 500)
+class ExportTests(TestCase):
+    def setUp(self):
+        for i in range(30):
+            make_photo(title=f'photo {i}', description=f'«кавычки» "quotes", запятые\nи перевод строки {i}',
+                       tags='sea, sand' if i % 2 else '')
+        # ожидаемые строки — из БД (в асинхронном тесте синхронный запрос недоступен)
+        rows = list(PhotoMetadata.objects.order_by('id').values_list(*LIST_FIELDS))
+        self.expected = {
+            'json': json.loads(json.dumps([dict(zip(LIST_FIELDS, row)) for row in rows], cls=DjangoJSONEncoder)),
+            'csv': [LIST_FIELDS] + [
+                [value.isoformat() if hasattr(value, 'isoformat') else str(value) for value in row] for row in rows
+            ],
+        }
+
+    def parse(self, fmt, body):
+        text = body.decode('utf-8')
+        if fmt == 'csv':
+            return list(csv.reader(io.StringIO(text)))
+        if fmt == 'json':
+            return json.loads(text)
+        return [json.loads(line) for line in text.splitlines()]
+
+    def check(self, response, fmt, compress, chunks):
+        self.assertGreater(len(chunks), 2)
+        body = b''.join(chunks)
+        if compress:
+            self.assertEqual(response['Content-Type'], 'application/gzip')
+            body = gzip.decompress(body)
+        else:
+            self.assertTrue(response['Content-Type'].startswith(export.EXPORT_FORMATS[fmt][0]))
+        self.assertEqual(response['Content-Disposition'],
+                         f'attachment; filename="{export.export_filename(fmt, compress)}"')
+        self.assertEqual(self.parse(fmt, body), self.expected['csv' if fmt == 'csv' else 'json'])
+
+    def test_stream_formats(self):
+        url = reverse('photometadata:db_export')
+        for fmt in export.EXPORT_FORMATS:
+            for compress in (False, True):
+                with self.subTest(fmt=fmt, gzip=compress):
+                    params = {'format': fmt, 'gzip': '1'} if compress else {'format': fmt}
+                    response = self.client.get(url, params)
+                    self.assertTrue(response.streaming)
+                    self.check(response, fmt, compress, list(response.streaming_content))
+        self.assertEqual(self.client.get(url, {'format': 'xml'}).status_code, 400)
+
+    async def test_stream_formats_asgi(self):
+        url = reverse('photometadata:db_export')
+        for fmt in ('jsonl', 'csv', 'json'):
+            for compress in (False, True):
+                with self.subTest(fmt=fmt, gzip=compress):
+                    params = {'format': fmt, 'gzip': '1'} if compress else {'format': fmt}
+                    response = await self.async_client.get(url, params)
+                    chunks = [chunk async for chunk in response.streaming_content]
+                    self.check(response, fmt, compress, chunks)
+
+    def test_filtered_export(self):
+        body = b''.join(self.client.get(reverse('photometadata:db_export'), {'tags': 'sand'}).streaming_content)
+        self.assertEqual([row['title'] for row in self.parse('jsonl', body)], [f'photo {i}' for i in range(1, 30, 2)])
+
+
+# --------------------
+# Статика: имена с хешем и сжатые копии (static_assets.py, views.static_asset)
+# --------------------
+class StaticAssetTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+        override = override_settings(STATIC_ROOT=self.root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.body = b'function hello() { return "hello"; }\n' * 50
+        for name in ('app.js', 'app.0123abcd.js'):
+            self.write(name, self.body)
+            static_assets.compress_file(os.path.join(self.root, name))
+            # копия brotli (пакет Brotli может быть не установлен): отдаётся только по наличию файла
+            self.write(name + '.br', b'brotli')
+        self.write_manifest({'app.js': 'app.0123abcd.js'})
+
+    def write(self, name, data):
+        with open(os.path.join(self.root, name), 'wb') as out:
+            out.write(data)
+
+    def write_manifest(self, paths):
+        self.write('staticfiles.json', json.dumps({'paths': paths, 'version': '1.1', 'hash': ''}).encode())
+
+    def get(self, name, accept=''):
+        response = self.client.get(settings.STATIC_URL + name, headers={'accept-encoding': accept})
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_accept_encoding(self):
+        for accept, encoding, body in [
+            ('gzip, deflate, br', 'br', b'brotli'),
+            ('br;q=0, gzip', 'gzip', None),
+            ('gzip;q=0.5', 'gzip', None),
+            ('br;q=0, gzip;q=0', None, self.body),
+            ('', None, self.body),
+        ]:
+            with self.subTest(accept=accept):
+                response, served = self.get('app.0123abcd.js', accept)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertIn('Accept-Encoding', response['Vary'])
+                self.assertEqual(gzip.decompress(served) if encoding == 'gzip' else served, body or self.body)
+
+    def test_cache_control(self):
+        response, _ = self.get('app.0123abcd.js')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        # имя без хеша и исходник из STATICFILES_DIRS проверяются по ETag
+        for name in ('app.js', 'js/db_list.js'):
+            with self.subTest(name=name):
+                response, _ = self.get(name)
+                self.assertEqual((response.status_code, response['Cache-Control']), (200, 'no-cache'))
+                repeat = self.client.get(settings.STATIC_URL + name, headers={'if-none-match': response['ETag']})
+                self.assertEqual(repeat.status_code, 304)
+
+    def test_manifest_reloaded_after_collectstatic(self):
+        self.assertEqual(self.get('app.0123abcd.js')[0]['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.write('app.4567ef01.js', self.body)
+        self.write_manifest({'app.js': 'app.4567ef01.js'})
+        stat = os.stat(os.path.join(self.root, 'staticfiles.json'))
+        os.utime(os.path.join(self.root, 'staticfiles.json'), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertEqual(self.get('app.4567ef01.js')[0]['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(self.get('app.0123abcd.js')[0]['Cache-Control'], 'no-cache')
+
+    def test_path_traversal(self):
+        secret = os.path.join(os.path.dirname(self.root), 'secret.txt')
+        self.addCleanup(lambda: os.path.exists(secret) and os.remove(secret))
+        with open(secret, 'w') as out:
+            out.write('secret')
+        for name in ('../secret.txt', os.path.join(self.root, '..', 'secret.txt'), '/etc/passwd',
+                     '../../photoweb_project/settings.py'):
+            with self.subTest(name=name):
+                with self.assertRaises(FileNotFoundError):
+                    static_assets.find_asset(name)
+        self.assertEqual(self.get('..%2Fsecret.txt')[0].status_code, 404)
+        self.assertEqual(self.get('missing.js')[0].status_code, 404)
+
+
+# --------------------
+# Подбор настроек gunicorn (photoweb_project/tuning.py, gunicorn.conf.py)
+# --------------------
+class TuningTests(SimpleTestCase):
+    def test_recommend(self):
+        for cpus, wait, expected in [
+            (4, 0.5, ('gthread', 9, 2)),
+            (2, 0.75, ('gthread', 5, 4)),
+            # воркеров не больше MAX_WORKERS; без ожидания поток один — sync
+            (8, 0.0, ('sync', tuning.MAX_WORKERS, 1)),
+            # доля ожидания ограничена 0..0.95, потоков не больше MAX_THREADS
+            (1, 1.5, ('gthread', 3, tuning.MAX_THREADS)),
+            (1, -1, ('sync', 3, 1)),
+        ]:
+            with self.subTest(cpus=cpus, wait=wait):
+                tuned = tuning.recommend(cpus, wait)
+                self.assertEqual((tuned['worker_class'], tuned['workers'], tuned['threads']), expected)
+                self.assertEqual(tuned['conn_max_age'], tuning.CONN_MAX_AGE)
+        self.assertEqual(tuning.recommend(4)['threads'], round(1 / (1 - tuning.DEFAULT_WAIT_FRACTION)))
+
+        tuned = tuning.recommend(1, 0.9, asgi=True)
+        self.assertEqual((tuned['worker_class'], tuned['workers'], tuned['threads'], tuned['conn_max_age']),
+                         ('uvicorn.workers.UvicornWorker', 2, 1, 0))
+
+    def load_conf(self, **env):
+        environ = {k: v for k, v in os.environ.items() if not k.startswith(('GUNICORN_', 'DB_CONN_'))}
+        with mock.patch.dict(os.environ, environ | env, clear=True), \
+                mock.patch.object(sys, 'path', list(sys.path)), \
+                mock.patch.object(tuning, 'cpu_count', return_value=2):
+            conf = runpy.run_path(os.path.join(settings.BASE_DIR, 'gunicorn.conf.py'))
+            return conf, os.environ['DB_CONN_MAX_AGE']
+
+    def test_gunicorn_conf(self):
+        conf, conn_max_age = self.load_conf(GUNICORN_WAIT_FRACTION='0.75')
+        self.assertEqual((conf['worker_class'], conf['workers'], conf['threads']), ('gthread', 5, 4))
+        self.assertEqual(conn_max_age, str(tuning.CONN_MAX_AGE))
+
+        # явно выбранный sync — без потоков, иначе gunicorn сам заменил бы его на gthread
+        conf, conn_max_age = self.load_conf(GUNICORN_WAIT_FRACTION='0.75', GUNICORN_WORKER_CLASS='sync')
+        self.assertEqual((conf['worker_class'], conf['threads']), ('sync', 1))
+        self.assertEqual(conn_max_age, str(tuning.CONN_MAX_AGE))
+
+        conf, conn_max_age = self.load_conf(GUNICORN_APP='photoweb_project.asgi:application')
+        self.assertEqual((conf['worker_class'], conf['workers'], conf['threads']),
+                         ('uvicorn.workers.UvicornWorker', 2, 1))
+        self.assertEqual(conn_max_age, '0')
+        conf, _ = self.load_conf(GUNICORN_WORKER_CLASS='sync', GUNICORN_THREADS='3')
+        self.assertEqual(conf['threads'], 3)
@@ -14,6 +14,12 @@ urlpatterns = [
     # Отдельная страница для просмотра БД (может совпадать с view_source source='db')
     path('db/', views.db_list_view, name='db_list'),
     path("db/update/<int:pk>/", views.db_update_ajax, name="db_update_ajax"),
+    path('export/', views.db_export, name='db_export'),     # ?format=jsonl|csv|json&gzip=1
+    path('metrics', views.metrics_view, name='metrics'),    # Prometheus
+
+    # Изображения из локального хранилища: оригинал и миниатюра WebP
+    path('images/<str:sha>/', views.photo_image, name='photo_image'),
+    path('thumbs/<str:sha>/<int:size>/', views.photo_thumbnail, name='photo_thumbnail'),
 
 
     # AJAX
@@ -22,6 +28,15 @@ urlpatterns = [
     path('ajax/update/<int:pk>/', views.db_update_ajax, name='db_update_ajax'),
     path('ajax/delete/<int:pk>/', views.db_delete_ajax, name='db_delete_ajax'),
     path("ajax/view/", views.db_view_ajax, name="db_view_ajax"),
+    path('ajax/changes/', views.db_changes_ajax, name='db_changes_ajax'),           # ?since=<курсор>&limit=
+    path('ajax/tags/', views.db_tags_ajax, name='db_tags_ajax'),
+    path('ajax/facets/', views.db_facets_ajax, name='db_facets_ajax'),
+    path('ajax/bulk/update/', views.db_bulk_update_ajax, name='db_bulk_update_ajax'),
+    path('ajax/bulk/delete/', views.db_bulk_delete_ajax, name='db_bulk_delete_ajax'),
+    path('ajax/jobs/<int:pk>/', views.db_job_ajax, name='db_job_ajax'),
+    path('ajax/duplicates/', views.db_duplicates_ajax, name='db_duplicates_ajax'),  # ?id=&hash=&distance=
+    path('ajax/snapshot/', views.db_snapshot_ajax, name='db_snapshot_ajax'),        # манифест снимка (ETag)
+    path('ajax/snapshot/<str:name>', views.db_snapshot_chunk, name='db_snapshot_chunk'),
 
 ]
 
@@ -0,0 +1,193 @@
+from datetime import date
+
+REQUIRED_FIELDS = [
+    "title", "photographer", "date_taken", "description", "location",
+    "tags", "width", "height", "camera", "license", "url"
+]
+# Непустые строковые поля (порядок — порядок сообщений об ошибках)
+STRING_FIELDS = ["title", "photographer", "description", "location", "camera", "license", "url"]
+
+# С этого размера пачка проверяется по столбцам
+COLUMNAR_MIN_RECORDS = 256
+# Размер куска для проверки в пуле процессов
+PARALLEL_CHUNK_SIZE = 20000
+
+
+# --------------------
+# Проверки значений
+# --------------------
+def _is_text(value):
+    return isinstance(value, str) and bool(value.strip())
+
+
+def _positive_size(width, height):
+    """None — размеры корректны, иначе текст ошибки (как в исходной проверке)."""
+    try:
+        w = int(width)
+        h = int(height)
+    except Exception:
+        return "некорректные значения width/height."
+    if w <= 0 or h <= 0:
+        return "width и height должны быть > 0."
+    return None
+
+
+def _is_iso_date(value, cache):
+    text = str(value)
+    ok = cache.get(text)
+    if ok is None:
+        try:
+            date.fromisoformat(text)
+            ok = True
+        except Exception:
+            ok = False
+        cache[text] = ok
+    return ok
+
+
+def _normalize(record):
+    # Приводим width/height к int и date к строке ISO (на всякий случай)
+    record['width'] = int(record['width'])
+    record['height'] = int(record['height'])
+    record['date_taken'] = str(record['date_taken'])
+    return record
+
+
+# --------------------
+# Валидация JSON-записей
+# --------------------
+def validate_records(data_list, start=1):
+    """
+    Построчная проверка: ошибки каждой записи копятся в её собственном списке,
+    поэтому стоимость линейна и не зависит от числа уже найденных ошибок.
+    """
+    valid_data = []
+    errors = []
+    dates = {}
+
+    for i, record in enumerate(data_list, start=start):
+        if not isinstance(record, dict):
+            errors.append(f"Запись {i}: ожидается JSON-объект.")
+            continue
+
+        # Проверка наличия полей
+        missing = [f for f in REQUIRED_FIELDS if f not in record]
+        if missing:
+            errors.append(f"Запись {i}: отсутствуют поля {', '.join(missing)}.")
+            continue
+
+        record_errors = []
+        # Проверка строковых полей
+        for field in STRING_FIELDS:
+            if not _is_text(record[field]):
+                record_errors.append(f"Запись {i}: поле '{field}' пустое или не является строкой.")
+
+        # Теги: допускаем пустую строку, но тип должен быть string
+        if not isinstance(record["tags"], str):
+            record_errors.append(f"Запись {i}: поле 'tags' должно быть строкой (CSV).")
+
+        # Размеры: положительные целые
+        size_error = _positive_size(record["width"], record["height"])
+        if size_error:
+            record_errors.append(f"Запись {i}: {size_error}")
+
+        # Дата: ISO YYYY-MM-DD
+        if not _is_iso_date(record["date_taken"], dates):
+            record_errors.append(f"Запись {i}: поле 'date_taken' должно быть в формате YYYY-MM-DD.")
+
+        if record_errors:
+            errors.extend(record_errors)
+        else:
+            valid_data.append(_normalize(record))
+
+    return valid_data, errors
+
+
+def validate_columns(data_list, start=1):
+    """
+    Проверка по столбцам для больших пачек: каждая проверка проходит один столбец целиком
+    (генераторы списков вместо ветвлений на запись), ошибки собираются по номеру записи.
+    Результат совпадает с validate_records, включая порядок сообщений.
+    """
+    n = len(data_list)
+    record_errors = [None] * n   # None — ошибок нет; иначе список сообщений записи
+    rows = []                    # индексы записей со всеми полями
+
+    def add(idx, message):
+        if record_errors[idx] is None:
+            record_errors[idx] = []
+        record_errors[idx].append(f"Запись {start + idx}: {message}")
+
+    for idx, record in enumerate(data_list):
+        if not isinstance(record, dict):
+            add(idx, "ожидается JSON-объект.")
+        elif not all(f in record for f in REQUIRED_FIELDS):
+            missing = [f for f in REQUIRED_FIELDS if f not in record]
+            add(idx, f"отсутствуют поля {', '.join(missing)}.")
+        else:
+            rows.append(idx)
+
+    records = [data_list[idx] for idx in rows]
+    for field in STRING_FIELDS:
+        column = [r[field] for r in records]
+        for pos in [p for p, value in enumerate(column) if not (isinstance(value, str) and value.strip())]:
+            add(rows[pos], f"поле '{field}' пустое или не является строкой.")
+
+    for pos in [p for p, r in enumerate(records) if not isinstance(r["tags"], str)]:
+        add(rows[pos], "поле 'tags' должно быть строкой (CSV).")
+
+    widths = [r["width"] for r in records]
+    heights = [r["height"] for r in records]
+    # быстрый путь для обычного случая: оба размера — положительные int
+    suspicious = [
+        p for p, (w, h) in enumerate(zip(widths, heights))
+        if not (type(w) is int and type(h) is int and w > 0 and h > 0)
+    ]
+    for pos in suspicious:
+        size_error = _positive_size(widths[pos], heights[pos])
+        if size_error:
+            add(rows[pos], size_error)
+
+    # дат в выборке обычно немного — каждая уникальная строка разбирается один раз
+    dates = {}
+    for pos in [p for p, r in enumerate(records) if not _is_iso_date(r["date_taken"], dates)]:
+        add(rows[pos], "поле 'date_taken' должно быть в формате YYYY-MM-DD.")
+
+    valid_data = []
+    errors = []
+    for idx, record in enumerate(data_list):
+        if record_errors[idx] is None:
+            valid_data.append(_normalize(record))
+        else:
+            errors.extend(record_errors[idx])
+    return valid_data, errors
+
+
+def validate_json_data(data_list, start=1):
+    """
+    Проверяет каждую запись списка data_list на наличие всех полей и корректность типов/значений.
+    Возвращает (valid_data, errors) — valid_data содержит только корректные записи.
+    start — номер первой записи в сообщениях об ошибках (для обработки по частям).
+    Большие пачки проверяются по столбцам (validate_columns), малые — построчно.
+    """
+    if len(data_list) >= COLUMNAR_MIN_RECORDS:
+        return validate_columns(data_list, start)
+    return validate_records(data_list, start)
+
+
+def validate_parallel(data_list, executor, start=1, chunk_size=PARALLEL_CHUNK_SIZE):
+    """
+    Делит data_list на куски по chunk_size и проверяет их в executor (ProcessPoolExecutor).
+    Результат — как у validate_json_data; записи в valid_data — копии из дочерних процессов.
+    """
+    futures = [
+        executor.submit(validate_json_data, data_list[offset:offset + chunk_size], start + offset)
+        for offset in range(0, len(data_list), chunk_size)
+    ]
+    valid_data = []
+    errors = []
+    for future in futures:
+        valid, chunk_errors = future.result()
+        valid_data.extend(valid)
+        errors.extend(chunk_errors)
+    return valid_data, errors
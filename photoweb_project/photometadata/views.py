@@ -1,135 +1,85 @@
+import ipaddress
 import os
+import re
 import json
-import uuid
+import logging
+import mimetypes
 from datetime import date
-from django.shortcuts import render, redirect, get_object_or_404
-from django.conf import settings
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, aget_object_or_404, get_object_or_404
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.conf import settings
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseForbidden, JsonResponse, HttpResponseBadRequest,
+    StreamingHttpResponse,
+)
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.middleware.csrf import get_token
-from django.db import models
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.db import IntegrityError, models
 from .forms import PhotoMetaForm, UploadFileForm, PhotoMetaModelForm
-from .models import PhotoMetadata
+from .models import Job, PhotoMetadata
+from .fingerprint import content_hash
+from .ingest import IngestReport
+from .bulk import (
+    IMPORT_FIELDS, MAX_BULK_RECORDS, bulk_delete_records, bulk_update_records, import_json_stream,
+)
+from .pagination import PAGE_SIZE, akeyset_page, keyset_page
+from .search import filter_queryset
+from .tags import filter_by_tags, parse_tags
+from .facets import FACET_LIMIT, MAX_FACET_LIMIT, get_facets
+from .serializers import LIST_FIELDS, serialize_photo
+from .record_cache import aget_record
+from .search_cache import search_records
+from .snapshot import RETRY_AFTER_SECONDS, SnapshotNotReady, chunk_etag, chunk_path, current_manifest
+from .static_assets import find_asset, pick_encoding
+from .changes import CHANGES_PAGE_SIZE, CursorExpired, read_changes
+from .export import EXPORT_FORMATS, aiter_export, export_filename, iter_export
+from .storage import JSON_DIR, get_file_store
+from .catalogue import FILE_PAGE_SIZE, file_catalogue, read_page
+from .jobs import background_uploads_enabled, enqueue_upload, job_status
+from . import metrics
+from .images import (
+    THUMB_SIZES, assign_image, get_thumbnail, image_mimetype, image_path, is_image_hash, store_image,
+)
+from .near_duplicates import (
+    DEFAULT_DISTANCE, HASH_KINDS, MAX_DISTANCE, find_clusters, serialize_clusters, similar_to,
+)
+
+logger = logging.getLogger(__name__)
 
 # Папка для JSON файлов (media/json)
-JSON_DIR = os.path.join(settings.MEDIA_ROOT, 'json')
 os.makedirs(JSON_DIR, exist_ok=True)
 
 
 # --------------------
-# Валидация JSON + проверка на дубликат (по всем полям)
+# Проверка на дубликат (по всем полям)
 # --------------------
-def validate_json_data(data_list):
+def is_duplicate(existing_data, new_record):
     """
-    Проверяет каждую запись списка data_list на наличие всех полей и корректность типов/значений.
-    Возвращает (valid_data, errors) — valid_data содержит только корректные записи.
+    Проверка на дубль: сравниваем отпечатки содержимого (см. fingerprint.content_hash).
+    existing_data: список dict (из файла), queryset или множество хешей.
+    Для queryset выполняется один индексный запрос по content_hash.
+    new_record: dict или model instance
     """
-    required_fields = [
-        "title", "photographer", "date_taken", "description", "location",
-        "tags", "width", "height", "camera", "license", "url"
-    ]
-    valid_data = []
-    errors = []
-
-    for i, record in enumerate(data_list, start=1):
-        # Проверка наличия полей
-        missing = [f for f in required_fields if f not in record]
-        if missing:
-            errors.append(f"Запись {i}: отсутствуют поля {', '.join(missing)}.")
-            continue
-
-        # Проверка строковых полей
-        for field in ["title", "photographer", "description", "location", "camera", "license", "url"]:
-            if not isinstance(record.get(field), str) or not record.get(field).strip():
-                errors.append(f"Запись {i}: поле '{field}' пустое или не является строкой.")
-
-        # Теги: допускаем пустую строку, но тип должен быть string
-        if not isinstance(record.get("tags"), str):
-            errors.append(f"Запись {i}: поле 'tags' должно быть строкой (CSV).")
-
-        # Размеры: положительные целые
-        try:
-            w = int(record.get("width"))
-            h = int(record.get("height"))
-            if w <= 0 or h <= 0:
-                errors.append(f"Запись {i}: width и height должны быть > 0.")
-        except Exception:
-            errors.append(f"Запись {i}: некорректные значения width/height.")
+    new_hash = content_hash(new_record)
+    if isinstance(existing_data, models.QuerySet):
+        return existing_data.filter(content_hash=new_hash).exists()
+    if isinstance(existing_data, (set, frozenset)):
+        return new_hash in existing_data
+    return any(content_hash(item) == new_hash for item in existing_data)
 
-        # Дата: ISO YYYY-MM-DD
-        try:
-            date.fromisoformat(str(record.get("date_taken")))
-        except Exception:
-            errors.append(f"Запись {i}: поле 'date_taken' должно быть в формате YYYY-MM-DD.")
 
-        # Если для данной записи нет ошибок — добавляем в valid_data
-        if not any(err for err in errors if f"Запись {i}:" in err):
-            # Приводим width/height к int и date к строке ISO (на всякий случай)
-            record['width'] = int(record['width'])
-            record['height'] = int(record['height'])
-            record['date_taken'] = str(record['date_taken'])
-            valid_data.append(record)
-
-    return valid_data, errors
-
-
-def is_duplicate(existing_data, new_record):
-    """
-    Проверка на дубль: сравниваем все значимые поля строго (строки приведём к lower/strip).
-    existing_data: список dict (из файла) или queryset -> приводим к list(dict)
-    new_record: dict
-    """
-    # Приводим существующие записи к унифицированной форме (dict-строки)
-    norm_new = {
-        'title': str(new_record.get('title', '')).strip().lower(),
-        'photographer': str(new_record.get('photographer', '')).strip().lower(),
-        'date_taken': str(new_record.get('date_taken')),
-        'description': str(new_record.get('description', '')).strip().lower(),
-        'location': str(new_record.get('location', '')).strip().lower(),
-        'camera': str(new_record.get('camera', '')).strip().lower(),
-        'license': str(new_record.get('license', '')).strip().lower(),
-        'width': str(new_record.get('width')),
-        'height': str(new_record.get('height')),
-        'url': str(new_record.get('url', '')).strip().lower(),
-        'tags': str(new_record.get('tags', '')).strip().lower(),
-    }
-
-    for item in existing_data:
-        # item может быть model instance (PhotoMetadata) или dict
-        if hasattr(item, 'title'):  # model instance
-            norm_item = {
-                'title': (item.title or '').strip().lower(),
-                'photographer': (item.photographer or '').strip().lower(),
-                'date_taken': str(item.date_taken),
-                'description': (item.description or '').strip().lower(),
-                'location': (item.location or '').strip().lower(),
-                'camera': (item.camera or '').strip().lower(),
-                'license': (item.license or '').strip().lower(),
-                'width': str(item.width),
-                'height': str(item.height),
-                'url': (item.url or '').strip().lower(),
-                'tags': (item.tags or '').strip().lower(),
-            }
-        else:  # dict from json file
-            norm_item = {
-                'title': str(item.get('title', '')).strip().lower(),
-                'photographer': str(item.get('photographer', '')).strip().lower(),
-                'date_taken': str(item.get('date_taken')),
-                'description': str(item.get('description', '')).strip().lower(),
-                'location': str(item.get('location', '')).strip().lower(),
-                'camera': str(item.get('camera', '')).strip().lower(),
-                'license': str(item.get('license', '')).strip().lower(),
-                'width': str(item.get('width')),
-                'height': str(item.get('height')),
-                'url': str(item.get('url', '')).strip().lower(),
-                'tags': str(item.get('tags', '')).strip().lower(),
-            }
-
-        if all(norm_item[k] == norm_new[k] for k in norm_new):
-            return True
-    return False
+def _log_ingest_progress(report):
+    logger.info(
+        "JSON upload: %d records read (%d bytes), %d added, %d duplicates, %d invalid",
+        report.total, report.bytes_read, report.added, report.duplicates, report.invalid,
+    )
 
 
 # --------------------
@@ -148,9 +98,20 @@ def index(request):
         # Обработка ручной формы: кнопки имеют name="save_metadata" и value="file" или "db"
         if 'save_metadata' in request.POST:
             target = request.POST.get('save_metadata')  # 'file' или 'db'
-            form = PhotoMetaForm(request.POST)
+            form = PhotoMetaForm(request.POST, request.FILES)
             if form.is_valid():
                 data = form.cleaned_data
+                # приложенное изображение сохраняется в локальное хранилище (images.py), url по умолчанию — на него
+                image = data.pop('image', None)
+                image_sha = ''
+                if image:
+                    try:
+                        image_sha = store_image(image)
+                    except ValueError as e:
+                        messages.error(request, str(e))
+                        return redirect('photometadata:index')
+                    if not data.get('url'):
+                        data['url'] = request.build_absolute_uri(reverse('photometadata:photo_image', args=[image_sha]))
                 # дата -> iso
                 if isinstance(data.get("date_taken"), date):
                     data['date_taken'] = data['date_taken'].isoformat()
@@ -159,44 +120,37 @@ def index(request):
                     # сохраняем в БД, предварительно проверив на дубликат
                     model_form = PhotoMetaModelForm(data)
                     if model_form.is_valid():
-                        qs = PhotoMetadata.objects.filter(
-                            title__iexact=model_form.cleaned_data['title'].strip(),
-                            photographer__iexact=model_form.cleaned_data['photographer'].strip(),
-                            date_taken=model_form.cleaned_data['date_taken']
-                        )
-                        if is_duplicate(qs, model_form.cleaned_data):
+                        if is_duplicate(PhotoMetadata.objects.all(), model_form.cleaned_data):
                             messages.warning(request, "Такая запись уже есть в базе — дубликат не добавлен.")
                         else:
-                            model_form.save()
+                            obj = model_form.save(commit=False)
+                            if image_sha:
+                                assign_image(obj, image_sha)
+                            try:
+                                obj.save()
+                            except IntegrityError:
+                                # ту же запись одновременно сохранили из другого запроса (уникальный content_hash)
+                                messages.warning(request, "Такая запись уже есть в базе — дубликат не добавлен.")
+                                return redirect('photometadata:index')
                             messages.success(request, "Данные успешно сохранены в базе.")
+                            # точный дубль по полям отсекается выше; то же фото с другим описанием — только предупреждение
+                            similar = similar_to(obj.phash, exclude=obj.pk) if obj.phash else []
+                            if similar:
+                                messages.warning(request, "Похожие фото уже есть в базе: " + ", ".join(
+                                    f"#{r['id']} «{r['title']}»" for r in similar[:5]))
                     else:
                         messages.error(request, "Ошибка в данных формы для БД.")
                 else:
-                    # сохраняем в JSON (в первый найденный файл или создаём новый)
-                    existing_files = [f for f in os.listdir(JSON_DIR) if f.endswith('.json')]
-                    if existing_files:
-                        json_path = os.path.join(JSON_DIR, existing_files[0])
-                        try:
-                            with open(json_path, 'r', encoding='utf-8') as fh:
-                                existing_data = json.load(fh)
-                                if not isinstance(existing_data, list):
-                                    existing_data = [existing_data]
-                        except json.JSONDecodeError:
-                            existing_data = []
-
-                        if is_duplicate(existing_data, data):
-                            messages.warning(request, "Такая запись уже есть в файле — дубликат не добавлен.")
-                        else:
-                            existing_data.append(data)
-                            with open(json_path, 'w', encoding='utf-8') as fh:
-                                json.dump(existing_data, fh, ensure_ascii=False, indent=4)
-                            messages.success(request, f"Данные добавлены в файл {existing_files[0]}")
-                    else:
-                        filename = f"{uuid.uuid4().hex}.json"
-                        json_path = os.path.join(JSON_DIR, filename)
-                        with open(json_path, 'w', encoding='utf-8') as fh:
-                            json.dump([data], fh, ensure_ascii=False, indent=4)
+                    if image_sha:
+                        data['image_sha256'] = image_sha
+                    # сохраняем через файловое хранилище (settings.PHOTO_FILE_STORE), дубли отсекаются там же
+                    filename, added, created = get_file_store().append([data])
+                    if not added:
+                        messages.warning(request, "Такая запись уже есть в файле — дубликат не добавлен.")
+                    elif created:
                         messages.success(request, f"Создан новый файл {filename}")
+                    else:
+                        messages.success(request, f"Данные добавлены в файл {filename}")
 
                 return redirect('photometadata:index')
             else:
@@ -207,48 +161,59 @@ def index(request):
             upload_form = UploadFileForm(request.POST, request.FILES)
             if upload_form.is_valid():
                 file = upload_form.cleaned_data['file']
+
+                if background_uploads_enabled():
+                    # файл сохраняется и обрабатывается воркером (manage.py run_workers), ответ — сразу
+                    kind = Job.KIND_IMPORT_DB if request.POST.get('upload_file') == 'db' else Job.KIND_INGEST_FILE
+                    job = enqueue_upload(kind, file)
+                    if 'application/json' in request.headers.get('Accept', ''):
+                        return JsonResponse({
+                            'job': job.pk,
+                            'status_url': reverse('photometadata:db_job_ajax', args=[job.pk]),
+                        }, status=202)
+                    messages.info(request, f"Файл принят, задача #{job.pk} поставлена в очередь.")
+                    return redirect(f"{reverse('photometadata:index')}?job={job.pk}")
+
+                if request.POST.get('upload_file') == 'db':
+                    # Массовый импорт в БД: пачки bulk_create/COPY, некорректные записи пропускаются
+                    report = IngestReport()
+                    try:
+                        import_json_stream(file, report, progress=_log_ingest_progress)
+                    except json.JSONDecodeError:
+                        messages.error(request, "Ошибка: некорректный JSON-файл.")
+                        return redirect('photometadata:index')
+                    for err in report.error_summary():
+                        messages.error(request, err)
+                    messages.success(
+                        request,
+                        f"Импортировано в БД: {report.added}, дубликатов: {report.duplicates}, "
+                        f"с ошибками: {report.invalid} (пачек: {len(report.batches)})"
+                    )
+                    return redirect('photometadata:index')
+
+                # Все валидные записи дописываются в файловое хранилище.
+                # Файл читается потоково, пачками по ingest.BATCH_SIZE — память не зависит от размера.
+                report = IngestReport()
                 try:
-                    new_data = json.load(file)
-                    if not isinstance(new_data, list):
-                        new_data = [new_data]
+                    filename, created = get_file_store().ingest(file, report, progress=_log_ingest_progress)
                 except json.JSONDecodeError:
                     messages.error(request, "Ошибка: некорректный JSON-файл.")
                     return redirect('photometadata:index')
 
-                # Валидация загруженных записей
-                new_data, validation_errors = validate_json_data(new_data)
-                if validation_errors:
-                    for err in validation_errors:
+                if report.invalid:
+                    messages.error(
+                        request,
+                        f"Файл не загружен: {report.invalid} из {report.total} записей с ошибками."
+                    )
+                    for err in report.error_summary():
                         messages.error(request, err)
-                    return redirect('photometadata:index')
-
-                # Сохраняем все валидные записи в единый JSON-файл (первый найденный) или создаём новый
-                existing_files = [f for f in os.listdir(JSON_DIR) if f.endswith('.json')]
-                if existing_files:
-                    json_path = os.path.join(JSON_DIR, existing_files[0])
-                    try:
-                        with open(json_path, 'r', encoding='utf-8') as fh:
-                            existing_data = json.load(fh)
-                            if not isinstance(existing_data, list):
-                                existing_data = [existing_data]
-                    except json.JSONDecodeError:
-                        existing_data = []
-
-                    added = 0
-                    for record in new_data:
-                        if not is_duplicate(existing_data, record):
-                            existing_data.append(record)
-                            added += 1
-
-                    with open(json_path, 'w', encoding='utf-8') as fh:
-                        json.dump(existing_data, fh, ensure_ascii=False, indent=4)
-                    messages.success(request, f"Добавлено {added} новых записей в {existing_files[0]}")
-                else:
-                    filename = f"{uuid.uuid4().hex}.json"
-                    json_path = os.path.join(JSON_DIR, filename)
-                    with open(json_path, 'w', encoding='utf-8') as fh:
-                        json.dump(new_data, fh, ensure_ascii=False, indent=4)
+                elif not report.added:
+                    # пустой массив или одни дубли: файл не создавался (в пустом хранилище его может и не быть)
+                    messages.info(request, "Новых записей нет — все записи уже есть в хранилище.")
+                elif created:
                     messages.success(request, f"Создан новый файл {filename}")
+                else:
+                    messages.success(request, f"Добавлено {report.added} новых записей в {filename}")
 
                 return redirect('photometadata:index')
 
@@ -257,6 +222,7 @@ def index(request):
         'form': form,
         'upload_form': upload_form,
         'db_form': db_form,
+        'job_id': request.GET.get('job', '') if request.GET.get('job', '').isdigit() else '',
         'csrf_token': get_token(request),
     })
 
@@ -265,13 +231,8 @@ def index(request):
 # Список JSON-файлов
 # --------------------
 def json_list(request):
-    """Return list of filenames (строк) из media/json."""
-    folder = JSON_DIR
-    files = []
-    if os.path.exists(folder):
-        for f in os.listdir(folder):
-            if f.lower().endswith('.json'):
-                files.append(f)
+    """Файлы хранилища с размером и числом записей (из кеша каталога, см. catalogue.py)."""
+    files = file_catalogue(get_file_store())
     return render(request, 'photometadata/json_list.html', {
         'files': files,
         'csrf_token': get_token(request),
@@ -291,14 +252,17 @@ def view_source(request, source, filename=None):
     if source == 'file':
         if not filename:
             return redirect('photometadata:json_list')
-        # открыть конкретный json-файл
-        json_path = os.path.join(JSON_DIR, filename)
-        if not os.path.exists(json_path):
+        # открыть страницу конкретного файла хранилища (по индексу смещений, без разбора всего файла)
+        try:
+            page = max(int(request.GET.get('page') or 1), 1)
+        except ValueError:
+            page = 1
+        total = 0
+        try:
+            data, total = read_page(get_file_store(), filename, page)
+        except FileNotFoundError:
             messages.error(request, "Файл не найден.")
             return redirect('photometadata:json_list')
-        try:
-            with open(json_path, 'r', encoding='utf-8') as fh:
-                data = json.load(fh)
         except Exception:
             data = []
             messages.error(request, "Ошибка чтения JSON.")
@@ -306,15 +270,23 @@ def view_source(request, source, filename=None):
             'source_type': 'file',
             'data': data,
             'filename': filename,
+            'page': page,
+            'total': total,
+            'prev_page': page - 1 if page > 1 else None,
+            'next_page': page + 1 if page * FILE_PAGE_SIZE < total else None,
+            'thumb_size': THUMB_SIZES[0],
             'csrf_token': get_token(request),
         })
 
     elif source == 'db':
-        items = PhotoMetadata.objects.all()
+        page = _db_page(request)
         # Если источник db — используем тот же шаблон, но с source_type='db'
         return render(request, 'photometadata/view_source.html', {
             'source_type': 'db',
-            'data': items,
+            'data': page.items,
+            'next_cursor': page.next_cursor,
+            'prev_cursor': page.prev_cursor,
+            'thumb_size': THUMB_SIZES[0],
             'csrf_token': get_token(request),
         })
 
@@ -325,19 +297,31 @@ def view_source(request, source, filename=None):
 # --------------------
 # Просмотр БД (отдельная страница) — рендерит тот же шаблон, что и view_source source='db'
 # --------------------
+def _db_page(request):
+    """Страница БД по ?cursor= (курсорная пагинация); повреждённый курсор — первая страница."""
+    try:
+        return keyset_page(PhotoMetadata.objects.all(), request.GET.get('cursor'))
+    except ValueError:
+        messages.error(request, "Некорректная ссылка на страницу — показано начало списка.")
+        return keyset_page(PhotoMetadata.objects.all())
+
+
 def db_list_view(request):
-    items = PhotoMetadata.objects.all()
+    page = _db_page(request)
     return render(request, 'photometadata/db_list.html', {
-        'items': items,
+        'items': page.items,
+        'next_cursor': page.next_cursor,
+        'thumb_size': THUMB_SIZES[0],
         'csrf_token': get_token(request),
     })
 
 
 # --------------------
 # AJAX: поиск, получение, обновление, удаление
+# Асинхронные представления: под ASGI (uvicorn) ожидание БД не занимает воркер целиком
 # --------------------
 @require_POST
-def db_search_ajax(request):
+async def db_search_ajax(request):
     try:
         body = json.loads(request.body)
     except Exception:
@@ -347,55 +331,341 @@ def db_search_ajax(request):
     if not q:
         return JsonResponse({'results': []})
 
-    qs = PhotoMetadata.objects.filter(
-        models.Q(title__icontains=q)
-        | models.Q(photographer__icontains=q)
-        | models.Q(description__icontains=q)
-        | models.Q(location__icontains=q)
-        | models.Q(camera__icontains=q)
-        | models.Q(license__icontains=q)
-        | models.Q(tags__icontains=q)
-    ).values(
-        'id', 'title', 'photographer', 'date_taken', 'url',
-        'description', 'location', 'tags', 'width', 'height', 'camera', 'license'
-    )[:200]
-    return JsonResponse({'results': list(qs)})
-
-
-def db_get_ajax(request, pk):
-    obj = get_object_or_404(PhotoMetadata, pk=pk)
+    # ранжированный поиск: FTS + pg_trgm на PostgreSQL, подстрока на SQLite (см. search.py);
+    # результаты кешируются до изменения записей (см. search_cache.py)
+    return JsonResponse({'results': await search_records(q)})
+
+
+def db_tags_ajax(request):
+    """
+    Записи по тегам: ?tags=sea,sky&mode=any|all&cursor=<курсор>.
+    Совпадение тегов точное ('#sea' не находит '#seaside'); выдача постраничная, как в db_view_ajax.
+    """
+    names = parse_tags(request.GET.get('tags', ''))
+    mode = request.GET.get('mode', 'any')
+    if not names or mode not in ('any', 'all'):
+        return HttpResponseBadRequest("Bad tags or mode")
+
+    items = filter_by_tags(PhotoMetadata.objects.all(), names, mode).values(*LIST_FIELDS)
+    try:
+        page = keyset_page(items, request.GET.get('cursor'), request.GET.get('limit') or PAGE_SIZE)
+    except ValueError:
+        return HttpResponseBadRequest("Bad cursor or limit")
+    return JsonResponse({
+        "tags": names,
+        "mode": mode,
+        "results": page.items,
+        "next": page.next_cursor,
+        "prev": page.prev_cursor,
+    })
+
+
+def db_facets_ajax(request):
+    """
+    Счётчики по фотографу, камере, лицензии, году и тегу для текущего фильтра
+    (?q=&tags=&mode= — как в поиске) одним ответом. Без фильтра берутся из FacetCount.
+    """
+    try:
+        limit = max(1, min(int(request.GET.get('limit') or FACET_LIMIT), MAX_FACET_LIMIT))
+    except ValueError:
+        return HttpResponseBadRequest("Bad limit")
+    if request.GET.get('mode', 'any') not in ('any', 'all'):
+        return HttpResponseBadRequest("Bad mode")
+    return JsonResponse(get_facets(request.GET, limit))
+
+
+def db_duplicates_ajax(request):
+    """
+    Почти одинаковые фото по перцептивному хешу (near_duplicates.py): ?hash=phash|dhash|ahash&distance=8.
+    С ?id=<pk> — похожие на эту запись, без него — кластеры по всей таблице (?limit= — сколько кластеров).
+    """
+    kind = request.GET.get('hash', 'phash')
+    try:
+        distance = int(request.GET.get('distance') or DEFAULT_DISTANCE)
+        limit = int(request.GET.get('limit') or 50)
+    except ValueError:
+        return HttpResponseBadRequest("Bad distance or limit")
+    if kind not in HASH_KINDS or not 0 <= distance <= MAX_DISTANCE or limit < 1:
+        return HttpResponseBadRequest("Bad hash, distance or limit")
+
+    if request.GET.get('id'):
+        if not request.GET['id'].isdigit():
+            return HttpResponseBadRequest("Bad id")
+        obj = get_object_or_404(PhotoMetadata, pk=request.GET['id'])
+        value = getattr(obj, kind)
+        return JsonResponse({
+            'id': obj.pk,
+            'hash': kind,
+            'distance': distance,
+            'results': similar_to(value, kind, distance, exclude=obj.pk) if value else [],
+        })
+
+    clusters = find_clusters(kind, distance)
+    return JsonResponse({
+        'hash': kind,
+        'distance': distance,
+        'total': len(clusters),
+        'clusters': serialize_clusters(clusters[:limit], kind),
+    })
+
+
+async def db_job_ajax(request, pk):
+    """Прогресс фоновой задачи загрузки: статус, процент, счётчики и ошибки."""
+    return JsonResponse(job_status(await aget_object_or_404(Job, pk=pk)))
+
+
+async def db_get_ajax(request, pk):
+    # запись отдаётся из кеша (сбрасывается после коммита изменений, см. record_cache.py)
+    return JsonResponse(await aget_record(pk))
+
+async def db_view_ajax(request):
+    """
+    Страница записей БД: ?cursor=<курсор>&limit=<n>.
+    Возвращает results и курсоры next/prev (None — если страницы нет).
+    """
+    items = PhotoMetadata.objects.all().values(*LIST_FIELDS)
+    try:
+        page = await akeyset_page(items, request.GET.get('cursor'), request.GET.get('limit') or PAGE_SIZE)
+    except ValueError:
+        return HttpResponseBadRequest("Bad cursor or limit")
+    return JsonResponse({
+        "results": page.items,
+        "next": page.next_cursor,
+        "prev": page.prev_cursor,
+    })
+
+
+def db_changes_ajax(request):
+    """
+    Журнал изменений для синхронизации внешних потребителей: ?since=<курсор>&limit=<n> (changes.py).
+    Без since — с начала журнала (вся таблица). Возвращает changes (upsert с записью или delete),
+    next — курсор для следующего запроса — и has_more. 410 с resync — курсор устарел, нужна полная синхронизация.
+    """
+    try:
+        page = read_changes(request.GET.get('since'), request.GET.get('limit') or CHANGES_PAGE_SIZE)
+    except CursorExpired:
+        return JsonResponse({
+            'error': 'Курсор старше срока хранения журнала — синхронизируйтесь заново (без since).',
+            'resync': True,
+        }, status=410)
+    except ValueError:
+        return HttpResponseBadRequest("Bad cursor or limit")
     return JsonResponse({
-        'id': obj.id,
-        'title': obj.title,
-        'photographer': obj.photographer,
-        'date_taken': obj.date_taken.isoformat() if obj.date_taken else '',
-        'url': obj.url,
-        'description': obj.description,
-        'location': obj.location,
-        'tags': obj.tags,
-        'width': obj.width,
-        'height': obj.height,
-        'camera': obj.camera,
-        'license': obj.license,
+        "changes": page.changes,
+        "next": page.next_cursor,
+        "has_more": page.has_more,
     })
 
-def db_view_ajax(request):
-    items = PhotoMetadata.objects.all().values()
-    return JsonResponse({"results": list(items)})
+
+# --------------------
+# Экспорт всей таблицы (потоково)
+# --------------------
+def db_export(request):
+    """
+    Выгрузка записей: ?format=jsonl|ndjson|csv|json&gzip=1 и фильтры поиска (?q=&tags=&mode=).
+    Ответ формируется потоково из серверного курсора — память не зависит от числа строк.
+    """
+    fmt = request.GET.get('format', 'jsonl')
+    if fmt not in EXPORT_FORMATS or request.GET.get('mode', 'any') not in ('any', 'all'):
+        return HttpResponseBadRequest("Bad format or mode")
+    compress = request.GET.get('gzip') in ('1', 'true')
+
+    queryset = filter_queryset(request.GET)
+    content_type = 'application/gzip' if compress else f'{EXPORT_FORMATS[fmt][0]}; charset=utf-8'
+    # под ASGI — асинхронный поток: синхронный Django дочитал бы в память целиком
+    stream = aiter_export if isinstance(request, ASGIRequest) else iter_export
+    response = StreamingHttpResponse(stream(queryset, fmt, compress), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(fmt, compress)}"'
+    # прокси (nginx) не должен буферизовать ответ целиком
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# --------------------
+# Изображения: оригиналы и миниатюры из локального хранилища (images.py)
+# Адрес содержит sha256 содержимого, поэтому ответ не меняется и кешируется браузером навсегда
+# --------------------
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def photo_image(request, sha):
+    if not is_image_hash(sha):
+        raise Http404
+    try:
+        response = FileResponse(open(image_path(sha), 'rb'), content_type=image_mimetype(sha))
+    except FileNotFoundError:
+        raise Http404
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def photo_thumbnail(request, sha, size):
+    """Миниатюра WebP: size — один из settings.PHOTO_THUMB_SIZES; создаётся при первом запросе."""
+    if size not in THUMB_SIZES or not is_image_hash(sha):
+        raise Http404
+    try:
+        path = get_thumbnail(sha, size)
+    except OSError:
+        # нет оригинала или он не читается как изображение
+        raise Http404
+    response = FileResponse(open(path, 'rb'), content_type='image/webp')
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+# --------------------
+# Снимок всей таблицы для клиентов, которым нужен весь каталог (snapshot.py):
+# манифест с ETag (без изменений — 304) и неизменяемые куски JSON Lines + gzip с поддержкой Range
+# --------------------
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _ranged_file_response(request, path, content_type, etag):
+    """Файл целиком или один диапазон из заголовка Range (206; 416 — если он за концом файла)."""
+    size = os.path.getsize(path)
+    match = _RANGE_RE.match(request.headers.get('Range', '').strip())
+    if_range = request.headers.get('If-Range')
+    first, last = match.groups() if match else ('', '')
+    # Range с другим If-Range (файл сменился) и непонятный Range игнорируются — отдаётся весь файл
+    if not (first or last) or (if_range and if_range != etag) or (first and last and int(last) < int(first)):
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    else:
+        # bytes=-N — последние N байт
+        start, end = max(size - int(last), 0), size - 1
+    if start >= size or start > end:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        data = fh.read(end - start + 1)
+    response = HttpResponse(data, status=206, content_type=content_type)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def db_snapshot_ajax(request):
+    """
+    Манифест снимка: version, rows, fields и chunks (index, rows, bytes, etag, url). ETag — версия снимка:
+    повторный запрос с If-None-Match без изменений в БД получает 304. Клиент скачивает только куски,
+    etag которых изменился; изменённые с прошлого раза куски пересобираются здесь же.
+    Полный снимок собирают build_snapshot и воркер: пока его нет — 503 с Retry-After.
+    """
+    try:
+        manifest = current_manifest(build_full=False)
+    except SnapshotNotReady:
+        response = JsonResponse({'error': 'Снимок ещё собирается, повторите запрос позже.'}, status=503)
+        response['Retry-After'] = str(RETRY_AFTER_SECONDS)
+        return response
+    etag = f'"{manifest["version"]}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse({
+            'version': manifest['version'],
+            'rows': manifest['rows'],
+            'chunk_rows': manifest['chunk_rows'],
+            'fields': manifest['fields'],
+            'chunks': [
+                {
+                    'index': chunk['index'],
+                    'rows': chunk['rows'],
+                    'bytes': chunk['bytes'],
+                    'etag': chunk['etag'],
+                    'url': reverse('photometadata:db_snapshot_chunk', args=[chunk['name']]),
+                }
+                for chunk in manifest['chunks']
+            ],
+        })
+    response['ETag'] = etag
+    # кешировать можно, но каждый раз сверяясь с сервером
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def db_snapshot_chunk(request, name):
+    """Кусок снимка (gzip, JSON Lines): имя содержит хеш содержимого, поэтому кешируется навсегда."""
+    try:
+        path = chunk_path(name)
+    except FileNotFoundError:
+        # кусок выпал из снимка — клиенту нужен свежий манифест
+        raise Http404
+    etag = f'"{chunk_etag(name)}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = _ranged_file_response(request, path, 'application/gzip', etag)
+    response['ETag'] = etag
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+# --------------------
+# Статика под STATIC_URL: после collectstatic — имена с хешем и готовые сжатые копии (static_assets.py)
+# --------------------
+def static_asset(request, path):
+    """
+    Файл статики: имя с хешем содержимого кешируется на год (immutable), прочие — с проверкой по ETag.
+    Клиенту, который принимает br/gzip, отдаётся сжатая при collectstatic копия (Vary: Accept-Encoding).
+    """
+    try:
+        source, hashed = find_asset(path)
+    except FileNotFoundError:
+        raise Http404
+    served, encoding = pick_encoding(source, request.headers.get('Accept-Encoding', ''))
+    stat = os.stat(served)
+    etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        content_type = mimetypes.guess_type(source)[0] or 'application/octet-stream'
+        response = FileResponse(open(served, 'rb'), content_type=content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Last-Modified'] = http_date(stat.st_mtime)
+    response['ETag'] = etag
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if hashed else 'no-cache'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+DUPLICATE_UPDATE_ERROR = 'Дубликат найден — обновление отменено.'
+
+
+def _version_conflict(current):
+    return JsonResponse({
+        'ok': False,
+        'conflict': True,
+        'error': 'Запись изменили, пока вы её редактировали. Проверьте новые данные и сохраните ещё раз.',
+        'item': serialize_photo(current),
+    }, status=409)
 
 
 @require_POST
-def db_update_ajax(request, pk):
+async def db_update_ajax(request, pk):
     """
     AJAX-обновление записи: принимает JSON с полями, обновляет запись и возвращает обновлённые данные.
+    body['version'] — версия, которую видел редактор (из db_get_ajax): если запись с тех пор изменили,
+    ответ 409 с conflict и текущей записью (item). Без version сравнивается с версией, прочитанной здесь же.
     """
-    obj = get_object_or_404(PhotoMetadata, pk=pk)
+    obj = await aget_object_or_404(PhotoMetadata, pk=pk)
 
     try:
         body = json.loads(request.body)
     except Exception as e:
         return JsonResponse({'ok': False, 'error': f'Некорректный JSON: {e}'}, status=400)
 
+    version = body.get('version', obj.version)
+    try:
+        version = int(version)
+    except (TypeError, ValueError):
+        return JsonResponse({'ok': False, 'error': 'Некорректная версия записи.'}, status=400)
+    if version != obj.version:
+        return _version_conflict(obj)
+
     expected = [
         'title', 'photographer', 'date_taken', 'url', 'description', 'location',
         'tags', 'width', 'height', 'camera', 'license'
@@ -415,42 +685,161 @@ def db_update_ajax(request, pk):
 
     form = PhotoMetaModelForm(data_for_form, instance=obj)
 
-    if not form.is_valid():
+    # проверка модельной формы ходит в БД (validate_unique) — не в цикле событий
+    if not await sync_to_async(form.is_valid)():
         return JsonResponse({'ok': False, 'errors': form.errors}, status=400)
 
     cleaned = form.cleaned_data
-    duplicates_qs = PhotoMetadata.objects.exclude(pk=pk)
-    if is_duplicate(duplicates_qs, cleaned):
-        return JsonResponse({'ok': False, 'error': 'Дубликат найден — обновление отменено.'}, status=409)
+    duplicates_qs = PhotoMetadata.objects.exclude(pk=pk).filter(content_hash=content_hash(cleaned))
+    if await duplicates_qs.aexists():
+        return JsonResponse({'ok': False, 'error': DUPLICATE_UPDATE_ERROR}, status=409)
 
+    updated_obj = await sync_to_async(form.save)(commit=False)
     try:
-        updated_obj = form.save()
+        # CAS по version; одновременный дубль от другого редактора отсекает уникальный индекс content_hash
+        saved = await sync_to_async(updated_obj.save_versioned)(version)
+    except IntegrityError:
+        return JsonResponse({'ok': False, 'error': DUPLICATE_UPDATE_ERROR}, status=409)
     except Exception as e:
         return JsonResponse({'ok': False, 'error': f'Ошибка при сохранении: {e}'}, status=500)
+    if not saved:
+        current = await PhotoMetadata.objects.filter(pk=pk).afirst()
+        if current is None:
+            raise Http404
+        return _version_conflict(current)
 
     # Возвращаем обновлённые данные, чтобы фронтенд обновил строку без перезагрузки
+    return JsonResponse({'ok': True, 'item': serialize_photo(updated_obj)})
+
+
+
+@require_POST
+async def db_delete_ajax(request, pk):
+    obj = await aget_object_or_404(PhotoMetadata, pk=pk)
+    await obj.adelete()
+    return JsonResponse({'ok': True})
+
+
+
+# --------------------
+# AJAX: массовые операции (список id или фильтр поиска, одна транзакция)
+# --------------------
+def _bulk_targets(body):
+    """
+    id записей операции: body['ids'] — список id, или body['filter'] — {q, tags, mode}, как в поиске.
+    Возвращает (ids, ошибка).
+    """
+    if 'ids' in body:
+        ids = body['ids']
+        if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+            return None, "ids должен быть списком целых чисел."
+    elif isinstance(body.get('filter'), dict):
+        params = body['filter']
+        if any(not isinstance(params.get(key) or '', str) for key in ('q', 'tags', 'mode')):
+            return None, "q, tags и mode должны быть строками."
+        if not ((params.get('q') or '').strip() or (params.get('tags') or '').strip()):
+            return None, "Пустой фильтр: укажите q или tags."
+        if (params.get('mode') or 'any') not in ('any', 'all'):
+            return None, "Некорректный mode."
+        ids = list(filter_queryset(params).values_list('id', flat=True)[:MAX_BULK_RECORDS + 1])
+    else:
+        return None, "Нужен список ids или filter."
+    if len(ids) > MAX_BULK_RECORDS:
+        return None, f"Слишком много записей: не больше {MAX_BULK_RECORDS} за раз."
+    return ids, None
+
+
+def _bulk_response(results):
+    counts = {}
+    for status in results.values():
+        counts[status] = counts.get(status, 0) + 1
     return JsonResponse({
         'ok': True,
-        'item': {
-            'id': updated_obj.id,
-            'title': updated_obj.title,
-            'photographer': updated_obj.photographer,
-            'date_taken': updated_obj.date_taken.isoformat() if updated_obj.date_taken else '',
-            'url': updated_obj.url,
-            'description': updated_obj.description,
-            'location': updated_obj.location,
-            'tags': updated_obj.tags,
-            'width': updated_obj.width,
-            'height': updated_obj.height,
-            'camera': updated_obj.camera,
-            'license': updated_obj.license,
-        }
+        'counts': counts,
+        'results': [{'id': pk, 'status': status} for pk, status in results.items()],
     })
 
 
 @require_POST
-def db_delete_ajax(request, pk):
-    obj = get_object_or_404(PhotoMetadata, pk=pk)
-    obj.delete()
-    return JsonResponse({'ok': True})
+def db_bulk_update_ajax(request):
+    """
+    Массовое изменение: {"ids": [...] | "filter": {...}, "changes": {"license": "CC0", ...}}.
+    Значения полей проверяются теми же правилами, что и в форме редактирования.
+    """
+    try:
+        body = json.loads(request.body)
+    except Exception as e:
+        return JsonResponse({'ok': False, 'error': f'Некорректный JSON: {e}'}, status=400)
+    if not isinstance(body, dict):
+        return JsonResponse({'ok': False, 'error': 'Ожидается JSON-объект.'}, status=400)
+
+    changes = body.get('changes')
+    if not isinstance(changes, dict) or not changes:
+        return JsonResponse({'ok': False, 'error': 'Не указаны изменения (changes).'}, status=400)
+    unknown = [f for f in changes if f not in IMPORT_FIELDS]
+    if unknown:
+        return JsonResponse({'ok': False, 'error': f"Неизвестные поля: {', '.join(unknown)}"}, status=400)
+    cleaned, errors = {}, {}
+    for field, value in changes.items():
+        try:
+            cleaned[field] = PhotoMetaModelForm.base_fields[field].clean('' if value is None else value)
+        except ValidationError as e:
+            errors[field] = e.messages
+    if errors:
+        return JsonResponse({'ok': False, 'errors': errors}, status=400)
+
+    ids, error = _bulk_targets(body)
+    if error:
+        return JsonResponse({'ok': False, 'error': error}, status=400)
+    try:
+        results = bulk_update_records(ids, cleaned)
+    except IntegrityError:
+        # одновременная запись с тем же содержимым (уникальный content_hash) — транзакция откатилась целиком
+        return JsonResponse({'ok': False, 'error': 'Записи изменились во время операции, повторите её.'}, status=409)
+    return _bulk_response(results)
+
+
+@require_POST
+def db_bulk_delete_ajax(request):
+    """Массовое удаление: {"ids": [...]} или {"filter": {"q": ..., "tags": ..., "mode": ...}}."""
+    try:
+        body = json.loads(request.body)
+    except Exception as e:
+        return JsonResponse({'ok': False, 'error': f'Некорректный JSON: {e}'}, status=400)
+    if not isinstance(body, dict):
+        return JsonResponse({'ok': False, 'error': 'Ожидается JSON-объект.'}, status=400)
+
+    ids, error = _bulk_targets(body)
+    if error:
+        return JsonResponse({'ok': False, 'error': error}, status=400)
+    return _bulk_response(bulk_delete_records(ids))
 
+
+# --------------------
+# Метрики для Prometheus (сумма по всем процессам gunicorn, см. metrics.py)
+# --------------------
+def _metrics_allowed(request):
+    """
+    /metrics закрыт по умолчанию. Открыт сотрудникам (is_staff), а остальным — только явно:
+    по settings.PHOTO_METRICS_TOKEN (если задан, обязателен) или с адресов из PHOTO_METRICS_ALLOWED_NETWORKS.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_active and user.is_staff:
+        return True
+    token = getattr(settings, 'PHOTO_METRICS_TOKEN', '')
+    if token:
+        return request.headers.get('Authorization') == f'Bearer {token}'
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network, strict=False)
+        for network in getattr(settings, 'PHOTO_METRICS_ALLOWED_NETWORKS', ())
+    )
+
+
+def metrics_view(request):
+    if not _metrics_allowed(request):
+        return HttpResponseForbidden("Forbidden")
+    return HttpResponse(metrics.render(metrics.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
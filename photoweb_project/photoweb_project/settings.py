@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # первым: время запроса включает все остальные middleware (метрики для /metrics)
+    'photometadata.middleware.metrics_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,7 +83,7 @@ WSGI_APPLICATION = 'photoweb_project.wsgi.application'
 DATABASE_URL = env('DATABASE_URL', None)
 if DATABASE_URL:
     import dj_database_url
-    DATABASES = {'default': dj_database_url.parse(DATABASE_URL, conn_max_age=600)}
+    DATABASES = {'default': dj_database_url.parse(DATABASE_URL)}
 else:
     DATABASES = {
         'default': {
@@ -94,6 +96,49 @@ else:
         }
     }
 
+# Постоянные соединения (сек; 0 — закрывать после каждого запроса). По умолчанию — 600 с DATABASE_URL
+# и 0 без него; DB_CONN_MAX_AGE переопределяет. gunicorn.conf.py выставляет значение по типу воркера:
+# sync/gthread — 600 (соединение на поток), uvicorn — 0 (под ASGI соединения не переиспользуются
+# между запросами). Проверка перед повторным использованием — после обрыва соединения
+# (рестарт PostgreSQL, таймаут pgbouncer) запрос не падает, а открывает новое
+DATABASES['default']['CONN_MAX_AGE'] = int(env('DB_CONN_MAX_AGE', 600 if DATABASE_URL else 0))
+DATABASES['default']['CONN_HEALTH_CHECKS'] = env('DB_CONN_HEALTH_CHECKS', '1') == '1'
+
+# SQLite (разработка, бенчмарки): BEGIN IMMEDIATE — транзакция сразу берёт блокировку записи и ждёт её
+# до timeout, вместо мгновенного «database is locked» при повышении блокировки чтения до записи
+# (одновременные правки из нескольких воркеров); WAL — чтение не ждёт запись
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default'].setdefault('OPTIONS', {}).update({
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': 20,
+        'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL',
+    })
+
+# Поиск (photometadata/search.py): триграммные lookup'ы из django.contrib.postgres нужны только на PostgreSQL
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    INSTALLED_APPS.append('django.contrib.postgres')
+
+
+
+# Cache: locmem (по умолчанию, тесты и разработка), file или db — общий для всех воркеров gunicorn.
+# Для db: python manage.py createcachetable
+CACHE_BACKEND = env('CACHE_BACKEND', 'locmem')
+if CACHE_BACKEND == 'file':
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': env('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+    }}
+elif CACHE_BACKEND == 'db':
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': env('CACHE_LOCATION', 'photometadata_cache'),
+    }}
+else:
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'photometadata',
+    }}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -133,6 +178,11 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')   # важно для collectstatic
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
+# collectstatic: имена с хешем содержимого (staticfiles.json) и сжатые копии .br/.gz для static_asset
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'photometadata.static_assets.CompressedManifestStaticFilesStorage'},
+}
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
@@ -140,3 +190,50 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Файловое хранилище записей (media/json)
+# JsonlSegmentStore — сегменты JSON Lines только на дозапись (файлы .json прежнего формата в папке только читаются,
+# перенос — manage.py convert_json_store); JsonArrayStore — прежний единый .json файл
+PHOTO_FILE_STORE = env('PHOTO_FILE_STORE', 'photometadata.storage.JsonlSegmentStore')
+PHOTO_JSONL_SEGMENT_MAX_BYTES = int(env('PHOTO_JSONL_SEGMENT_MAX_BYTES', 64 * 1024 * 1024))
+PHOTO_JSONL_COMPACT_MIN_SEGMENTS = int(env('PHOTO_JSONL_COMPACT_MIN_SEGMENTS', 4))
+
+# Поисковый движок: пусто — выбор по БД (PostgresSearchEngine / SimpleSearchEngine)
+PHOTO_SEARCH_ENGINE = env('PHOTO_SEARCH_ENGINE', None)
+
+# Нормализованные теги (таблицы Tag/PhotoTag вместо поиска по CSV). После включения на существующей БД:
+# python manage.py sync_tags
+PHOTO_NORMALIZED_TAGS = env('PHOTO_NORMALIZED_TAGS', '0') in ['1', 'True', 'true']
+
+# Кеш записей для db_get_ajax (алиас из CACHES и время жизни, сек)
+PHOTO_RECORD_CACHE = env('PHOTO_RECORD_CACHE', 'default')
+PHOTO_RECORD_CACHE_TTL = int(env('PHOTO_RECORD_CACHE_TTL', 3600))
+
+# Кеш результатов поиска db_search_ajax (сбрасывается при любом изменении записей, см. search_cache.py)
+PHOTO_SEARCH_CACHE = env('PHOTO_SEARCH_CACHE', 'default')
+PHOTO_SEARCH_CACHE_TTL = int(env('PHOTO_SEARCH_CACHE_TTL', 300))
+
+# Журнал изменений ajax/changes/: сколько дней хранить удаления (compact_changes)
+PHOTO_CHANGES_RETENTION_DAYS = int(env('PHOTO_CHANGES_RETENTION_DAYS', 30))
+
+# Загрузки JSON обрабатываются в фоне (manage.py run_workers); 0 — прямо в запросе, как раньше
+PHOTO_BACKGROUND_UPLOADS = env('PHOTO_BACKGROUND_UPLOADS', '1') == '1'
+PHOTO_JOB_STALE_SECONDS = int(env('PHOTO_JOB_STALE_SECONDS', 600))
+
+# Изображения: оригиналы в media/images, миниатюры WebP в media/thumbs (см. photometadata/images.py)
+PHOTO_THUMB_SIZES = [int(s) for s in env('PHOTO_THUMB_SIZES', '120,320').split(',')]
+PHOTO_THUMB_CACHE_MAX_BYTES = int(env('PHOTO_THUMB_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+PHOTO_IMAGE_MAX_BYTES = int(env('PHOTO_IMAGE_MAX_BYTES', 50 * 1024 * 1024))
+
+# Метрики запросов (/metrics, формат Prometheus) и профилирование по заголовку X-Profile, см. photometadata/metrics.py
+PHOTO_METRICS = env('PHOTO_METRICS', '1') == '1'
+# /metrics по умолчанию открыт только сотрудникам (is_staff). Доступ для сборщика включается явно:
+# токен (заголовок Authorization: Bearer <токен>) или сети, с которых можно без токена (через запятую: 10.0.0.0/8)
+PHOTO_METRICS_TOKEN = env('PHOTO_METRICS_TOKEN', '')
+PHOTO_METRICS_ALLOWED_NETWORKS = [n.strip() for n in env('PHOTO_METRICS_ALLOWED_NETWORKS', '').split(',') if n.strip()]
+# Общий каталог метрик процессов gunicorn (сумма по воркерам); по умолчанию — во временном каталоге
+if env('PHOTO_METRICS_DIR'):
+    PHOTO_METRICS_DIR = env('PHOTO_METRICS_DIR')
+PHOTO_PROFILE = env('PHOTO_PROFILE', '1' if DEBUG else '0') == '1'
+if env('PHOTO_PROFILE_DIR'):
+    PHOTO_PROFILE_DIR = env('PHOTO_PROFILE_DIR')
@@ -0,0 +1,57 @@
+"""
+Подбор настроек gunicorn по числу CPU и доле времени, которую запрос ждёт (SQL, медленный клиент).
+Без Django: модуль читает gunicorn.conf.py до загрузки приложения и manage.py perf_profile.
+"""
+import os
+
+# Доля ожидания, если нагрузка не измерялась (manage.py perf_profile измеряет её по метрикам)
+DEFAULT_WAIT_FRACTION = 0.5
+# Пределы: больше воркеров — больше памяти и соединений с БД, больше потоков — больше борьбы за GIL
+MAX_WORKERS = 12
+MAX_THREADS = 8
+# Постоянные соединения sync/gthread-воркеров (сек)
+CONN_MAX_AGE = 600
+
+
+def cpu_count():
+    """CPU, доступные процессу (с учётом привязки контейнера к ядрам)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def recommend(cpus=None, wait_fraction=None, asgi=False):
+    """
+    Настройки gunicorn (имена как в gunicorn.conf.py) и CONN_MAX_AGE для cpus ядер.
+    wait_fraction — доля времени запроса без процессора: пока поток ждёт, процессор может работать
+    за другой поток того же воркера, поэтому потоков на воркер ≈ 1 / (1 - wait_fraction).
+    asgi — приложение photoweb_project.asgi: uvicorn-воркеры, по одному циклу событий на ядро.
+    """
+    cpus = max(1, cpus or cpu_count())
+    wait = DEFAULT_WAIT_FRACTION if wait_fraction is None else min(max(wait_fraction, 0.0), 0.95)
+    if asgi:
+        workers, threads = max(2, cpus), 1
+        worker_class = 'uvicorn.workers.UvicornWorker'
+        conn_max_age = 0
+    else:
+        workers = min(2 * cpus + 1, MAX_WORKERS)
+        threads = min(max(1, round(1 / (1 - wait))), MAX_THREADS)
+        worker_class = 'gthread' if threads > 1 else 'sync'
+        conn_max_age = CONN_MAX_AGE
+    return {
+        'worker_class': worker_class,
+        'workers': workers,
+        'threads': threads,
+        # код приложения загружается один раз в мастере: быстрее старт, страницы памяти общие у воркеров
+        'preload_app': True,
+        'timeout': 30,
+        'graceful_timeout': 30,
+        # sync-воркер keep-alive не поддерживает, gthread и uvicorn держат соединение с клиентом
+        'keepalive': 5,
+        # перезапуск воркера после стольких запросов (разброс jitter — чтобы не все сразу): от утечек памяти
+        'max_requests': 1000,
+        'max_requests_jitter': 100,
+        'conn_max_age': conn_max_age,
+        'conn_health_checks': True,
+    }
@@ -14,13 +14,19 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from photometadata.views import static_asset
+
 urlpatterns = [
     path('', include(('photometadata.urls', 'photometadata'), namespace='photometadata')),
+    # статику отдаёт само приложение (отдельного веб-сервера перед gunicorn нет): хеш в имени, br/gzip
+    re_path(r'^%s(?P<path>.+)$' % re.escape(settings.STATIC_URL.lstrip('/')), static_asset, name='static_asset'),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,282 @@
+// Страница «Данные из базы» (db_list.html): адреса API и CSRF-токен — в data-атрибутах #dbList
+const page = document.getElementById('dbList').dataset;
+
+// --- Настройка CSRF ---
+const csrftoken = page.csrf;
+function csrfHeaders() {
+  return {
+    'Content-Type': 'application/json',
+    'X-CSRFToken': csrftoken
+  };
+}
+
+// --- Экранирование: поля записей приходят от пользователей и вставляются в HTML-разметку ---
+const HTML_ESCAPES = {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'};
+function escapeHtml(value) {
+  return String(value ?? '').replace(/[&<>"']/g, ch => HTML_ESCAPES[ch]);
+}
+
+// Ссылка только http(s): javascript:-адрес из поля url выполнился бы по клику
+function safeUrl(value) {
+  try {
+    const url = new URL(value, location.origin);
+    return ['http:', 'https:'].includes(url.protocol) ? url.href : '#';
+  } catch (e) {
+    return '#';
+  }
+}
+
+// --- Миниатюра записи (ссылка на оригинал, если локального изображения нет) ---
+const thumbUrl = page.thumbUrl;
+function previewHtml(r) {
+  // без локального изображения — оригинал по url (как до миниатюр)
+  const src = r.image_sha256 ? thumbUrl.replace('SHA', encodeURIComponent(r.image_sha256)) : safeUrl(r.url);
+  if (src === '#') return 'открыть';
+  return `<img src="${escapeHtml(src)}" loading="lazy" style="width:60px;height:auto;border-radius:6px;">`;
+}
+
+// --- Строка таблицы ---
+function rowHtml(r) {
+  const id = escapeHtml(r.id);
+  return `
+      <td><input type="checkbox" class="form-check-input row-select" value="${id}"></td>
+      <td>${escapeHtml(r.title)}</td>
+      <td>${escapeHtml(r.photographer)}</td>
+      <td>${escapeHtml(r.date_taken)}</td>
+      <td>${escapeHtml(r.location)}</td>
+      <td>${escapeHtml(r.camera)}</td>
+      <td>${escapeHtml(r.width)}×${escapeHtml(r.height)}</td>
+      <td>${escapeHtml(r.license)}</td>
+      <td>${escapeHtml(r.tags)}</td>
+      <td><a href="${escapeHtml(safeUrl(r.url))}" target="_blank" rel="noopener">${previewHtml(r)}</a></td>
+      <td>
+        <button class="btn btn-sm btn-primary edit-btn" data-id="${id}">Редактировать</button>
+        <button class="btn btn-sm btn-danger delete-btn" data-id="${id}">Удалить</button>
+      </td>`;
+}
+
+function appendRows(results) {
+  const tbody = document.getElementById('resultsBody');
+  for (const r of results) {
+    const tr = document.createElement('tr');
+    tr.dataset.id = r.id;
+    tr.innerHTML = rowHtml(r);
+    tbody.appendChild(tr);
+  }
+}
+
+// --- БЕСКОНЕЧНАЯ ПРОКРУТКА (курсорная пагинация db_view_ajax) ---
+const sentinel = document.getElementById('scrollSentinel');
+let nextCursor = sentinel.dataset.next || null;
+let loadingPage = false;
+let searching = false;
+
+async function loadNextPage() {
+  if (loadingPage || searching || !nextCursor) return;
+  loadingPage = true;
+  sentinel.textContent = 'Загрузка…';
+  try {
+    const url = new URL(page.viewUrl, location.origin);
+    url.searchParams.set('cursor', nextCursor);
+    const res = await fetch(url);
+    const data = await res.json();
+    appendRows(data.results);
+    nextCursor = data.next;
+  } finally {
+    loadingPage = false;
+    sentinel.textContent = '';
+  }
+}
+
+new IntersectionObserver(entries => {
+  if (entries.some(e => e.isIntersecting)) loadNextPage();
+}).observe(sentinel);
+
+// --- ЭКСПОРТ: ссылки выгружают то же, что найдено поиском ---
+function updateExportLinks(q) {
+  document.querySelectorAll('.export-link').forEach(a => {
+    const url = new URL(a.href, location.origin);
+    if (q.trim()) url.searchParams.set('q', q.trim()); else url.searchParams.delete('q');
+    a.href = url;
+  });
+}
+
+// --- AJAX ПОИСК ---
+// Запрос уходит, когда ввод замер на SEARCH_DEBOUNCE_MS; ответ на устаревший запрос не нужен —
+// он отменяется (AbortController), чтобы не перезаписать таблицу результатом прежней строки
+const SEARCH_DEBOUNCE_MS = 250;
+let searchTimer = null;
+let searchController = null;
+
+document.getElementById('searchInput').addEventListener('input', function(e){
+  const q = e.target.value;
+  updateExportLinks(q);
+  clearTimeout(searchTimer);
+  searchTimer = setTimeout(() => runSearch(q), SEARCH_DEBOUNCE_MS);
+});
+
+async function runSearch(q) {
+  if (searchController) searchController.abort();
+  const controller = searchController = new AbortController();
+  const tbody = document.getElementById('resultsBody');
+  try {
+    // Пустой запрос — возвращаемся к постраничному списку с первой страницы
+    if (!q.trim()) {
+      const res = await fetch(page.viewUrl, {signal: controller.signal});
+      const data = await res.json();
+      searching = false;
+      tbody.innerHTML = '';
+      appendRows(data.results);
+      nextCursor = data.next;
+      return;
+    }
+
+    searching = true;
+    const res = await fetch(page.searchUrl, {
+      method: 'POST',
+      headers: csrfHeaders(),
+      body: JSON.stringify({q}),
+      signal: controller.signal
+    });
+    const data = await res.json();
+    tbody.innerHTML = '';
+    appendRows(data.results);
+  } catch (err) {
+    if (err.name !== 'AbortError') throw err;
+  }
+}
+
+// --- ОБРАБОТКА КНОПОК "Редактировать" и "Удалить" ---
+document.getElementById('resultsBody').addEventListener('click', async function(e){
+  const btn = e.target.closest('button');
+  if(!btn) return;
+  const id = btn.dataset.id;
+
+  // Редактирование
+  if(btn.classList.contains('edit-btn')) {
+    const r = await fetch(page.getUrl.replace('/0/', `/${id}/`));
+    showEditForm(await r.json());
+  }
+
+  // Удаление
+  else if(btn.classList.contains('delete-btn')) {
+    if(!confirm('Удалить запись?')) return;
+    const res = await fetch(page.deleteUrl.replace('/0/', `/${id}/`), {
+      method: 'POST',
+      headers: csrfHeaders()
+    });
+    const j = await res.json();
+    if(j.ok) btn.closest('tr').remove();
+    else alert('Ошибка удаления');
+  }
+});
+
+// Заполняем форму; version — чтобы сервер отклонил сохранение, если запись успели изменить (409)
+function showEditForm(obj) {
+    const form = document.getElementById('editForm');
+    form.innerHTML = `
+      <input type="hidden" name="id" value="${escapeHtml(obj.id)}">
+      <input type="hidden" name="version" value="${escapeHtml(obj.version)}">
+      <div class="row g-2">
+        <div class="col-md-6 mb-2"><label>Название</label><input name="title" class="form-control" value="${escapeHtml(obj.title)}"></div>
+        <div class="col-md-6 mb-2"><label>Фотограф</label><input name="photographer" class="form-control" value="${escapeHtml(obj.photographer)}"></div>
+        <div class="col-md-6 mb-2"><label>Дата съёмки</label><input type="date" name="date_taken" class="form-control" value="${escapeHtml(obj.date_taken)}"></div>
+        <div class="col-md-6 mb-2"><label>URL изображения</label><input name="url" class="form-control" value="${escapeHtml(obj.url)}"></div>
+        <div class="col-md-12 mb-2"><label>Описание</label><textarea name="description" class="form-control">${escapeHtml(obj.description)}</textarea></div>
+        <div class="col-md-6 mb-2"><label>Локация</label><input name="location" class="form-control" value="${escapeHtml(obj.location)}"></div>
+        <div class="col-md-6 mb-2"><label>Камера</label><input name="camera" class="form-control" value="${escapeHtml(obj.camera)}"></div>
+        <div class="col-md-6 mb-2"><label>Ширина</label><input type="number" name="width" class="form-control" value="${escapeHtml(obj.width)}"></div>
+        <div class="col-md-6 mb-2"><label>Высота</label><input type="number" name="height" class="form-control" value="${escapeHtml(obj.height)}"></div>
+        <div class="col-md-6 mb-2"><label>Лицензия</label><input name="license" class="form-control" value="${escapeHtml(obj.license)}"></div>
+        <div class="col-md-6 mb-2"><label>Теги</label><input name="tags" class="form-control" value="${escapeHtml(obj.tags)}"></div>
+      </div>`;
+    document.getElementById('editModal').style.display = 'block';
+}
+
+// --- СОХРАНЕНИЕ ИЗМЕНЕНИЙ ---
+document.getElementById('saveEditBtn').addEventListener('click', async function() {
+  const form = document.getElementById('editForm');
+  const formData = Object.fromEntries(new FormData(form));
+
+  const id = formData.id;
+  delete formData.id;
+
+  const res = await fetch(page.updateUrl.replace('/0/', `/${id}/`), {
+    method: 'POST',
+    headers: csrfHeaders(),
+    body: JSON.stringify(formData)
+  });
+  const data = await res.json();
+
+  if (data.ok) {
+    alert('Изменения сохранены!');
+    location.reload();
+  } else if (data.conflict) {
+    // запись изменил кто-то другой: показываем её текущую версию, правки нужно внести заново
+    alert(data.error);
+    showEditForm(data.item);
+  } else {
+    alert(data.error || 'Ошибка сохранения');
+  }
+});
+
+// --- МАССОВЫЕ ОПЕРАЦИИ (ajax/bulk/...) ---
+function selectedIds() {
+  return [...document.querySelectorAll('.row-select:checked')].map(cb => parseInt(cb.value));
+}
+
+function updateBulkBar() {
+  const n = selectedIds().length;
+  document.getElementById('selectedCount').textContent = n;
+  document.getElementById('bulkUpdateBtn').disabled = !n;
+  document.getElementById('bulkDeleteBtn').disabled = !n;
+}
+
+document.getElementById('resultsBody').addEventListener('change', e => {
+  if (e.target.classList.contains('row-select')) updateBulkBar();
+});
+
+document.getElementById('selectAll').addEventListener('change', e => {
+  document.querySelectorAll('.row-select').forEach(cb => { cb.checked = e.target.checked; });
+  updateBulkBar();
+});
+
+function bulkSummary(counts) {
+  const names = {updated: 'изменено', deleted: 'удалено', duplicate: 'пропущено (дубликат)', not_found: 'не найдено'};
+  return Object.entries(counts).map(([k, v]) => `${names[k] || k}: ${v}`).join(', ');
+}
+
+document.getElementById('bulkDeleteBtn').addEventListener('click', async () => {
+  const ids = selectedIds();
+  if (!ids.length || !confirm(`Удалить выбранные записи (${ids.length})?`)) return;
+  const res = await fetch(page.bulkDeleteUrl, {
+    method: 'POST', headers: csrfHeaders(), body: JSON.stringify({ids})
+  });
+  const data = await res.json();
+  if (!data.ok) return alert(data.error || 'Ошибка удаления');
+  for (const r of data.results) {
+    if (r.status === 'deleted') document.querySelector(`tr[data-id="${r.id}"]`)?.remove();
+  }
+  document.getElementById('selectAll').checked = false;
+  updateBulkBar();
+  alert(bulkSummary(data.counts));
+});
+
+document.getElementById('bulkUpdateBtn').addEventListener('click', async () => {
+  const ids = selectedIds();
+  const field = document.getElementById('bulkField').value;
+  const value = document.getElementById('bulkValue').value.trim();
+  if (!ids.length) return;
+  const res = await fetch(page.bulkUpdateUrl, {
+    method: 'POST', headers: csrfHeaders(), body: JSON.stringify({ids, changes: {[field]: value}})
+  });
+  const data = await res.json();
+  if (!data.ok) return alert(data.error || JSON.stringify(data.errors) || 'Ошибка сохранения');
+  alert(bulkSummary(data.counts));
+  location.reload();
+});
+
+// --- Закрытие модального окна ---
+document.getElementById('closeModal').addEventListener('click', () => {
+  document.getElementById('editModal').style.display = 'none';
+});
@@ -0,0 +1,26 @@
+// --- Опрос прогресса фоновой загрузки ---
+const jobCard = document.getElementById('jobCard');
+const statusNames = {queued: 'в очереди', running: 'выполняется', done: 'готово', failed: 'ошибка'};
+
+async function pollJob() {
+  const res = await fetch(jobCard.dataset.url);
+  const job = await res.json();
+  document.getElementById('jobStatus').textContent = statusNames[job.status] || job.status;
+  const bar = document.getElementById('jobBar');
+  bar.style.width = `${job.percent}%`;
+  bar.textContent = `${job.percent}%`;
+  bar.classList.toggle('bg-danger', job.status === 'failed');
+  bar.classList.toggle('bg-success', job.status === 'done');
+  document.getElementById('jobCounts').textContent =
+    `Прочитано: ${job.total}, добавлено: ${job.added}, дубликатов: ${job.duplicates}, с ошибками: ${job.invalid}`;
+  document.getElementById('jobMessage').textContent = job.message;
+  const errors = document.getElementById('jobErrors');
+  errors.innerHTML = '';
+  for (const err of job.errors) {
+    const li = document.createElement('li');
+    li.textContent = err;
+    errors.appendChild(li);
+  }
+  if (job.status === 'queued' || job.status === 'running') setTimeout(pollJob, 1000);
+}
+pollJob();
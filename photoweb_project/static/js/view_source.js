@@ -0,0 +1,225 @@
+// Просмотр БД (view_source.html, source=db): адреса API и CSRF-токен — в data-атрибутах #dbView
+const page = document.getElementById('dbView').dataset;
+const csrftoken = page.csrf;
+
+// ======= ЭКРАНИРОВАНИЕ: поля записей приходят от пользователей и вставляются в HTML-разметку =======
+const HTML_ESCAPES = {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'};
+function escapeHtml(value) {
+    return String(value ?? '').replace(/[&<>"']/g, ch => HTML_ESCAPES[ch]);
+}
+
+// Ссылка только http(s): javascript:-адрес из поля url выполнился бы по клику
+function safeUrl(value) {
+    try {
+        const url = new URL(value, location.origin);
+        return ['http:', 'https:'].includes(url.protocol) ? url.href : '#';
+    } catch (e) {
+        return '#';
+    }
+}
+
+// ======= МИНИАТЮРЫ (локальный кеш, см. images.py) =======
+const thumbUrl = page.thumbUrl;
+function previewHtml(item) {
+    // без локального изображения — оригинал по url (как до миниатюр)
+    const src = item.image_sha256 ? thumbUrl.replace('SHA', encodeURIComponent(item.image_sha256)) : safeUrl(item.url);
+    if (src === '#') return 'открыть';
+    return `<img src="${escapeHtml(src)}" loading="lazy" style="max-width:100px;border-radius:6px;">`;
+}
+
+// ======= СТРОКА ТАБЛИЦЫ =======
+function rowHtml(item) {
+    const id = escapeHtml(item.id);
+    return `
+        <tr data-id="${id}">
+            <td>${escapeHtml(item.title)}</td>
+            <td>${escapeHtml(item.photographer)}</td>
+            <td>${escapeHtml(item.date_taken)}</td>
+            <td>${escapeHtml(item.description)}</td>
+            <td>${escapeHtml(item.location)}</td>
+            <td>${escapeHtml(item.camera)}</td>
+            <td>${escapeHtml(item.license)}</td>
+            <td>${escapeHtml(item.width)}</td>
+            <td>${escapeHtml(item.height)}</td>
+            <td>${escapeHtml(item.tags)}</td>
+            <td><a href="${escapeHtml(safeUrl(item.url))}" target="_blank" rel="noopener">${previewHtml(item)}</a></td>
+            <td>
+                <button class="btn btn-sm btn-warning edit-btn" data-id="${id}">Ред.</button>
+                <button class="btn btn-sm btn-danger delete-btn" data-id="${id}">Удал.</button>
+            </td>
+        </tr>`;
+}
+
+// ======= ПОИСК =======
+// Запрос уходит, когда ввод замер на SEARCH_DEBOUNCE_MS; предыдущий незавершённый запрос отменяется
+const SEARCH_DEBOUNCE_MS = 250;
+let searchTimer = null;
+let searchController = null;
+
+document.getElementById('search-input').addEventListener('input', function() {
+    const q = this.value.trim();
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(() => runSearch(q), SEARCH_DEBOUNCE_MS);
+});
+
+function ignoreAbort(err) {
+    if (err.name !== 'AbortError') throw err;
+}
+
+function runSearch(q) {
+    if (searchController) searchController.abort();
+    const controller = searchController = new AbortController();
+    const url = page.searchUrl;
+    const body = document.getElementById('data-body');
+
+    const pager = document.getElementById('pager');
+    if (pager) pager.hidden = q !== "";
+
+    // 🔹 Если поле пустое — подгружаем первую страницу записей
+    if (q === "") {
+        fetch(page.viewUrl, {signal: controller.signal}) // создаем отдельный endpoint для "все данные"
+        .then(r => r.json())
+        .then(data => {
+            body.innerHTML = "";
+            for (const item of data.results) {
+                body.insertAdjacentHTML('beforeend', rowHtml(item));
+            }
+        })
+        .catch(ignoreAbort);
+        return;
+    }
+
+    // 🔹 Иначе — обычный поиск
+    fetch(url, {
+        method: "POST",
+        headers: {"Content-Type": "application/json", "X-CSRFToken": csrftoken},
+        body: JSON.stringify({ q }),
+        signal: controller.signal
+    })
+    .then(r => r.json())
+    .then(data => {
+        body.innerHTML = "";
+        for (const item of data.results) {
+            body.insertAdjacentHTML('beforeend', rowHtml(item));
+        }
+    })
+    .catch(ignoreAbort);
+}
+
+// ======= AJAX УДАЛЕНИЕ =======
+document.addEventListener('click', function(e) {
+  if (e.target.classList.contains('delete-btn')) {
+    const id = e.target.dataset.id;
+    if (confirm('Удалить запись?')) {
+      fetch(page.deleteUrl.replace('/0/', `/${id}/`), {
+        method: "POST",
+        headers: {"X-CSRFToken": csrftoken}
+      })
+      .then(r => r.json())
+      .then(data => {
+        if (data.ok) e.target.closest('tr').remove();
+        else alert('Ошибка при удалении');
+      });
+    }
+  }
+});
+
+// ======= AJAX РЕДАКТИРОВАНИЕ =======
+// Заполняем поля модального окна; version уходит с сохранением (409, если запись успели изменить)
+function fillEditForm(item) {
+      document.getElementById('edit-id').value = item.id;
+      document.getElementById('edit-version').value = item.version;
+      document.getElementById('edit-title').value = item.title || '';
+      document.getElementById('edit-photographer').value = item.photographer || '';
+      document.getElementById('edit-date').value = item.date_taken || '';
+      document.getElementById('edit-description').value = item.description || '';
+      document.getElementById('edit-location').value = item.location || '';
+      document.getElementById('edit-camera').value = item.camera || '';
+      document.getElementById('edit-license').value = item.license || '';
+      document.getElementById('edit-url').value = item.url || '';
+      document.getElementById('edit-tags').value = item.tags || '';
+      document.getElementById('edit-width').value = item.width || 1;
+      document.getElementById('edit-height').value = item.height || 1;
+}
+
+document.addEventListener('click', function(e) {
+  if (e.target.classList.contains('edit-btn')) {
+    const id = e.target.dataset.id;
+    fetch(page.getUrl.replace('/0/', `/${id}/`))
+    .then(r => r.json())
+    .then(item => {
+      fillEditForm(item);
+
+      const modal = new bootstrap.Modal(document.getElementById('editModal'));
+      const saveBtn = document.getElementById('saveEditBtn');
+      saveBtn.dataset.id = item.id; // Привязали ID к кнопке
+      modal.show();
+    });
+  }
+});
+
+// ======= AJAX СОХРАНЕНИЕ =======
+document.getElementById('saveEditBtn').addEventListener('click', function() {
+  const id = this.dataset.id;
+
+  const data = {
+    title: document.getElementById("edit-title").value.trim(),
+    photographer: document.getElementById("edit-photographer").value.trim(),
+    date_taken: document.getElementById("edit-date").value.trim(),
+    description: document.getElementById("edit-description").value.trim(),
+    location: document.getElementById("edit-location").value.trim(),
+    camera: document.getElementById("edit-camera").value.trim(),
+    license: document.getElementById("edit-license").value.trim(),
+    tags: document.getElementById("edit-tags").value.trim(),
+    url: document.getElementById("edit-url").value.trim(),
+    width: parseInt(document.getElementById("edit-width").value) || 1,
+    height: parseInt(document.getElementById("edit-height").value) || 1,
+    version: parseInt(document.getElementById("edit-version").value)
+  };
+
+  fetch(page.updateUrl.replace('/0/', `/${id}/`), {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      "X-CSRFToken": csrftoken,
+    },
+    body: JSON.stringify(data),
+  })
+  .then(r => r.json())
+  .then(res => {
+    if (res.ok) {
+      document.getElementById('edit-version').value = res.item.version;
+      // обновляем строку таблицы
+      const row = document.querySelector(`tr[data-id="${id}"]`);
+      if (row) {
+        row.children[0].textContent = res.item.title;
+        row.children[1].textContent = res.item.photographer;
+        row.children[2].textContent = res.item.date_taken;
+        row.children[3].textContent = res.item.description;
+        row.children[4].textContent = res.item.location;
+        row.children[5].textContent = res.item.camera;
+        row.children[6].textContent = res.item.license;
+        row.children[7].textContent = res.item.width;
+        row.children[8].textContent = res.item.height;
+        row.children[9].textContent = res.item.tags;
+        const link = row.querySelector("a");
+        if (link) {
+          link.href = safeUrl(res.item.url);
+          link.innerHTML = previewHtml(res.item);
+        }
+      }
+      bootstrap.Modal.getInstance(document.getElementById('editModal')).hide();
+      alert("Изменения сохранены!");
+    } else if (res.conflict) {
+      // запись изменил кто-то другой: показываем текущую версию, правки нужно внести заново
+      alert(res.error);
+      fillEditForm(res.item);
+    } else {
+      alert("Ошибка при сохранении: " + (res.error || "неизвестная ошибка"));
+    }
+  })
+  .catch(err => {
+    console.error(err);
+    alert("Ошибка соединения при сохранении.");
+  });
+});